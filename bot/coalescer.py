@@ -0,0 +1,111 @@
+"""Per-chat coalescing of rapid-fire text messages.
+
+Users often split one rant across several Telegram messages sent seconds
+apart. Without coalescing each message runs the full pipeline (routing,
+extraction, generation, style rewrite) and gets its own fragmented reply.
+
+Behaviour (one burst per ``(chat_id, user_id)`` key):
+- A message starts a burst and a ``window_seconds`` timer. Every follow-up
+  within the window joins the burst and restarts the timer, up to
+  ``max_wait_seconds`` after the first message or ``max_messages`` messages.
+- When the timer fires the joined texts (newline-separated) are handed to the
+  handler of the latest message, together with the burst's `cancelled` event;
+  the handler runs the pipeline and replies to it.
+- A follow-up arriving while that handler is still running supersedes it: the
+  burst's `cancelled` event is set, the running task is cancelled so its reply
+  is never sent, and a new burst with all texts so far starts its window. The
+  pipeline runs in a worker thread that task cancellation cannot stop; it
+  checks the event at every stage boundary (`Deadline`), so it stops before
+  its next LLM call and never saves the superseded message. A call already in
+  flight when the event is set still completes.
+
+The handler runs as a task, so the Telegram update handler returns at once and
+the next update of the same chat can be received while the window is open.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+# handler(merged_text, cancelled): `cancelled` is set once the run is superseded.
+Handler = Callable[[str, threading.Event], Awaitable[None]]
+
+
+@dataclass
+class _Burst:
+    texts: list[str]
+    handler: Handler
+    started_at: float
+    running: bool = False
+    task: asyncio.Task | None = field(default=None, repr=False)
+    cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+class MessageCoalescer:
+    def __init__(
+        self,
+        window_seconds: float,
+        max_wait_seconds: float | None = None,
+        max_messages: int = 10,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds if max_wait_seconds is not None else 4 * window_seconds
+        self.max_messages = max_messages
+        self._clock = clock
+        self._bursts: dict[Hashable, _Burst] = {}
+        self.stats = {"messages": 0, "runs": 0, "coalesced": 0, "superseded": 0}
+
+    def submit(self, key: Hashable, text: str, handler: Handler) -> None:
+        """Add `text` to the burst for `key`; `handler` replaces the burst's handler."""
+        now = self._clock()
+        self.stats["messages"] += 1
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = _Burst([text], handler, now)
+            self._bursts[key] = burst
+        elif burst.running:
+            self.stats["superseded"] += 1
+            logger.info(f"Coalescer: follow-up supersedes in-progress reply key={key}")
+            burst.cancelled.set()
+            burst.task.cancel()
+            burst = _Burst(burst.texts + [text], handler, now)
+            self._bursts[key] = burst
+        else:
+            burst.task.cancel()
+            burst.texts.append(text)
+            burst.handler = handler
+        if len(burst.texts) > 1:
+            self.stats["coalesced"] += 1
+        if len(burst.texts) >= self.max_messages:
+            delay = 0.0
+        else:
+            delay = min(self.window_seconds, max(0.0, burst.started_at + self.max_wait_seconds - now))
+        burst.task = asyncio.create_task(self._run(key, burst, delay))
+
+    async def _run(self, key: Hashable, burst: _Burst, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+            burst.running = True
+            self.stats["runs"] += 1
+            await burst.handler("\n".join(burst.texts), burst.cancelled)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.error(f"Coalesced message handler failed key={key}", exc_info=True)
+        finally:
+            if self._bursts.get(key) is burst and burst.task is asyncio.current_task():
+                del self._bursts[key]
+
+    def pending(self) -> int:
+        return len(self._bursts)
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "pending": self.pending()}
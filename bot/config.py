@@ -38,6 +38,8 @@ class BotConfig:
     webhook_url: str | None
     webhook_path: str | None
     webhook_secret: str | None
+    admin_user_ids: tuple[int, ...] = ()
+    coalesce_window_seconds: float = 0.0
 
     @property
     def token_fingerprint(self) -> str:
@@ -82,6 +84,30 @@ def _check_no_peer_token_collision(token: str) -> None:
             )
 
 
+def _parse_admin_user_ids(raw: str | None) -> tuple[int, ...]:
+    """Parse BOT_ADMIN_USER_IDS: comma-separated Telegram user ids."""
+    ids = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.lstrip("-").isdigit():
+            raise ConfigError(f"BOT_ADMIN_USER_IDS contains a non-numeric id: {part!r}")
+        ids.append(int(part))
+    return tuple(ids)
+
+
+def _parse_coalesce_window(raw: str | None) -> float:
+    """Parse BOT_COALESCE_WINDOW_SECONDS; 0 (the default) disables coalescing."""
+    try:
+        seconds = float(raw or 0)
+    except ValueError:
+        raise ConfigError(f"BOT_COALESCE_WINDOW_SECONDS must be a number, got {raw!r}") from None
+    if seconds < 0:
+        raise ConfigError("BOT_COALESCE_WINDOW_SECONDS must not be negative.")
+    return seconds
+
+
 def load_bot_config() -> BotConfig:
     missing = [name for name in REQUIRED_ENV_VARS if not os.getenv(name)]
     if missing:
@@ -135,6 +161,8 @@ def load_bot_config() -> BotConfig:
         webhook_url=webhook_url,
         webhook_path=webhook_path,
         webhook_secret=webhook_secret,
+        admin_user_ids=_parse_admin_user_ids(os.getenv("BOT_ADMIN_USER_IDS")),
+        coalesce_window_seconds=_parse_coalesce_window(os.getenv("BOT_COALESCE_WINDOW_SECONDS")),
     )
 
 
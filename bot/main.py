@@ -10,14 +10,20 @@ Main responsibilities:
 3. Handle inline keyboard callbacks.
 4. Process plain text messages and forward them to orchestrator pipelines.
 5. Handle runtime exceptions and run polling loop.
+6. Report the update backlog to the overload governor and expose the admin
+   `/overload` switch.
+7. Optionally coalesce rapid-fire messages per chat/user into one pipeline
+   run (`BOT_COALESCE_WINDOW_SECONDS`, see bot/coalescer.py).
 """
 
 import os
 import sys
 import asyncio
 import contextlib
+import json
 import logging
 import threading
+import warnings
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -31,6 +37,7 @@ from telegram.ext import (
     filters,
 )
 from telegram.constants import ParseMode
+from telegram.warnings import PTBUserWarning
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
@@ -40,12 +47,19 @@ load_dotenv()
 
 from pipelines import (
     pipeline_process_message,
+    ORG_CATEGORIES,
+    ORG_CATEGORIES_BY_SLUG,
     STYLES,
     STYLE_LABELS_UA,
+    match_org_category,
 )
 from pipelines.change_style import STYLE_LABELS
+from pipelines.overload import FORCE_MODES, OVERLOAD
+from pipelines.recommendation import GRAPH_LINKER
+from pipelines.speculation import SPECULATION_STATS
 from utils.llm import detect_language
 from db import queries
+from bot.coalescer import MessageCoalescer
 from bot.config import BotConfig, load_bot_config, log_startup
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -67,6 +81,7 @@ ORG_SEARCH_PROMPT = {
         "For example: corruption, animal rights, education, health."
     ),
 }
+ORG_CATEGORY_CALLBACK_PREFIX = "orgs:"
 
 
 def _detect_user_lang(user, text: str = "") -> str:
@@ -85,11 +100,31 @@ def _start_health_server(port: int) -> None:
     Cloud Run requires the container to listen on $PORT even when the bot
     runs in polling mode (no built-in webhook HTTP server).  This starts a
     background thread with a tiny handler that returns 200 OK so the
-    platform considers the container healthy.
+    platform considers the container healthy. `/overload`, `/linker`,
+    `/speculation`, `/session_cache`, `/message_writer` and
+    `/prepared_statements` return the overload governor, background linker,
+    speculative extraction, session cache, message write-behind and prepared
+    statement snapshots as JSON.
     """
+    snapshots = {
+        "/overload": OVERLOAD.snapshot,
+        "/linker": GRAPH_LINKER.snapshot,
+        "/speculation": SPECULATION_STATS.snapshot,
+        "/session_cache": queries.SESSION_CACHE.snapshot,
+        "/message_writer": queries.MESSAGE_WRITER.snapshot,
+        "/prepared_statements": queries.STATEMENTS.snapshot,
+    }
 
     class _HealthHandler(BaseHTTPRequestHandler):
         def do_GET(self):  # noqa: N802
+            snapshot = snapshots.get(self.path.rstrip("/"))
+            if snapshot is not None:
+                body = json.dumps(snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+                return
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b"OK")
@@ -115,6 +150,18 @@ def _get_style_keyboard(lang: str = "uk") -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(rows)
 
 
+def _get_org_category_keyboard(lang: str = "uk") -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(
+            category.label(lang),
+            callback_data=f"{ORG_CATEGORY_CALLBACK_PREFIX}{category.slug}",
+        )
+        for category in ORG_CATEGORIES
+    ]
+    rows = [buttons[i : i + 2] for i in range(0, len(buttons), 2)]
+    return InlineKeyboardMarkup(rows)
+
+
 def _get_start_keyboard(lang: str = "uk") -> InlineKeyboardMarkup:
     if lang == "en":
         return InlineKeyboardMarkup(
@@ -251,6 +298,7 @@ async def cmd_orgs_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         prompt,
         parse_mode=ParseMode.MARKDOWN,
+        reply_markup=_get_org_category_keyboard(lang),
     )
     return WAITING_FOR_CATEGORY
 
@@ -268,6 +316,7 @@ async def cmd_orgs_receive_category(update: Update, context: ContextTypes.DEFAUL
         chat.type,
         category,
         tg_message_id=update.message.message_id,
+        forced_pipeline="show_orgs" if match_org_category(category) else None,
         lang=lang,
     )
     await update.message.reply_text(
@@ -278,6 +327,37 @@ async def cmd_orgs_receive_category(update: Update, context: ContextTypes.DEFAUL
     return ConversationHandler.END
 
 
+async def cmd_orgs_pick_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a category button from the /orgs keyboard."""
+    query = update.callback_query
+    await query.answer()
+    context.user_data.pop("waiting_for_org_category", None)
+    category = ORG_CATEGORIES_BY_SLUG.get(query.data[len(ORG_CATEGORY_CALLBACK_PREFIX):])
+    if category is None or query.message is None:
+        return ConversationHandler.END
+    user = update.effective_user
+    chat = update.effective_chat
+    lang = context.user_data.get("lang", _detect_user_lang(user))
+    label = category.label(lang)
+    searching = "🔍 Searching for organizations..." if lang == "en" else "🔍 Шукаю організації..."
+    await query.edit_message_text(f"{label}\n\n{searching}")
+    reply = await pipeline_process_message(
+        user.id,
+        chat.id,
+        chat.type,
+        label,
+        tg_message_id=query.message.message_id,
+        forced_pipeline="show_orgs",
+        lang=lang,
+    )
+    await query.message.reply_text(
+        reply,
+        parse_mode=ParseMode.MARKDOWN,
+        disable_web_page_preview=True,
+    )
+    return ConversationHandler.END
+
+
 async def cmd_orgs_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = context.user_data.get("lang", _detect_user_lang(update.effective_user))
     cancel_msg = "Search cancelled." if lang == "en" else "Пошук скасовано."
@@ -347,6 +427,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(
             prompt,
             parse_mode=ParseMode.MARKDOWN,
+            reply_markup=_get_org_category_keyboard(lang),
         )
         context.user_data["waiting_for_org_category"] = True
         context.user_data["lang"] = lang
@@ -370,6 +451,31 @@ async def _typing_action(bot, chat_id: int):
             await task
 
 
+def _report_backlog(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Feed the number of queued Telegram updates to the overload governor."""
+    try:
+        OVERLOAD.report_pending_updates(context.application.update_queue.qsize())
+    except Exception as e:
+        logger.warning(f"Could not read update queue size: {e}")
+
+
+async def cmd_overload(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only: `/overload [auto|normal|degraded]` shows or forces the mode."""
+    admin_ids = context.application.bot_data.get("admin_user_ids", ())
+    if update.effective_user is None or update.effective_user.id not in admin_ids:
+        return
+    if context.args:
+        try:
+            OVERLOAD.force(context.args[0])
+        except ValueError:
+            await update.message.reply_text(f"Usage: /overload [{'|'.join(FORCE_MODES)}]")
+            return
+    snapshot = OVERLOAD.snapshot()
+    await update.message.reply_text(
+        "\n".join(f"{key}: {value}" for key, value in snapshot.items())
+    )
+
+
 def _run_coro_blocking(coro):
     """Run an async coroutine to completion in a worker thread with its own loop."""
     return asyncio.run(coro)
@@ -394,6 +500,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not mentioned:
             return
         text = text.replace(f"@{bot_username}", "").strip()
+    _report_backlog(context)
     if context.user_data.get("waiting_for_org_category"):
         context.user_data.pop("waiting_for_org_category")
         lang = context.user_data.get("lang", _detect_user_lang(user, text))
@@ -406,6 +513,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     chat.type,
                     text,
                     tg_message_id=message.message_id,
+                    forced_pipeline="show_orgs" if match_org_category(text) else None,
                     lang=lang,
                 ),
             )
@@ -416,18 +524,44 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     lang = _detect_user_lang(user, text)
+    coalescer = context.application.bot_data.get("coalescer")
+    if coalescer is None:
+        await _answer_text(context, message, text, lang)
+        return
+    coalescer.submit(
+        (chat.id, user.id),
+        text,
+        lambda merged_text, cancelled: _answer_text(context, message, merged_text, lang, cancelled),
+    )
+
+
+async def _answer_text(
+    context: ContextTypes.DEFAULT_TYPE, message, text: str, lang: str, cancelled: threading.Event | None = None
+) -> None:
+    """Run the orchestrator for `text` and reply to `message` (unless `cancelled` was set)."""
+    chat = message.chat
     async with _typing_action(context.bot, chat.id):
         reply = await asyncio.to_thread(
             _run_coro_blocking,
             pipeline_process_message(
-                user.id, chat.id, chat.type, text, tg_message_id=message.message_id, lang=lang
+                message.from_user.id,
+                chat.id,
+                chat.type,
+                text,
+                tg_message_id=message.message_id,
+                lang=lang,
+                cancel_event=cancelled,
             ),
         )
+    if cancelled is not None and cancelled.is_set():
+        return
     await message.reply_text(
         reply,
         parse_mode=ParseMode.MARKDOWN,
         disable_web_page_preview=True,
     )
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error("Exception while handling update:", exc_info=context.error)
     if isinstance(update, Update) and update.effective_message:
@@ -446,21 +580,31 @@ def _register_handlers(app: Application) -> None:
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(CommandHandler("about", cmd_about))
     app.add_handler(CommandHandler("style", cmd_style))
+    app.add_handler(CommandHandler("overload", cmd_overload))
 
     for style in STYLES:
         app.add_handler(CommandHandler(f"style_{style}", cmd_style_shortcut))
 
+    # The category buttons only need per-chat/user tracking, which is exactly
+    # what per_message=False gives; PTB warns about it regardless.
+    warnings.filterwarnings("ignore", message="If 'per_message=False'", category=PTBUserWarning)
     org_conv = ConversationHandler(
         entry_points=[CommandHandler("orgs", cmd_orgs_start)],
         states={
             WAITING_FOR_CATEGORY: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, cmd_orgs_receive_category)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, cmd_orgs_receive_category),
+                CallbackQueryHandler(
+                    cmd_orgs_pick_category, pattern=f"^{ORG_CATEGORY_CALLBACK_PREFIX}"
+                ),
             ],
         },
         fallbacks=[CommandHandler("cancel", cmd_orgs_cancel)],
         per_message=False,
     )
     app.add_handler(org_conv)
+    app.add_handler(
+        CallbackQueryHandler(cmd_orgs_pick_category, pattern=f"^{ORG_CATEGORY_CALLBACK_PREFIX}")
+    )
     app.add_handler(CallbackQueryHandler(handle_callback))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_error_handler(error_handler)
@@ -474,12 +618,40 @@ def create_bot(config: BotConfig) -> Application:
     process (used by tests; production still runs one per container).
     """
     app = Application.builder().token(config.token).build()
+    app.bot_data["admin_user_ids"] = config.admin_user_ids
+    if config.coalesce_window_seconds > 0:
+        app.bot_data["coalescer"] = MessageCoalescer(config.coalesce_window_seconds)
     _register_handlers(app)
     return app
 
 
+def _warm_catalog_index() -> None:
+    """Load the in-process catalog index before the first message needs it."""
+    try:
+        queries.CATALOG_INDEX.refresh()
+    except Exception as e:
+        logger.warning(f"Catalog index not loaded at startup, will retry on demand: {e}")
+
+
+def _ensure_message_partitions() -> None:
+    """Make sure messages_history has partitions for this and the next months.
+
+    Checked again daily while the bot runs (`queries.start_partition_maintenance`).
+    """
+    try:
+        created = queries.ensure_message_partitions()
+    except Exception as e:
+        logger.warning(f"Could not check messages_history partitions at startup: {e}")
+        return
+    if created:
+        logger.info(f"Created {created} messages_history partition(s)")
+
+
 def run_bot(app: Application, config: BotConfig) -> None:
     log_startup(config)
+    _ensure_message_partitions()
+    queries.start_partition_maintenance()
+    _warm_catalog_index()
     if config.run_mode == "webhook":
         app.run_webhook(
             listen="0.0.0.0",
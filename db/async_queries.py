@@ -0,0 +1,499 @@
+"""
+Async variant of `db.queries` on psycopg 3 and its `AsyncConnectionPool`.
+
+Purpose:
+- Let code that already runs on an event loop (the bot's handlers, async
+  FastAPI endpoints) await database work instead of borrowing a worker thread
+  for every query, as the psycopg2 `ThreadedConnectionPool` requires.
+
+Scope:
+- The per-message path (users/chats/styles, history, save, stage timings,
+  problem/solution upserts and links, catalog retrieval) and the read-only
+  message/statistics queries behind the admin API. Catalog CRUD and the
+  maintenance scripts stay on `db.queries`.
+- Signatures and return values match the `db.queries` functions of the same
+  name; each returns an awaitable. The SQL is not repeated here: every
+  statement is taken from `db.queries` (registered statements by `.sql`, the
+  rest from its module-level SQL constants or builders), so the two variants
+  cannot drift. The differences are psycopg 3 idioms: binary `vector[]`
+  parameters, and `set_config` for the statement timeout, since server-side
+  binding cannot parametrize `SET`.
+- Plan reuse: psycopg 3 prepares a query server-side once it has run
+  `prepare_threshold` times on a connection, which covers the same hot
+  statements `db.queries` prepares through its registry. Both follow
+  `PREPARED_STATEMENTS` (off behind a transaction-pooling proxy).
+
+Vectors:
+- Each pooled connection registers binary adapters for pgvector's `vector`
+  type: numpy arrays are sent as binary parameters (6 KB per 1536-d vector,
+  no text parsing on the server) and `vector` columns load as float32 arrays.
+  Each vector is sent once per statement (see `db.queries`).
+
+Shared state:
+- The in-process catalog index and the embedding stores are the ones owned by
+  `db.queries`, so both variants see the same cache and duplicate probes.
+  Index lookups and store probes (numpy work, refreshes and row counts on
+  the sync pool) run in a thread.
+- The session cache and the write-behind queue are shared too: style writes
+  and saved messages update `SESSION_CACHE` like their sync counterparts,
+  `load_session` fills it and merges queued messages, and with
+  `MESSAGE_WRITE_BEHIND` messages and stage timings go to `MESSAGE_WRITER`
+  (id reservation, which may query the sync pool, runs in a thread). Style and
+  history reads always query the database.
+
+Pool lifecycle:
+- Created and opened lazily on first use, on the running event loop, and sized
+  by `DB_POOL_MIN` / `DB_POOL_MAX` like the sync pool. The pool belongs to that
+  loop: use it from one long-lived loop per process and `await close_pool()`
+  on shutdown.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import numpy as np
+from psycopg import AsyncConnection
+from psycopg.adapt import Dumper, Loader
+from psycopg.pq import Format
+from psycopg.rows import dict_row
+from psycopg.types import TypeInfo
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+from db import queries
+from db.embedding_store import DUPLICATE_SIMILARITY
+from utils.vectors import Embedding, as_embedding, parse_pgvector, parse_pgvector_binary, to_pgvector_binary
+
+_pool: AsyncConnectionPool | None = None
+_pool_lock = asyncio.Lock()
+
+
+class _VectorBinaryDumper(Dumper):
+    format = Format.BINARY
+
+    def dump(self, obj: np.ndarray) -> bytes:
+        return to_pgvector_binary(obj)
+
+
+class _VectorBinaryLoader(Loader):
+    format = Format.BINARY
+
+    def load(self, data) -> Embedding:
+        return parse_pgvector_binary(data)
+
+
+class _VectorTextLoader(Loader):
+    def load(self, data) -> Embedding:
+        return parse_pgvector(bytes(data).decode())
+
+
+async def _register_vector(conn: AsyncConnection) -> None:
+    """Send numpy vectors as binary `vector` parameters and load `vector` columns as numpy."""
+    info = await TypeInfo.fetch(conn, "vector")
+    if info is None:
+        return  # pgvector not installed in this database
+    info.register(conn)  # enables vector[] for lists of vectors
+    conn.adapters.register_dumper(np.ndarray, type("VectorDumper", (_VectorBinaryDumper,), {"oid": info.oid}))
+    conn.adapters.register_loader(info.oid, _VectorBinaryLoader)
+    conn.adapters.register_loader(info.oid, _VectorTextLoader)
+
+
+async def _get_pool() -> AsyncConnectionPool:
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    queries.DATABASE_URL,
+                    min_size=int(os.getenv("DB_POOL_MIN", "1")),
+                    max_size=int(os.getenv("DB_POOL_MAX", "10")),
+                    kwargs={
+                        "row_factory": dict_row,
+                        "prepare_threshold": 5 if queries.PREPARED_STATEMENTS else None,
+                    },
+                    configure=_register_vector,
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def async_db_cursor(timeout: float | None = None):
+    """Async counterpart of `db_cursor()`: commit on success, roll back on error.
+
+    ``timeout`` (seconds) becomes a transaction-local ``statement_timeout``.
+    """
+    pool = await _get_pool()
+    async with pool.connection() as conn:  # commits or rolls back, then returns conn
+        async with conn.cursor() as cur:
+            if timeout is not None:
+                await cur.execute(
+                    "SELECT set_config('statement_timeout', %s, true)",
+                    (str(max(1, int(timeout * 1000))),),
+                )
+            yield cur
+
+
+# ── Users, chats, history ────────────────────────────────────────────────
+async def get_or_create_user(user_id: int, username: str = None, first_name: str = None) -> dict:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._SELECT_USER_SQL, (user_id,))
+        row = await cur.fetchone()
+        if row:
+            return row
+        await cur.execute(queries._INSERT_USER_SQL, (user_id, username, first_name))
+        return await cur.fetchone()
+
+
+async def get_user_style(user_id: int) -> str:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._USER_STYLE.sql, (user_id,))
+        row = await cur.fetchone()
+        return row["response_style"] if row else "normal"
+
+
+async def set_user_style(user_id: int, style: str):
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._SET_USER_STYLE_SQL, (style, user_id))
+        updated = cur.rowcount
+    if updated:
+        queries.SESSION_CACHE.write_user_style(user_id, style)
+
+
+async def get_or_create_chat(chat_id: int, chat_type: str) -> dict:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._SELECT_CHAT_SQL, (chat_id,))
+        row = await cur.fetchone()
+        if row:
+            return row
+        await cur.execute(queries._INSERT_CHAT_SQL, (chat_id, chat_type))
+        return await cur.fetchone()
+
+
+async def get_chat_style(chat_id: int) -> str | None:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._CHAT_STYLE.sql, (chat_id,))
+        row = await cur.fetchone()
+        return row["response_style"] if row else None
+
+
+async def load_session(user_id: int, chat_id: int, chat_type: str, timeout: float | None = None) -> dict:
+    token = queries.SESSION_CACHE.token()
+    pending = queries._pending_messages(chat_id, user_id)
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(
+            queries._LOAD_SESSION_SQL,
+            {"user_id": user_id, "chat_id": chat_id, "chat_type": chat_type,
+             "history_limit": queries.SESSION_CACHE.history_size},
+        )
+        session = queries._session_from_row(await cur.fetchone(), pending)
+    queries._fill_session_cache(user_id, chat_id, session, token)
+    return session
+
+
+async def save_message(
+    chat_id: int,
+    user_id: int,
+    message_text: str,
+    reply_text: str,
+    tg_message_id: int = None,
+    pipeline_used: str = None,
+) -> int:
+    if queries.MESSAGE_WRITE_BEHIND:
+        message_id = await asyncio.to_thread(
+            queries._enqueue_message, chat_id, user_id, message_text, reply_text, tg_message_id, pipeline_used
+        )
+    else:
+        async with async_db_cursor() as cur:
+            await cur.execute(
+                queries._INSERT_MESSAGE.sql,
+                (chat_id, user_id, tg_message_id, message_text, reply_text, pipeline_used),
+            )
+            message_id = (await cur.fetchone())["message_id"]
+    queries._cache_message(chat_id, user_id, message_id, message_text, reply_text, pipeline_used)
+    return message_id
+
+
+async def get_chat_history(
+    chat_id: int, user_id: int = None, limit: int = 10, timeout: float | None = None
+) -> list[dict]:
+    async with async_db_cursor(timeout) as cur:
+        if user_id:
+            await cur.execute(queries._CHAT_HISTORY.sql, (chat_id, user_id, limit))
+        else:
+            await cur.execute(queries._CHAT_HISTORY_ANY_USER.sql, (chat_id, limit))
+        rows = (await cur.fetchall())[::-1]
+    return [{"message_text": r["message_text"], "reply_text": r["reply_text"]} for r in rows]
+
+
+async def get_last_message_context(
+    chat_id: int, user_id: int = None, timeout: float | None = None
+) -> dict | None:
+    async with async_db_cursor(timeout) as cur:
+        if user_id:
+            await cur.execute(queries._LAST_MESSAGE_CONTEXT.sql, (chat_id, user_id))
+        else:
+            await cur.execute(queries._LAST_MESSAGE_CONTEXT_ANY_USER.sql, (chat_id,))
+        return await cur.fetchone()
+
+
+# ── Problems, solutions, links ───────────────────────────────────────────
+async def _upsert_entities(table: str, id_column: str, store, entities: list[dict], timeout: float | None) -> list[int]:
+    if not entities:
+        return []
+    ids, pending = await asyncio.to_thread(queries._store_probe, store, table, entities)
+    if pending:
+        async with async_db_cursor(timeout) as cur:
+            await cur.execute(
+                queries._upsert_entities_sql(table, id_column, vectors_param="%s::vector[]"),
+                (
+                    [entities[index]["name"] for index, _ in pending],
+                    [entities[index]["context"] for index, _ in pending],
+                    [entities[index]["content"] for index, _ in pending],
+                    [as_embedding(entities[index]["embedding"]) for index, _ in pending],
+                    [probe for _, probe in pending],
+                    DUPLICATE_SIMILARITY,
+                ),
+            )
+            rows = await cur.fetchall()
+        for (index, _), row in zip(pending, rows):
+            ids[index] = row["id"]
+            if row["inserted"]:
+                queries._store_append(store, row["id"], entities[index]["embedding"])
+    return ids
+
+
+async def upsert_problems(entities: list[dict], timeout: float | None = None) -> list[int]:
+    """Insert problems unless near-duplicates exist; ids in input order."""
+    return await _upsert_entities("problems", "problem_id", queries.PROBLEM_STORE, entities, timeout)
+
+
+async def upsert_solutions(entities: list[dict], timeout: float | None = None) -> list[int]:
+    """Insert solutions unless near-duplicates exist; ids in input order."""
+    return await _upsert_entities("solutions", "solution_id", queries.SOLUTION_STORE, entities, timeout)
+
+
+async def upsert_problem(
+    name: str, context: str, content: str, embedding: Embedding, timeout: float | None = None
+) -> int:
+    """Insert a problem if cosine similarity to existing ones is below threshold."""
+    entity = {"name": name, "context": context, "content": content, "embedding": embedding}
+    return (await upsert_problems([entity], timeout=timeout))[0]
+
+
+async def upsert_solution(
+    name: str, context: str, content: str, embedding: Embedding, timeout: float | None = None
+) -> int:
+    """Insert a solution if not a near-duplicate."""
+    entity = {"name": name, "context": context, "content": content, "embedding": embedding}
+    return (await upsert_solutions([entity], timeout=timeout))[0]
+
+
+async def link_problem_solution(problem_id: int, solution_id: int, score: float, timeout: float | None = None):
+    await link_problems_solutions([(problem_id, solution_id, score)], timeout=timeout)
+
+
+async def link_problems_solutions(pairs: list[tuple[int, int, float]], timeout: float | None = None):
+    """Write many (problem_id, solution_id, score) links in one statement."""
+    arrays = queries._link_pair_arrays(pairs)
+    if arrays is None:
+        return
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(queries._LINK_PAIRS_SQL, arrays)
+
+
+# ── Catalog retrieval ────────────────────────────────────────────────────
+async def find_orgs_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    return (await find_orgs_by_embeddings([embedding], top_n, min_similarity, timeout=timeout))[0]
+
+
+async def find_projects_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    return (await find_projects_by_embeddings([embedding], top_n, min_similarity, timeout=timeout))[0]
+
+
+async def find_orgs_by_embeddings(
+    embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[list[dict]]:
+    """One ranked org list per query vector (same semantics as find_orgs_by_embedding)."""
+    if not embeddings:
+        return []
+    if queries.CATALOG_INDEX_ENABLED:
+        ranked = await asyncio.to_thread(
+            queries.CATALOG_INDEX.search_orgs_many, embeddings, top_n, min_similarity, timeout=timeout
+        )
+        if ranked is not None:
+            return ranked
+    return await _sql_find_by_embeddings(queries._NEAREST_ORGS_SQL, embeddings, top_n, min_similarity, timeout)
+
+
+async def find_projects_by_embeddings(
+    embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[list[dict]]:
+    """One ranked project list per query vector (same semantics as find_projects_by_embedding)."""
+    if not embeddings:
+        return []
+    if queries.CATALOG_INDEX_ENABLED:
+        ranked = await asyncio.to_thread(
+            queries.CATALOG_INDEX.search_projects_many, embeddings, top_n, min_similarity, timeout=timeout
+        )
+        if ranked is not None:
+            return ranked
+    return await _sql_find_by_embeddings(queries._NEAREST_PROJECTS_SQL, embeddings, top_n, min_similarity, timeout)
+
+
+async def _sql_find_by_embeddings(
+    nearest_sql: str, embeddings: list[Embedding], top_n: int, min_similarity: float, timeout: float | None
+) -> list[list[dict]]:
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(
+            queries._by_embeddings_sql(nearest_sql, vectors_param="%s::vector[]"),
+            ([as_embedding(e) for e in embeddings], top_n, min_similarity),
+        )
+        ranked: list[list[dict]] = [[] for _ in embeddings]
+        for row in await cur.fetchall():
+            ranked[row.pop("ord") - 1].append(row)
+        return ranked
+
+
+async def find_orgs_by_text(text: str, top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    """Organizations ranked by full-text match of `text` (GIN-indexed, no embedding needed)."""
+    tsqueries = queries._lexical_tsqueries(text)
+    if tsqueries is None:
+        return []
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(queries._ORGS_BY_TEXT.sql, (*tsqueries, top_n))
+        return await cur.fetchall()
+
+
+async def find_projects_by_text(text: str, top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    """Projects ranked by full-text match of `text` (GIN-indexed, no embedding needed)."""
+    tsqueries = queries._lexical_tsqueries(text)
+    if tsqueries is None:
+        return []
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(queries._PROJECTS_BY_TEXT.sql, (*tsqueries, top_n))
+        return await cur.fetchall()
+
+
+async def find_orgs_via_solutions(problem_ids: list[int], top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    """Ranked orgs by chaining problems→solutions→organizations similarity scores."""
+    if not problem_ids:
+        return []
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(queries._ORGS_VIA_SOLUTIONS.sql, (list(problem_ids), top_n))
+        return await cur.fetchall()
+
+
+async def find_projects_via_solutions(problem_ids: list[int], top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    if not problem_ids:
+        return []
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(queries._PROJECTS_VIA_SOLUTIONS.sql, (list(problem_ids), top_n))
+        return await cur.fetchall()
+
+
+async def find_recommendations(
+    problem_ids: list[int],
+    embeddings: list[Embedding],
+    top_n: int = 5,
+    fallback_top_n: int = 3,
+    min_similarity: float = 0.0,
+    timeout: float | None = None,
+) -> tuple[list[dict], list[dict]]:
+    """Graph path, else vector path, in one round trip (see `db.queries.find_recommendations`)."""
+    snapshot = None
+    if queries.CATALOG_INDEX_ENABLED and embeddings:
+        snapshot = await asyncio.to_thread(queries.CATALOG_INDEX.get, timeout)
+    orgs: list[dict] = []
+    projects: list[dict] = []
+    if problem_ids or (embeddings and snapshot is None):
+        async with async_db_cursor(timeout) as cur:
+            await cur.execute(
+                queries._recommendations_sql(vectors_param="%(vectors)s::vector[]"),
+                {
+                    "problem_ids": list(problem_ids),
+                    "vectors": [] if snapshot is not None else [as_embedding(e) for e in embeddings],
+                    "top_n": top_n,
+                    "fallback_top_n": fallback_top_n,
+                    "min_similarity": min_similarity,
+                },
+            )
+            for row in await cur.fetchall():
+                shaped = queries._recommendation_row(row)
+                (orgs if row["kind"] == "organization" else projects).append(shaped)
+    if orgs or projects or snapshot is None:
+        return orgs, projects
+    for query, ranked in enumerate(snapshot.orgs.search_many(embeddings, fallback_top_n, min_similarity)):
+        orgs += [{**row, "source": "vector", "query": query} for row in ranked]
+    for query, ranked in enumerate(snapshot.projects.search_many(embeddings, fallback_top_n, min_similarity)):
+        projects += [{**row, "source": "vector", "query": query} for row in ranked]
+    return orgs, projects
+
+
+# ── Messages and stage timings (admin API) ───────────────────────────────
+async def list_messages(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    **filters,
+) -> tuple[list[dict], str | None]:
+    where, params = queries._message_list_filters(**filters)
+    page = queries._list_page_sql(queries._MESSAGE_LIST, where, params, limit, cursor, fields)
+    async with async_db_cursor() as cur:
+        await cur.execute(page.sql, page.params)
+        return queries._list_page_rows(queries._MESSAGE_LIST, page, await cur.fetchall())
+
+
+async def list_counts() -> dict:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._LIST_COUNTS_SQL)
+        return {**(await cur.fetchone()), "approximate": list(queries.LIST_APPROXIMATE_COUNTS)}
+
+
+async def get_message(message_id: int) -> dict | None:
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._GET_MESSAGE_SQL, (message_id,))
+        return await cur.fetchone()
+
+
+async def save_stage_timings(
+    message_id: int,
+    pipeline_used: str | None,
+    total_seconds: float,
+    timings: dict[str, float],
+    timeout: float | None = None,
+):
+    """Store one message's stage timings (seconds in, milliseconds stored)."""
+    if queries.MESSAGE_WRITE_BEHIND:
+        queries._enqueue_stage_timings(message_id, pipeline_used, total_seconds, timings)
+        return
+    async with async_db_cursor(timeout) as cur:
+        await cur.execute(
+            queries._INSERT_STAGE_TIMING.sql,
+            (
+                message_id,
+                pipeline_used,
+                round(total_seconds * 1000),
+                Jsonb({k: round(v * 1000) for k, v in timings.items()}),
+            ),
+        )
+
+
+async def stage_latency_stats(hours: float = 24, pipeline: str | None = None) -> list[dict]:
+    """p50/p95/p99 (ms) per stage, overall and per pipeline, over the last `hours`."""
+    async with async_db_cursor() as cur:
+        await cur.execute(queries._STAGE_LATENCY_SQL, (hours, pipeline, pipeline))
+        return await cur.fetchall()
@@ -0,0 +1,191 @@
+"""
+In-process vector index over the organization/project catalog.
+
+Purpose:
+- Serve `find_orgs_by_embedding` / `find_projects_by_embedding` from memory:
+  the catalog is small and changes rarely, so one exact float32 matrix-vector
+  product replaces a pgvector round trip per query.
+
+Semantics:
+- Same rows, columns and ordering as the SQL path: the `top_n` nearest rows by
+  cosine similarity, then filtered by `min_similarity`.
+- Exact search by default. Catalogs with at least `hnsw_min_rows` rows use an
+  HNSW graph when the optional `hnswlib` package is installed.
+
+Freshness:
+- A snapshot (rows + normalized matrix) is built off to the side and swapped in
+  with one reference assignment, so readers never see a half-built index.
+- `invalidate()` forces a reload on the next search (called by the catalog
+  write helpers in this process). Other processes notice changes by comparing
+  a cheap DB fingerprint at most every `check_interval` seconds.
+- If loading fails, callers keep the previous snapshot (or get None and fall
+  back to SQL) and the load is retried after `check_interval` seconds.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+
+from utils.vectors import Embedding, as_embedding, normalize_rows, stack_embeddings
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Table:
+    """Rows of one catalog table plus their normalized embedding matrix."""
+
+    def __init__(self, rows: list[dict], embeddings: list[Embedding], hnsw_min_rows: int):
+        self.rows = rows
+        dim = len(embeddings[0]) if embeddings else 0
+        self.matrix = normalize_rows(stack_embeddings(embeddings)) if embeddings else np.zeros((0, dim), np.float32)
+        self.hnsw = None
+        if hnswlib is not None and len(rows) >= hnsw_min_rows:
+            self.hnsw = hnswlib.Index(space="ip", dim=dim)
+            self.hnsw.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            self.hnsw.add_items(self.matrix, np.arange(len(rows)))
+            self.hnsw.set_ef(64)
+
+    def search(self, embedding: Embedding, top_n: int, min_similarity: float) -> list[dict]:
+        return self.search_many([embedding], top_n, min_similarity)[0]
+
+    def search_many(self, embeddings: list[Embedding], top_n: int, min_similarity: float) -> list[list[dict]]:
+        """One ranked list per query vector, scored with a single matrix product."""
+        if not embeddings:
+            return []
+        if not self.rows or top_n <= 0:
+            return [[] for _ in embeddings]
+        queries = normalize_rows(stack_embeddings(embeddings))
+        k = min(top_n, len(self.rows))
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(queries, k=k)
+            orders, scores = labels, 1.0 - distances
+        else:
+            all_scores = queries @ self.matrix.T
+            top = (
+                np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+                if k < len(self.rows)
+                else np.tile(np.arange(len(self.rows)), (len(queries), 1))
+            )
+            top_scores = np.take_along_axis(all_scores, top, axis=1)
+            ranked = np.argsort(-top_scores, axis=1, kind="stable")
+            orders = np.take_along_axis(top, ranked, axis=1)
+            scores = np.take_along_axis(top_scores, ranked, axis=1)
+        return [
+            [
+                {**self.rows[i], "similarity": float(score)}
+                for i, score in zip(order, row_scores)
+                if score >= min_similarity
+            ]
+            for order, row_scores in zip(orders, scores)
+        ]
+
+
+@dataclass(slots=True, frozen=True)
+class _Snapshot:
+    orgs: _Table
+    projects: _Table
+    fingerprint: Any
+    loaded_at: float
+
+
+class CatalogIndex:
+    def __init__(
+        self,
+        load: Callable[[float | None], tuple[list[dict], list[dict]]],
+        fingerprint: Callable[[float | None], Any],
+        check_interval: float = 30.0,
+        hnsw_min_rows: int = 50_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """`load` returns (org rows, project rows), each row carrying an `embedding`."""
+        self._load = load
+        self._fingerprint = fingerprint
+        self.check_interval = check_interval
+        self.hnsw_min_rows = hnsw_min_rows
+        self._clock = clock
+        self._snapshot: _Snapshot | None = None
+        self._checked_at = 0.0
+        self._retry_at = 0.0
+        self._stale = True
+        self._refresh_lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def refresh(self, timeout: float | None = None) -> None:
+        """Load the catalog and swap the new snapshot in atomically."""
+        # Cleared before loading so an invalidate() that races the load wins.
+        self._stale = False
+        try:
+            fingerprint = self._fingerprint(timeout)
+            org_rows, project_rows = self._load(timeout)
+        except Exception:
+            self._stale = True
+            raise
+        orgs = _Table(
+            [{k: v for k, v in row.items() if k != "embedding"} for row in org_rows],
+            [as_embedding(row["embedding"]) for row in org_rows],
+            self.hnsw_min_rows,
+        )
+        projects = _Table(
+            [{k: v for k, v in row.items() if k != "embedding"} for row in project_rows],
+            [as_embedding(row["embedding"]) for row in project_rows],
+            self.hnsw_min_rows,
+        )
+        self._snapshot = _Snapshot(orgs, projects, fingerprint, self._clock())
+        self._checked_at = self._clock()
+        logger.info(f"Catalog index loaded: orgs={len(orgs.rows)} projects={len(projects.rows)}")
+
+    def get(self, timeout: float | None = None) -> _Snapshot | None:
+        """Current snapshot, reloaded first if stale or the DB fingerprint moved."""
+        snapshot = self._snapshot
+        now = self._clock()
+        due = self._stale or snapshot is None or now - self._checked_at >= self.check_interval
+        if not due or now < self._retry_at:
+            return snapshot
+        # One caller refreshes; the others keep serving the current snapshot.
+        if not self._refresh_lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is not snapshot and not self._stale:
+                pass  # another caller loaded it while we waited
+            elif self._stale or self._snapshot is None:
+                self.refresh(timeout)
+            else:
+                self._checked_at = self._clock()
+                if self._fingerprint(timeout) != self._snapshot.fingerprint:
+                    self.refresh(timeout)
+        except Exception as e:
+            logger.warning(f"Catalog index refresh failed, using {'stale index' if snapshot else 'SQL'}: {e}")
+            self._retry_at = self._clock() + self.check_interval
+        finally:
+            self._refresh_lock.release()
+        return self._snapshot
+
+    def search_orgs(self, embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0,
+                    timeout: float | None = None) -> list[dict] | None:
+        snapshot = self.get(timeout)
+        return None if snapshot is None else snapshot.orgs.search(embedding, top_n, min_similarity)
+
+    def search_projects(self, embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0,
+                        timeout: float | None = None) -> list[dict] | None:
+        snapshot = self.get(timeout)
+        return None if snapshot is None else snapshot.projects.search(embedding, top_n, min_similarity)
+
+    def search_orgs_many(self, embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0,
+                         timeout: float | None = None) -> list[list[dict]] | None:
+        snapshot = self.get(timeout)
+        return None if snapshot is None else snapshot.orgs.search_many(embeddings, top_n, min_similarity)
+
+    def search_projects_many(self, embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0,
+                             timeout: float | None = None) -> list[list[dict]] | None:
+        snapshot = self.get(timeout)
+        return None if snapshot is None else snapshot.projects.search_many(embeddings, top_n, min_similarity)
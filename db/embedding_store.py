@@ -0,0 +1,145 @@
+"""
+Memory-mapped embedding store for problem/solution near-duplicate checks.
+
+Purpose:
+- `upsert_problem` / `upsert_solution` reuse an existing row when its cosine
+  similarity to the new entity exceeds `DUPLICATE_SIMILARITY`. With a store
+  configured, that top-1 probe runs locally over a memory-mapped float32
+  matrix instead of an HNSW probe against ever-growing Postgres tables.
+
+Layout:
+- One append-only file per table (`problems.store`, `solutions.store`) in
+  `EMBEDDING_STORE_DIR`; each record is an int64 id plus the L2-normalized
+  float32 vector. The page cache is shared, so the bot and server processes on
+  one host read the same pages.
+- Appends and in-place edits take an exclusive `flock` on the file. Readers map
+  only whole records, so a concurrent append is simply not visible yet.
+- `rebuild()` writes a new file and `os.replace`s it in; readers notice the new
+  inode and remap.
+
+Consistency:
+- Postgres stays the source of truth. Rows inserted by other tools (seed
+  scripts, other hosts) are missing from the store until the next rebuild
+  (`python scripts/rebuild_embedding_store.py`). `db.queries` only trusts a
+  store that holds at least as many rows as its table (re-counted
+  periodically); an empty, unbuilt or lagging store leaves the duplicate
+  probe to SQL. Deleted ids are zeroed out via `forget()`, so a match is
+  never a deleted row.
+"""
+import fcntl
+import logging
+import os
+import threading
+from typing import Iterable
+
+import numpy as np
+
+from utils.vectors import EMBEDDING_DIM, Embedding, as_embedding, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_SIMILARITY = 0.92
+# Rows scored per matrix product; bounds the temporary score/copy buffers.
+_CHUNK_ROWS = 65_536
+
+
+class EmbeddingStore:
+    def __init__(self, path: str, dim: int = EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype([("id", "<i8"), ("vec", "<f4", (dim,))])
+        self._lock = threading.Lock()
+        self._records: np.ndarray | None = None
+        self._mapped_key: tuple[int, int] | None = None
+
+    def _record(self, item_id: int, embedding: Embedding) -> bytes:
+        record = np.zeros(1, dtype=self.dtype)
+        record["id"] = item_id
+        record["vec"] = normalize_rows(as_embedding(embedding).reshape(1, -1))
+        return record.tobytes()
+
+    def _mapped(self) -> np.ndarray:
+        """Records currently on disk, remapped when the file grew or was replaced."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=self.dtype)
+        key = (stat.st_ino, stat.st_size)
+        with self._lock:
+            if key != self._mapped_key:
+                count = stat.st_size // self.dtype.itemsize
+                self._records = (
+                    np.memmap(self.path, dtype=self.dtype, mode="r", shape=(count,))
+                    if count
+                    else np.zeros(0, dtype=self.dtype)
+                )
+                self._mapped_key = key
+            return self._records
+
+    def __len__(self) -> int:
+        return len(self._mapped())
+
+    def nearest(self, embedding: Embedding) -> tuple[int, float] | None:
+        """(id, cosine similarity) of the closest stored vector, or None if empty."""
+        records = self._mapped()
+        if not len(records):
+            return None
+        query = normalize_rows(as_embedding(embedding).reshape(1, -1))[0]
+        best_id, best_score = None, -np.inf
+        for start in range(0, len(records), _CHUNK_ROWS):
+            chunk = records[start:start + _CHUNK_ROWS]
+            scores = chunk["vec"] @ query
+            i = int(np.argmax(scores))
+            if scores[i] > best_score:
+                best_id, best_score = int(chunk["id"][i]), float(scores[i])
+        return best_id, best_score
+
+    def append(self, item_id: int, embedding: Embedding) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = self._record(item_id, embedding)
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def forget(self, item_id: int) -> None:
+        """Zero the vectors stored for `item_id` so it can never match again."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                count = os.fstat(f.fileno()).st_size // self.dtype.itemsize
+                if not count:
+                    return
+                records = np.memmap(f, dtype=self.dtype, mode="r+", shape=(count,))
+                hits = records["id"] == item_id
+                if hits.any():
+                    records["vec"][hits] = 0.0
+                    records.flush()
+                del records
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def rebuild(self, rows: Iterable[tuple[int, Embedding]]) -> int:
+        """Replace the store with `rows` (id, embedding); returns the row count."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        count = 0
+        with open(tmp_path, "wb") as f:
+            for item_id, embedding in rows:
+                f.write(self._record(item_id, embedding))
+                count += 1
+        os.replace(tmp_path, self.path)
+        return count
+
+
+def open_store(name: str) -> EmbeddingStore | None:
+    """Store for table `name` under EMBEDDING_STORE_DIR; None when not configured."""
+    directory = os.getenv("EMBEDDING_STORE_DIR")
+    if not directory:
+        return None
+    return EmbeddingStore(os.path.join(directory, f"{name}.store"))
@@ -0,0 +1,232 @@
+"""
+Write-behind persistence for `messages_history`.
+
+Purpose:
+- Take the `messages_history` INSERT (and the message's stage timings) off the
+  reply path. `queries.save_message` enqueues the row and returns at once; a
+  worker thread writes queued rows in batches. Enabled by
+  `MESSAGE_WRITE_BEHIND=on`; otherwise every save is a synchronous INSERT.
+
+Ids:
+- Message ids are drawn from the table's sequence in blocks of `id_block`
+  (one round trip per block, topped up by the worker), so `save_message` can
+  still return the id and `save_stage_timings` can reference it before the
+  row exists. Ids therefore follow reservation, not insertion, order.
+
+Batching:
+- The worker waits up to `flush_interval` seconds for `batch_size` records,
+  then writes them in one transaction, so a message and its timings become
+  visible together. `message_stage_timings` has no foreign key to the
+  partitioned `messages_history` (see db/schema.sql), so the order of the two
+  INSERTs within the batch does not matter and a message's timings may land
+  in a later batch. Writes are idempotent (ON CONFLICT DO NOTHING), so a
+  batch whose commit outcome is unknown is safely retried.
+- A failed batch goes back to the front of the queue and is retried after
+  `flush_interval`. The exception is a check violation (SQLSTATE 23514,
+  which Postgres also raises when no `messages_history` partition accepts a
+  row): retrying cannot succeed, so the batch is logged and dropped rather
+  than blocking every later row. Partitions are kept ahead of time by
+  `queries.start_partition_maintenance()`.
+
+Read-your-writes:
+- `pending_messages(chat_id, user_id)` returns queued and in-flight rows of a
+  conversation; queries that read history merge them over the DB result, and
+  the session cache is updated at enqueue time.
+
+Shutdown:
+- `stop()` (registered at interpreter exit) flushes everything still queued,
+  retrying until its timeout; rows left after that are logged as lost.
+
+Observability: `snapshot()` (served by the bot's health server on
+`/message_writer`).
+"""
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE check_violation, also "no partition of relation found for row".
+_CHECK_VIOLATION = "23514"
+
+
+@dataclass(slots=True)
+class _Record:
+    kind: str  # "message" or "timings"
+    row: dict
+    enqueued_at: float = field(default=0.0)
+
+
+class MessageWriter:
+    def __init__(
+        self,
+        write_batch: Callable[[list[dict], list[dict]], None],
+        reserve_ids: Callable[[int], list[int]],
+        batch_size: int = 100,
+        flush_interval: float = 0.2,
+        id_block: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """`write_batch(messages, timings)` writes both lists in one transaction."""
+        self._write_batch = write_batch
+        self._reserve_ids = reserve_ids
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block = id_block
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._ids_lock = threading.Lock()
+        self._ids: deque[int] = deque()
+        self._records: deque[_Record] = deque()
+        self._inflight: list[_Record] = []
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._enqueued = 0
+        self._written_messages = 0
+        self._written_timings = 0
+        self._batches = 0
+        self._failures = 0
+        self._lost = 0
+        self._last_error: str | None = None
+        self._last_batch_lag = 0.0
+
+    # ── Ids ────────────────────────────────────────────────────────────────
+    def next_id(self) -> int:
+        """A message id from the reserved block; reserves a new block when empty."""
+        with self._ids_lock:
+            if not self._ids:
+                self._ids.extend(self._reserve_ids(self.id_block))
+            return self._ids.popleft()
+
+    def _top_up_ids(self) -> None:
+        with self._ids_lock:
+            if len(self._ids) < self.id_block // 2:
+                self._ids.extend(self._reserve_ids(self.id_block))
+
+    # ── Enqueue ────────────────────────────────────────────────────────────
+    def enqueue_message(self, row: dict) -> None:
+        self._enqueue(_Record("message", row, self._clock()))
+
+    def enqueue_timings(self, row: dict) -> None:
+        self._enqueue(_Record("timings", row, self._clock()))
+
+    def _enqueue(self, record: _Record) -> None:
+        with self._cond:
+            self._records.append(record)
+            self._enqueued += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+            if len(self._records) == 1 or len(self._records) >= self.batch_size:
+                self._cond.notify()
+
+    def pending_messages(self, chat_id: int, user_id: int) -> list[dict]:
+        """Queued or in-flight message rows of one conversation, oldest first."""
+        with self._cond:
+            records = [*self._inflight, *self._records]
+        return [
+            dict(r.row)
+            for r in records
+            if r.kind == "message" and r.row["chat_id"] == chat_id and r.row["user_id"] == user_id
+        ]
+
+    # ── Worker ─────────────────────────────────────────────────────────────
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._records and not self._stopping:
+                    self._cond.wait()
+                if not self._records:
+                    return
+                if len(self._records) < self.batch_size and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+            if not self.flush():
+                with self._cond:
+                    if self._stopping:
+                        return
+                    self._cond.wait(self.flush_interval)
+                continue
+            try:
+                self._top_up_ids()
+            except Exception as e:
+                logger.warning(f"Could not reserve message ids ahead of time: {e}")
+
+    def flush(self) -> bool:
+        """Write one batch in the calling thread; False if the write failed."""
+        with self._flush_lock:
+            with self._cond:
+                count = min(self.batch_size, len(self._records))
+                self._inflight = [self._records.popleft() for _ in range(count)]
+                batch = self._inflight
+            if not batch:
+                return True
+            messages = [r.row for r in batch if r.kind == "message"]
+            timings = [r.row for r in batch if r.kind == "timings"]
+            try:
+                self._write_batch(messages, timings)
+            except Exception as e:
+                if getattr(e, "pgcode", None) == _CHECK_VIOLATION:
+                    with self._cond:
+                        self._inflight = []
+                        self._failures += 1
+                        self._lost += len(batch)
+                        self._last_error = str(e)
+                    logger.error(
+                        f"Message write-behind batch of {len(batch)} dropped, it cannot be written: {e}; "
+                        f"message ids {[r['message_id'] for r in messages]}"
+                    )
+                    return True
+                with self._cond:
+                    self._records.extendleft(reversed(batch))
+                    self._inflight = []
+                    self._failures += 1
+                    self._last_error = str(e)
+                logger.warning(f"Message write-behind batch of {len(batch)} failed, will retry: {e}")
+                return False
+            lag = self._clock() - min(r.enqueued_at for r in batch)
+            with self._cond:
+                self._inflight = []
+                self._batches += 1
+                self._written_messages += len(messages)
+                self._written_timings += len(timings)
+                self._last_batch_lag = lag
+            return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything queued, retrying until `timeout` (registered at exit)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        give_up_at = self._clock() + timeout
+        while self._records and self._clock() < give_up_at:
+            if not self.flush():
+                time.sleep(min(self.flush_interval, max(0.0, give_up_at - self._clock())))
+        with self._cond:
+            if self._records:
+                self._lost += len(self._records)
+                logger.error(f"Message write-behind stopped with {len(self._records)} unwritten record(s)")
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            oldest = self._records[0].enqueued_at if self._records else None
+            return {
+                "queue_depth": len(self._records),
+                "oldest_record_age": round(self._clock() - oldest, 3) if oldest is not None else 0.0,
+                "last_batch_lag": round(self._last_batch_lag, 3),
+                "enqueued": self._enqueued,
+                "batches": self._batches,
+                "written_messages": self._written_messages,
+                "written_timings": self._written_timings,
+                "reserved_ids": len(self._ids),
+                "failures": self._failures,
+                "lost": self._lost,
+                "last_error": self._last_error,
+            }
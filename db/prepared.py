@@ -0,0 +1,162 @@
+"""
+Server-side prepared statements for the hot queries of `db.queries`.
+
+Purpose:
+- Parse and plan the per-message statements once per connection instead of on
+  every call: each is `PREPARE`d on first use and then run with
+  `EXECUTE name (...)`, so the server reuses the parsed statement and, after
+  a few executions, a cached generic plan (see `plan_cache_mode`).
+
+Statements:
+- Registered once at import with `register(name, sql)`. `sql` uses psycopg2
+  placeholders (`%s` or `%(name)s`), like any other query, and is rewritten
+  to `$1, $2, ...`. Parameter types are inferred by the server; cast in the
+  SQL where context does not fix them (`%s::text[]`).
+- Variable-length id lists are arrays (`= ANY(%s::bigint[])`), so one
+  statement text serves every list length.
+- psycopg2 interpolates parameters client-side, so `EXECUTE` receives
+  literals. After the first PREPARE the registry reads the inferred parameter
+  types from `pg_prepared_statements` and casts each literal explicitly
+  (`ARRAY[NULL]` alone would be `text[]`, which does not coerce to
+  `bigint[]`).
+
+Connections:
+- Prepared statements live in the server session. The registry remembers,
+  per pooled connection (weakly keyed), which names it has prepared. When
+  the server no longer has one (SQLSTATE 26000, e.g. after `DISCARD ALL`),
+  that call fails and the next use prepares it again.
+- Before preparing a name it has no record of on a connection, the registry
+  looks it up in `pg_prepared_statements` (the session may already have it,
+  e.g. from another registry instance). A duplicate PREPARE would fail with
+  SQLSTATE 42P05 and abort the caller's transaction.
+- Transaction-pooling proxies (PgBouncer in transaction mode) do not keep
+  session state: set `PREPARED_STATEMENTS=off` there and statements are sent
+  as plain queries.
+
+Measuring: `scripts/bench_prepared_statements.py` compares planning counts and
+time in `pg_stat_statements` with the registry on and off.
+Observability: `snapshot()` (served by the bot's health server on
+`/prepared_statements`).
+"""
+import re
+import threading
+import weakref
+from dataclasses import dataclass
+
+_PLACEHOLDER = re.compile(r"%%|%\((\w+)\)s|%s")
+# SQLSTATE invalid_sql_statement_name: EXECUTE of a name the session lacks.
+_UNKNOWN_STATEMENT = "26000"
+
+
+def _number_placeholders(sql: str) -> tuple[str, tuple[str, ...] | int]:
+    """`sql` with `$n` parameters, and the parameter names in `$n` order (or the count)."""
+    names: list[str] = []
+    positional = 0
+
+    def replace(match: re.Match) -> str:
+        nonlocal positional
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            positional += 1
+            return f"${positional}"
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    text = _PLACEHOLDER.sub(replace, sql)
+    if names and positional:
+        raise ValueError("A statement cannot mix %s and %(name)s placeholders")
+    return text, tuple(names) if names else positional
+
+
+@dataclass(frozen=True, slots=True)
+class Statement:
+    name: str
+    sql: str  # psycopg2 placeholders, sent as is when preparing is off
+    text: str  # `$n` parameters, for PREPARE
+    params: tuple[str, ...] | int  # parameter names in `$n` order, or the positional count
+
+    def values(self, params) -> list:
+        """Parameter values in `$n` order."""
+        if isinstance(self.params, tuple):
+            return [params[name] for name in self.params]
+        values = list(params or ())
+        if len(values) != self.params:
+            raise ValueError(f"{self.name} takes {self.params} parameter(s), got {len(values)}")
+        return values
+
+
+class StatementRegistry:
+    def __init__(self, enabled: bool = True, prefix: str = "h2a_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._statements: dict[str, Statement] = {}
+        self._types: dict[str, tuple[str, ...]] = {}  # statement name -> parameter types
+        self._prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._prepares = 0
+        self._executes = 0
+        self._lost = 0
+
+    def register(self, name: str, sql: str) -> Statement:
+        text, params = _number_placeholders(sql)
+        statement = Statement(f"{self.prefix}{name}", sql, text, params)
+        with self._lock:
+            existing = self._statements.get(statement.name)
+            if existing is not None and existing.sql != sql:
+                raise ValueError(f"Statement {statement.name} is already registered with different SQL")
+            self._statements[statement.name] = statement
+        return statement
+
+    def execute(self, cur, statement: Statement, params=None) -> None:
+        """Run `statement` on `cur`, preparing it on the cursor's connection first if needed."""
+        if not self.enabled:
+            cur.execute(statement.sql, params)
+            return
+        values = statement.values(params)
+        with self._lock:
+            prepared = self._prepared.setdefault(cur.connection, set())
+        if statement.name not in prepared:
+            types = self._parameter_types(cur, statement.name)
+            if types is None:
+                cur.execute(f"PREPARE {statement.name} AS {statement.text}")
+                with self._lock:
+                    self._prepares += 1
+            else:
+                self._types[statement.name] = types
+            prepared.add(statement.name)
+        if statement.name not in self._types:
+            self._types[statement.name] = self._parameter_types(cur, statement.name) or ()
+        try:
+            if values:
+                placeholders = ", ".join(f"%s::{sql_type}" for sql_type in self._types[statement.name])
+                cur.execute(f"EXECUTE {statement.name} ({placeholders})", values)
+            else:
+                cur.execute(f"EXECUTE {statement.name}")
+        except Exception as e:
+            if getattr(e, "pgcode", None) == _UNKNOWN_STATEMENT:
+                prepared.discard(statement.name)
+                with self._lock:
+                    self._lost += 1
+            raise
+        with self._lock:
+            self._executes += 1
+
+    @staticmethod
+    def _parameter_types(cur, name: str) -> tuple[str, ...] | None:
+        """Parameter types of the session's prepared statement `name`, or None if it has none such."""
+        cur.execute("SELECT parameter_types::text[] AS types FROM pg_prepared_statements WHERE name = %s", (name,))
+        row = cur.fetchone()
+        return tuple(row["types"]) if row is not None else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "statements": len(self._statements),
+                "connections": len(self._prepared),
+                "prepares": self._prepares,
+                "executes": self._executes,
+                "lost": self._lost,
+            }
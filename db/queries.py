@@ -1,14 +1,32 @@
+import atexit
+import base64
+import functools
+import json
+import logging
 import os
+import re
+import select
 import threading
+import time
+import weakref
 import psycopg2
 import psycopg2.extras
 from psycopg2 import pool as psycopg2_pool
 from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from db.config import DEFAULT_DATABASE_URL, get_database_url
+from db.catalog_index import CatalogIndex
+from db.embedding_store import DUPLICATE_SIMILARITY, EmbeddingStore, open_store
+from db.message_writer import MessageWriter
+from db.prepared import Statement, StatementRegistry
+from db.session_cache import MISS, SessionCache
+from utils.vectors import Embedding, parse_pgvector, to_pgvector
 
 load_dotenv()
 DATABASE_URL = get_database_url(DEFAULT_DATABASE_URL)
+logger = logging.getLogger(__name__)
 
 _pool: psycopg2_pool.ThreadedConnectionPool | None = None
 _pool_lock = threading.Lock()
@@ -43,12 +61,20 @@ def get_connection():
 
 
 @contextmanager
-def db_cursor():
+def db_cursor(timeout: float | None = None):
+    """Yield a cursor in a transaction; commit on success, roll back on error.
+
+    ``timeout`` (seconds) becomes a transaction-local ``statement_timeout`` so a
+    caller with a latency budget cannot be held up by one slow statement.
+    """
     pool = _get_pool()
     conn = pool.getconn()
+    _track_own_connection(conn)
     cursor = None
     try:
         cursor = conn.cursor()
+        if timeout is not None:
+            cursor.execute("SET LOCAL statement_timeout = %s", (max(1, int(timeout * 1000)),))
         yield cursor
         conn.commit()
     except Exception:
@@ -57,53 +83,351 @@ def db_cursor():
     finally:
         if cursor is not None:
             cursor.close()
+        if conn.closed:
+            _forget_own_connection(conn)  # the pool drops it; its pid may go to another client
         pool.putconn(conn)  # always return the connection to the pool
 
+
+# Server-side prepared statements for the per-message queries, prepared once
+# per pooled connection and run by name (db/prepared.py). Turn off behind a
+# transaction-pooling proxy.
+PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "on").strip().lower() not in ("off", "0", "false")
+STATEMENTS = StatementRegistry(enabled=PREPARED_STATEMENTS)
+
+# Session cache (styles + recent history), kept fresh by write-through and by
+# `session_invalidate` notifications; see db/session_cache.py.
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE", "on").strip().lower() not in ("off", "0", "false")
+SESSION_CACHE = SessionCache(
+    max_entries=int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300")),
+    history_size=int(os.getenv("SESSION_CACHE_HISTORY", "6")),
+)
+SESSION_CHANNEL = "session_invalidate"
+# Idle interval after which the listener pings its connection to notice drops.
+_LISTENER_PING_SECONDS = 30.0
+_LISTENER_RETRY_SECONDS = 5.0
+# Backend pid -> this process's live pool connection with that pid. Their
+# notifications are already applied by write-through, so the listener skips
+# them. Entries go when the connection is closed or collected, so the map is
+# bounded by the pool and a pid the server reuses for another client is not
+# mistaken for ours.
+_own_connections: dict[int, weakref.ref] = {}
+_own_connections_lock = threading.Lock()
+_listener_thread: threading.Thread | None = None
+_listener_lock = threading.Lock()
+
+
+def _track_own_connection(conn) -> None:
+    pid = conn.get_backend_pid()
+    with _own_connections_lock:
+        ref = _own_connections.get(pid)
+        if ref is not None and ref() is conn:
+            return
+
+        def forget(dead: weakref.ref, pid: int = pid) -> None:
+            # No lock: the collector may run this while the lock is held.
+            if _own_connections.get(pid) is dead:
+                _own_connections.pop(pid, None)
+
+        _own_connections[pid] = weakref.ref(conn, forget)
+
+
+def _forget_own_connection(conn) -> None:
+    with _own_connections_lock:
+        for pid, ref in list(_own_connections.items()):
+            if ref() is conn:
+                del _own_connections[pid]
+
+
+def _is_own_backend(pid: int) -> bool:
+    with _own_connections_lock:
+        ref = _own_connections.get(pid)
+    conn = ref() if ref is not None else None
+    return conn is not None and not conn.closed
+
+
+def _listen_for_session_changes() -> None:
+    """Apply `session_invalidate` notifications to SESSION_CACHE, forever.
+
+    The cache serves only while this connection is up; every (re)connect
+    starts from an empty cache.
+    """
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {SESSION_CHANNEL}")
+            SESSION_CACHE.set_listening(True)
+            logger.info("Session cache listener connected")
+            while True:
+                if select.select([conn], [], [], _LISTENER_PING_SECONDS)[0]:
+                    conn.poll()
+                else:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    if _is_own_backend(notify.pid) and not notify.payload.endswith("*"):
+                        continue
+                    SESSION_CACHE.invalidate(notify.payload)
+        except Exception as e:
+            SESSION_CACHE.set_listening(False)
+            logger.warning(f"Session cache listener disconnected, serving from the DB: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(_LISTENER_RETRY_SECONDS)
+
+
+def _session_cache_ready() -> bool:
+    """Start the listener on first use; True once the cache may serve reads."""
+    global _listener_thread
+    if not SESSION_CACHE_ENABLED:
+        return False
+    if _listener_thread is None:
+        with _listener_lock:
+            if _listener_thread is None:
+                _listener_thread = threading.Thread(
+                    target=_listen_for_session_changes, name="session-cache-listener", daemon=True
+                )
+                _listener_thread.start()
+    return SESSION_CACHE.listening
+
+
+# SQL shared with db/async_queries.py: each query is defined once, here.
+_SELECT_USER_SQL = "SELECT * FROM users WHERE user_id = %s"
+_INSERT_USER_SQL = "INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s) RETURNING *"
+_SET_USER_STYLE_SQL = "UPDATE users SET response_style = %s WHERE user_id = %s"
+_SELECT_CHAT_SQL = "SELECT * FROM chats WHERE chat_id = %s"
+_INSERT_CHAT_SQL = "INSERT INTO chats (chat_id, type) VALUES (%s, %s) RETURNING *"
+
+
 def get_or_create_user(user_id: int, username: str = None, first_name: str = None) -> dict:
     with db_cursor() as cur:
-        cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+        cur.execute(_SELECT_USER_SQL, (user_id,))
         row = cur.fetchone()
         if row:
             return dict(row)
-        cur.execute(
-            "INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s) RETURNING *",
-            (user_id, username, first_name),
-        )
+        cur.execute(_INSERT_USER_SQL, (user_id, username, first_name))
         return dict(cur.fetchone())
 
 
+_USER_STYLE = STATEMENTS.register("user_style", "SELECT response_style FROM users WHERE user_id = %s")
+_CHAT_STYLE = STATEMENTS.register("chat_style", "SELECT response_style FROM chats WHERE chat_id = %s")
+
+
 def get_user_style(user_id: int) -> str:
+    if _session_cache_ready():
+        cached = SESSION_CACHE.user_style(user_id)
+        if cached is not MISS:
+            return cached
+    token = SESSION_CACHE.token()
     with db_cursor() as cur:
-        cur.execute("SELECT response_style FROM users WHERE user_id = %s", (user_id,))
+        STATEMENTS.execute(cur, _USER_STYLE, (user_id,))
         row = cur.fetchone()
-        return row["response_style"] if row else "normal"
+    if not row:
+        return "normal"
+    SESSION_CACHE.put_user_style(user_id, row["response_style"], token)
+    return row["response_style"]
 
 
 def set_user_style(user_id: int, style: str):
     with db_cursor() as cur:
-        cur.execute(
-            "UPDATE users SET response_style = %s WHERE user_id = %s",
-            (style, user_id),
-        )
+        cur.execute(_SET_USER_STYLE_SQL, (style, user_id))
+        updated = cur.rowcount
+    if updated:
+        SESSION_CACHE.write_user_style(user_id, style)
+
 
 def get_or_create_chat(chat_id: int, chat_type: str) -> dict:
     with db_cursor() as cur:
-        cur.execute("SELECT * FROM chats WHERE chat_id = %s", (chat_id,))
+        cur.execute(_SELECT_CHAT_SQL, (chat_id,))
         row = cur.fetchone()
         if row:
             return dict(row)
-        cur.execute(
-            "INSERT INTO chats (chat_id, type) VALUES (%s, %s) RETURNING *",
-            (chat_id, chat_type),
-        )
+        cur.execute(_INSERT_CHAT_SQL, (chat_id, chat_type))
         return dict(cur.fetchone())
 
 
 def get_chat_style(chat_id: int) -> str | None:
+    if _session_cache_ready():
+        cached = SESSION_CACHE.chat_style(chat_id)
+        if cached is not MISS:
+            return cached
+    token = SESSION_CACHE.token()
     with db_cursor() as cur:
-        cur.execute("SELECT response_style FROM chats WHERE chat_id = %s", (chat_id,))
+        STATEMENTS.execute(cur, _CHAT_STYLE, (chat_id,))
         row = cur.fetchone()
-        return row["response_style"] if row else None
+    if not row:
+        return None
+    SESSION_CACHE.put_chat_style(chat_id, row["response_style"], token)
+    return row["response_style"]
+
+
+_LOAD_SESSION_SQL = """
+    WITH new_user AS (
+        INSERT INTO users (user_id) VALUES (%(user_id)s)
+        ON CONFLICT (user_id) DO NOTHING
+        RETURNING response_style
+    ),
+    new_chat AS (
+        INSERT INTO chats (chat_id, type) VALUES (%(chat_id)s, %(chat_type)s)
+        ON CONFLICT (chat_id) DO NOTHING
+        RETURNING response_style
+    ),
+    recent AS (
+        SELECT message_id, date, message_text, reply_text, pipeline_used
+        FROM messages_history
+        WHERE chat_id = %(chat_id)s AND user_id = %(user_id)s
+        ORDER BY date DESC
+        LIMIT %(history_limit)s
+    )
+    SELECT coalesce((SELECT response_style FROM new_user),
+                    (SELECT response_style FROM users WHERE user_id = %(user_id)s)) AS user_style,
+           coalesce((SELECT response_style FROM new_chat),
+                    (SELECT response_style FROM chats WHERE chat_id = %(chat_id)s)) AS chat_style,
+           (SELECT coalesce(json_agg(json_build_object(
+                       'message_id', message_id,
+                       'message_text', message_text,
+                       'reply_text', reply_text,
+                       'pipeline_used', pipeline_used) ORDER BY date), '[]'::json)
+            FROM recent) AS history"""
+_LOAD_SESSION = STATEMENTS.register("load_session", _LOAD_SESSION_SQL)
+
+
+def _session(user_style: str | None, chat_style: str | None, history: list[dict]) -> dict:
+    return {
+        "user_style": user_style,
+        "chat_style": chat_style,
+        "history": history,
+        "last_message_context": dict(history[-1]) if history else None,
+    }
+
+
+def _session_from_row(row: dict, pending: list[dict] | None = None) -> dict:
+    history = _merge_pending(list(row["history"] or []), pending or [], SESSION_CACHE.history_size)
+    return _session(row["user_style"], row["chat_style"], history)
+
+
+def load_session(user_id: int, chat_id: int, chat_type: str, timeout: float | None = None) -> dict:
+    """Create the user/chat rows if missing and load what a message needs up front.
+
+    One statement instead of get_or_create_user + get_or_create_chat +
+    get_last_message_context + get_user_style + get_chat_style, and none when
+    all of it is in `SESSION_CACHE`. Existing rows are not rewritten (ON
+    CONFLICT DO NOTHING, then read). Returns `user_style`, `chat_style`,
+    `history` (newest `SESSION_CACHE.history_size` messages, oldest first) and
+    `last_message_context` (dict or None).
+    """
+    if _session_cache_ready():
+        user_style = SESSION_CACHE.user_style(user_id)
+        chat_style = SESSION_CACHE.chat_style(chat_id)
+        history = SESSION_CACHE.history(chat_id, user_id)
+        if all(value is not MISS for value in (user_style, chat_style, history)):
+            return _session(user_style, chat_style, history)
+    token = SESSION_CACHE.token()
+    pending = _pending_messages(chat_id, user_id)
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(
+            cur,
+            _LOAD_SESSION,
+            {"user_id": user_id, "chat_id": chat_id, "chat_type": chat_type,
+             "history_limit": SESSION_CACHE.history_size},
+        )
+        session = _session_from_row(cur.fetchone(), pending)
+    _fill_session_cache(user_id, chat_id, session, token)
+    return session
+
+
+def _fill_session_cache(user_id: int, chat_id: int, session: dict, token: int) -> None:
+    if session["user_style"] is not None:
+        SESSION_CACHE.put_user_style(user_id, session["user_style"], token)
+    if session["chat_style"] is not None:
+        SESSION_CACHE.put_chat_style(chat_id, session["chat_style"], token)
+    SESSION_CACHE.put_history(chat_id, user_id, session["history"], token)
+
+
+# Write-behind persistence of messages_history (db/message_writer.py). Off by
+# default: save_message then INSERTs synchronously.
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "off").strip().lower() in ("on", "1", "true")
+
+_INSERT_MESSAGES_SQL = """
+    INSERT INTO messages_history
+        (message_id, chat_id, user_id, tg_message_id, date, message_text, reply_text, pipeline_used)
+    SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::bigint[], %s::bigint[],
+                         %s::timestamptz[], %s::text[], %s::text[], %s::text[])
+    ON CONFLICT (message_id, date) DO NOTHING"""
+
+_INSERT_STAGE_TIMINGS_SQL = """
+    INSERT INTO message_stage_timings (message_id, pipeline_used, total_ms, timings)
+    SELECT * FROM unnest(%s::bigint[], %s::text[], %s::integer[], %s::jsonb[])
+    ON CONFLICT (message_id) DO NOTHING"""
+
+_INSERT_MESSAGES = STATEMENTS.register("insert_messages", _INSERT_MESSAGES_SQL)
+_INSERT_STAGE_TIMINGS = STATEMENTS.register("insert_stage_timings", _INSERT_STAGE_TIMINGS_SQL)
+_RESERVE_MESSAGE_IDS = STATEMENTS.register(
+    "reserve_message_ids",
+    "SELECT nextval(pg_get_serial_sequence('messages_history', 'message_id')) AS id "
+    "FROM generate_series(1, %s::integer)",
+)
+
+
+def _reserve_message_ids(count: int) -> list[int]:
+    with db_cursor() as cur:
+        STATEMENTS.execute(cur, _RESERVE_MESSAGE_IDS, (count,))
+        return [row["id"] for row in cur.fetchall()]
+
+
+def _write_message_batch(messages: list[dict], timings: list[dict]) -> None:
+    """Insert queued messages and stage timings in one transaction."""
+    with db_cursor() as cur:
+        if messages:
+            columns = ("message_id", "chat_id", "user_id", "tg_message_id", "date",
+                       "message_text", "reply_text", "pipeline_used")
+            STATEMENTS.execute(cur, _INSERT_MESSAGES, [[m[c] for m in messages] for c in columns])
+        if timings:
+            columns = ("message_id", "pipeline_used", "total_ms", "timings")
+            STATEMENTS.execute(cur, _INSERT_STAGE_TIMINGS, [[t[c] for t in timings] for c in columns])
+
+
+MESSAGE_WRITER = MessageWriter(
+    write_batch=_write_message_batch,
+    reserve_ids=_reserve_message_ids,
+    batch_size=int(os.getenv("MESSAGE_WRITE_BEHIND_BATCH", "100")),
+    flush_interval=float(os.getenv("MESSAGE_WRITE_BEHIND_FLUSH_MS", "200")) / 1000,
+)
+atexit.register(MESSAGE_WRITER.stop)
+
+
+def _pending_messages(chat_id: int, user_id: int | None) -> list[dict]:
+    """This process's not yet written messages of a conversation (write-behind only)."""
+    if not MESSAGE_WRITE_BEHIND or not user_id:
+        return []
+    return [
+        {k: row[k] for k in ("message_id", "message_text", "reply_text", "pipeline_used")}
+        for row in MESSAGE_WRITER.pending_messages(chat_id, user_id)
+    ]
+
+
+def _merge_pending(rows: list[dict], pending: list[dict], limit: int) -> list[dict]:
+    """Append pending rows the DB result does not have yet; keep the newest `limit`."""
+    if not pending:
+        return rows
+    written = {row.get("message_id") for row in rows}
+    merged = rows + [row for row in pending if row["message_id"] not in written]
+    return merged[-limit:] if limit > 0 else []
+
+
+_INSERT_MESSAGE = STATEMENTS.register(
+    "insert_message",
+    """INSERT INTO messages_history
+       (chat_id, user_id, tg_message_id, message_text, reply_text, pipeline_used)
+       VALUES (%s, %s, %s, %s, %s, %s)
+       RETURNING message_id""",
+)
+
 
 def save_message(
     chat_id: int,
@@ -112,204 +436,1075 @@ def save_message(
     reply_text: str,
     tg_message_id: int = None,
     pipeline_used: str = None,
-):
-    with db_cursor() as cur:
-        cur.execute(
-            """INSERT INTO messages_history
-               (chat_id, user_id, tg_message_id, message_text, reply_text, pipeline_used)
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (chat_id, user_id, tg_message_id, message_text, reply_text, pipeline_used),
+) -> int:
+    """Persist one exchange and return its message_id.
+
+    With MESSAGE_WRITE_BEHIND the row is queued and written within
+    MESSAGE_WRITE_BEHIND_FLUSH_MS; this process reads it back meanwhile.
+    """
+    if MESSAGE_WRITE_BEHIND:
+        message_id = _enqueue_message(chat_id, user_id, message_text, reply_text, tg_message_id, pipeline_used)
+    else:
+        with db_cursor() as cur:
+            STATEMENTS.execute(
+                cur,
+                _INSERT_MESSAGE,
+                (chat_id, user_id, tg_message_id, message_text, reply_text, pipeline_used),
+            )
+            message_id = cur.fetchone()["message_id"]
+    _cache_message(chat_id, user_id, message_id, message_text, reply_text, pipeline_used)
+    return message_id
+
+
+def _enqueue_message(
+    chat_id: int,
+    user_id: int,
+    message_text: str,
+    reply_text: str,
+    tg_message_id: int | None,
+    pipeline_used: str | None,
+) -> int:
+    """Queue one exchange on MESSAGE_WRITER; may reserve an id block (blocking)."""
+    message_id = MESSAGE_WRITER.next_id()
+    MESSAGE_WRITER.enqueue_message({
+        "message_id": message_id,
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "tg_message_id": tg_message_id,
+        "date": datetime.now(timezone.utc),
+        "message_text": message_text,
+        "reply_text": reply_text,
+        "pipeline_used": pipeline_used,
+    })
+    return message_id
+
+
+def _cache_message(
+    chat_id: int,
+    user_id: int,
+    message_id: int,
+    message_text: str,
+    reply_text: str,
+    pipeline_used: str | None,
+) -> None:
+    if user_id:
+        SESSION_CACHE.append_message(
+            chat_id,
+            user_id,
+            {"message_id": message_id, "message_text": message_text,
+             "reply_text": reply_text, "pipeline_used": pipeline_used},
         )
 
 
-def get_chat_history(chat_id: int, user_id: int = None, limit: int = 10) -> list[dict]:
+def ensure_message_partitions(months_ahead: int = 3) -> int:
+    """Create missing monthly messages_history partitions; returns how many."""
     with db_cursor() as cur:
+        cur.execute("SELECT ensure_messages_history_partitions(current_date, %s) AS created", (months_ahead,))
+        return cur.fetchone()["created"]
+
+
+# A long-running process re-checks the partitions on this interval, so the
+# months ahead are created without a restart or an external cron job.
+_PARTITION_CHECK_SECONDS = float(os.getenv("MESSAGES_PARTITION_CHECK_HOURS", "24")) * 3600
+_partition_thread: threading.Thread | None = None
+_partition_lock = threading.Lock()
+
+
+def _keep_message_partitions() -> None:
+    while True:
+        time.sleep(_PARTITION_CHECK_SECONDS)
+        try:
+            created = ensure_message_partitions()
+        except Exception as e:
+            logger.warning(f"Could not check messages_history partitions, will retry: {e}")
+            continue
+        if created:
+            logger.info(f"Created {created} messages_history partition(s)")
+
+
+def start_partition_maintenance() -> None:
+    """Run `ensure_message_partitions()` every MESSAGES_PARTITION_CHECK_HOURS in a daemon thread."""
+    global _partition_thread
+    if _partition_thread is None:
+        with _partition_lock:
+            if _partition_thread is None:
+                _partition_thread = threading.Thread(
+                    target=_keep_message_partitions, name="message-partitions", daemon=True
+                )
+                _partition_thread.start()
+
+
+_CHAT_HISTORY = STATEMENTS.register(
+    "chat_history",
+    """SELECT message_id, message_text, reply_text FROM messages_history
+       WHERE chat_id = %s AND user_id = %s
+       ORDER BY date DESC LIMIT %s""",
+)
+_CHAT_HISTORY_ANY_USER = STATEMENTS.register(
+    "chat_history_any_user",
+    """SELECT message_id, message_text, reply_text FROM messages_history
+       WHERE chat_id = %s
+       ORDER BY date DESC LIMIT %s""",
+)
+_LAST_MESSAGE_CONTEXT = STATEMENTS.register(
+    "last_message_context",
+    """SELECT message_text, reply_text, pipeline_used
+       FROM messages_history
+       WHERE chat_id = %s AND user_id = %s
+       ORDER BY date DESC
+       LIMIT 1""",
+)
+_LAST_MESSAGE_CONTEXT_ANY_USER = STATEMENTS.register(
+    "last_message_context_any_user",
+    """SELECT message_text, reply_text, pipeline_used
+       FROM messages_history
+       WHERE chat_id = %s
+       ORDER BY date DESC
+       LIMIT 1""",
+)
+
+
+def get_chat_history(chat_id: int, user_id: int = None, limit: int = 10, timeout: float | None = None) -> list[dict]:
+    if user_id and _session_cache_ready():
+        cached = SESSION_CACHE.history(chat_id, user_id, limit)
+        if cached is not MISS:
+            return [{"message_text": r["message_text"], "reply_text": r["reply_text"]} for r in cached]
+    pending = _pending_messages(chat_id, user_id)
+    with db_cursor(timeout) as cur:
         if user_id:
-            cur.execute(
-                """SELECT message_text, reply_text FROM messages_history
-                   WHERE chat_id = %s AND user_id = %s
-                   ORDER BY date DESC LIMIT %s""",
-                (chat_id, user_id, limit),
-            )
+            STATEMENTS.execute(cur, _CHAT_HISTORY, (chat_id, user_id, limit))
+        else:
+            STATEMENTS.execute(cur, _CHAT_HISTORY_ANY_USER, (chat_id, limit))
+        rows = _merge_pending([dict(r) for r in cur.fetchall()][::-1], pending, limit)
+    return [{"message_text": r["message_text"], "reply_text": r["reply_text"]} for r in rows]
+
+
+def get_last_message_context(chat_id: int, user_id: int = None, timeout: float | None = None) -> dict | None:
+    if user_id and _session_cache_ready():
+        cached = SESSION_CACHE.history(chat_id, user_id, 1)
+        if cached is not MISS:
+            return cached[-1] if cached else None
+    pending = _pending_messages(chat_id, user_id)
+    if pending:
+        return {k: v for k, v in pending[-1].items() if k != "message_id"}
+    with db_cursor(timeout) as cur:
+        if user_id:
+            STATEMENTS.execute(cur, _LAST_MESSAGE_CONTEXT, (chat_id, user_id))
         else:
-            cur.execute(
-                """SELECT message_text, reply_text FROM messages_history
-                   WHERE chat_id = %s
-                   ORDER BY date DESC LIMIT %s""",
-                (chat_id, limit),
+            STATEMENTS.execute(cur, _LAST_MESSAGE_CONTEXT_ANY_USER, (chat_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+# Local near-duplicate probes for problems/solutions; None unless
+# EMBEDDING_STORE_DIR is set (see db/embedding_store.py).
+PROBLEM_STORE = open_store("problems")
+SOLUTION_STORE = open_store("solutions")
+# A store answers "no duplicate" only while it holds at least as many rows as
+# its table (re-counted at most this often); an empty, unbuilt or lagging
+# store leaves the probe to SQL.
+_STORE_CHECK_SECONDS = float(os.getenv("EMBEDDING_STORE_CHECK_SECONDS", "60"))
+_store_checks: dict[str, tuple[float, bool]] = {}  # store path -> (checked at, usable)
+
+
+def _store_usable(store: EmbeddingStore | None, table: str) -> bool:
+    if store is None:
+        return False
+    now = time.monotonic()
+    checked = _store_checks.get(store.path)
+    if checked is not None and now - checked[0] < _STORE_CHECK_SECONDS:
+        return checked[1]
+    try:
+        stored = len(store)
+        rows = None
+        if stored:
+            with db_cursor() as cur:
+                cur.execute(f"SELECT count(*) AS rows FROM {table}")
+                rows = cur.fetchone()["rows"]
+        usable = rows is not None and stored >= rows
+        if not usable:
+            state = f"has {stored} of {rows} {table} rows" if stored else "is empty or not built"
+            logger.warning(
+                f"Embedding store {store.path} {state}, using the database; "
+                f"run scripts/rebuild_embedding_store.py"
             )
-        return [dict(r) for r in cur.fetchall()][::-1]
+    except Exception as e:
+        logger.warning(f"Could not check embedding store {store.path}, using the database: {e}")
+        usable = False
+    _store_checks[store.path] = (now, usable)
+    return usable
 
 
-def get_last_message_context(chat_id: int, user_id: int = None) -> dict | None:
-    with db_cursor() as cur:
-        if user_id:
-            cur.execute(
-                """SELECT message_text, reply_text, pipeline_used
-                   FROM messages_history
-                   WHERE chat_id = %s AND user_id = %s
-                   ORDER BY date DESC
-                   LIMIT 1""",
-                (chat_id, user_id),
-            )
+def _store_duplicate(store: EmbeddingStore | None, embedding: Embedding) -> int | None | bool:
+    """Near-duplicate id from the local store, None for no match, False if unusable."""
+    if store is None:
+        return False
+    try:
+        match = store.nearest(embedding)
+    except Exception as e:
+        logger.warning(f"Embedding store probe failed, using the database: {e}")
+        return False
+    if match is None:
+        return False  # empty or missing file: no answer, not "no match"
+    if match[1] > DUPLICATE_SIMILARITY:
+        return match[0]
+    return None
+
+
+def _store_append(store: EmbeddingStore | None, item_id: int, embedding: Embedding) -> None:
+    if store is None:
+        return
+    try:
+        store.append(item_id, embedding)
+    except Exception as e:
+        # The store now lags its table: probe in SQL until the next count says otherwise.
+        _store_checks[store.path] = (time.monotonic(), False)
+        logger.warning(f"Could not append id={item_id} to {store.path}; rebuild the store: {e}")
+
+
+def _store_forget(store: EmbeddingStore | None, item_id: int) -> None:
+    if store is None:
+        return
+    try:
+        store.forget(item_id)
+    except Exception as e:
+        logger.warning(f"Could not remove id={item_id} from {store.path}; rebuild the store: {e}")
+
+
+def _upsert_entities_sql(table: str, id_column: str, vectors_param: str = "%s::text[]") -> str:
+    """One statement: LATERAL nearest-neighbour probe, conditional insert, ids by ordinal.
+
+    Ids of new rows are drawn from the identity sequence up front so each maps
+    back to its input ordinal (RETURNING cannot see the input rows).
+    """
+    return f"""WITH input AS (
+            SELECT ord, name, context, content, vec::vector AS vec, probe
+            FROM unnest(%s::text[], %s::text[], %s::text[], {vectors_param}, %s::bool[])
+                 WITH ORDINALITY AS u(name, context, content, vec, probe, ord)
+        ),
+        nearest AS (
+            SELECT i.ord, n.{id_column}
+            FROM input i
+            CROSS JOIN LATERAL (
+                SELECT t.{id_column}, 1 - (t.embedding <=> i.vec) AS similarity
+                FROM {table} t
+                WHERE t.embedding IS NOT NULL
+                ORDER BY t.embedding <=> i.vec
+                LIMIT 1
+            ) n
+            WHERE i.probe AND n.similarity > %s
+        ),
+        fresh AS (
+            SELECT i.*, nextval(pg_get_serial_sequence('{table}', '{id_column}')) AS new_id
+            FROM input i
+            WHERE NOT EXISTS (SELECT 1 FROM nearest n WHERE n.ord = i.ord)
+        ),
+        inserted AS (
+            INSERT INTO {table} ({id_column}, name, context, content, embedding)
+            OVERRIDING SYSTEM VALUE
+            SELECT new_id, name, context, content, vec FROM fresh
+        )
+        SELECT i.ord, coalesce(n.{id_column}, f.new_id) AS id, f.new_id IS NOT NULL AS inserted
+        FROM input i
+        LEFT JOIN nearest n ON n.ord = i.ord
+        LEFT JOIN fresh f ON f.ord = i.ord
+        ORDER BY i.ord"""
+
+
+def _store_probe(
+    store: EmbeddingStore | None, table: str, entities: list[dict]
+) -> tuple[list[int | None], list[tuple[int, bool]]]:
+    """Ids the local store already resolves, and (index, probe in SQL?) for the rest."""
+    ids: list[int | None] = [None] * len(entities)
+    pending = []
+    usable = _store_usable(store, table)
+    for index, entity in enumerate(entities):
+        duplicate = _store_duplicate(store, entity["embedding"]) if usable else False
+        if duplicate:
+            ids[index] = duplicate
         else:
-            cur.execute(
-                """SELECT message_text, reply_text, pipeline_used
-                   FROM messages_history
-                   WHERE chat_id = %s
-                   ORDER BY date DESC
-                   LIMIT 1""",
-                (chat_id,),
+            pending.append((index, duplicate is False))
+    return ids, pending
+
+
+_UPSERT_ENTITIES = {
+    table: STATEMENTS.register(f"upsert_{table}", _upsert_entities_sql(table, id_column))
+    for table, id_column in (("problems", "problem_id"), ("solutions", "solution_id"))
+}
+
+
+def _upsert_entities(
+    table: str, id_column: str, store: EmbeddingStore | None, entities: list[dict], timeout: float | None
+) -> list[int]:
+    """Dedup-probe and insert `entities` (name/context/content/embedding) in one statement.
+
+    Each entity reuses the id of its nearest stored row when cosine similarity
+    exceeds DUPLICATE_SIMILARITY, otherwise it is inserted. Entities are not
+    deduplicated against each other. Returns ids in input order.
+    """
+    if not entities:
+        return []
+    ids, pending = _store_probe(store, table, entities)
+    if pending:
+        with db_cursor(timeout) as cur:
+            STATEMENTS.execute(
+                cur,
+                _UPSERT_ENTITIES[table],
+                (
+                    [entities[index]["name"] for index, _ in pending],
+                    [entities[index]["context"] for index, _ in pending],
+                    [entities[index]["content"] for index, _ in pending],
+                    [to_pgvector(entities[index]["embedding"]) for index, _ in pending],
+                    [probe for _, probe in pending],
+                    DUPLICATE_SIMILARITY,
+                ),
             )
-        row = cur.fetchone()
-        return dict(row) if row else None
+            rows = cur.fetchall()
+        for (index, _), row in zip(pending, rows):
+            ids[index] = row["id"]
+            if row["inserted"]:
+                _store_append(store, row["id"], entities[index]["embedding"])
+    return ids
+
 
-def upsert_problem(name: str, context: str, content: str, embedding: list[float]) -> int:
+def upsert_problems(entities: list[dict], timeout: float | None = None) -> list[int]:
+    """Insert problems unless near-duplicates exist; ids in input order."""
+    return _upsert_entities("problems", "problem_id", PROBLEM_STORE, entities, timeout)
+
+
+def upsert_solutions(entities: list[dict], timeout: float | None = None) -> list[int]:
+    """Insert solutions unless near-duplicates exist; ids in input order."""
+    return _upsert_entities("solutions", "solution_id", SOLUTION_STORE, entities, timeout)
+
+
+def upsert_problem(name: str, context: str, content: str, embedding: Embedding, timeout: float | None = None) -> int:
     """Insert a problem if cosine similarity to existing ones is below threshold."""
-    with db_cursor() as cur:
-        embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
-        cur.execute(
-            """SELECT problem_id, 1 - (embedding <=> %s::vector) AS similarity
-               FROM problems
-               WHERE embedding IS NOT NULL
-               ORDER BY embedding <=> %s::vector
-               LIMIT 1""",
-            (embedding_str, embedding_str),
-        )
-        row = cur.fetchone()
-        if row and row["similarity"] > 0.92:
-            return row["problem_id"]  # reuse existing problem
-        cur.execute(
-            """INSERT INTO problems (name, context, content, embedding)
-               VALUES (%s, %s, %s, %s::vector) RETURNING problem_id""",
-            (name, context, content, embedding_str),
-        )
-        return cur.fetchone()["problem_id"]
+    entity = {"name": name, "context": context, "content": content, "embedding": embedding}
+    return upsert_problems([entity], timeout=timeout)[0]
 
 
-def upsert_solution(name: str, context: str, content: str, embedding: list[float]) -> int:
+def upsert_solution(name: str, context: str, content: str, embedding: Embedding, timeout: float | None = None) -> int:
     """Insert a solution if not a near-duplicate."""
-    with db_cursor() as cur:
-        embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
+    entity = {"name": name, "context": context, "content": content, "embedding": embedding}
+    return upsert_solutions([entity], timeout=timeout)[0]
+
+
+def link_problem_solution(problem_id: int, solution_id: int, score: float, timeout: float | None = None):
+    link_problems_solutions([(problem_id, solution_id, score)], timeout=timeout)
+
+
+_LINK_PAIRS_SQL = """INSERT INTO problems_solutions (problem_id, solution_id, similarity_score)
+    SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::float8[])
+    ON CONFLICT (problem_id, solution_id) DO UPDATE SET similarity_score = EXCLUDED.similarity_score"""
+_LINK_PAIRS = STATEMENTS.register("link_problems_solutions", _LINK_PAIRS_SQL)
+
+
+def _link_pair_arrays(pairs: list[tuple[int, int, float]]) -> tuple[list[int], list[int], list[float]] | None:
+    """Column arrays for `_LINK_PAIRS_SQL`; repeated pairs keep their highest score
+    (an upsert cannot touch the same row twice). None if there are no pairs."""
+    best: dict[tuple[int, int], float] = {}
+    for problem_id, solution_id, score in pairs:
+        key = (problem_id, solution_id)
+        best[key] = max(score, best.get(key, score))
+    if not best:
+        return None
+    return [p for p, _ in best], [s for _, s in best], list(best.values())
+
+
+def link_problems_solutions(pairs: list[tuple[int, int, float]], timeout: float | None = None):
+    """Write many (problem_id, solution_id, score) links in one statement."""
+    arrays = _link_pair_arrays(pairs)
+    if arrays is None:
+        return
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _LINK_PAIRS, arrays)
+
+
+# ── Catalog vector search ────────────────────────────────────────────────
+def _load_catalog(timeout: float | None = None) -> tuple[list[dict], list[dict]]:
+    """Organization and project rows with embeddings, for the in-process index."""
+    with db_cursor(timeout) as cur:
         cur.execute(
-            """SELECT solution_id, 1 - (embedding <=> %s::vector) AS similarity
-               FROM solutions
-               WHERE embedding IS NOT NULL
-               ORDER BY embedding <=> %s::vector
-               LIMIT 1""",
-            (embedding_str, embedding_str),
+            """SELECT o.organization_id, o.name, o.description, o.website,
+                      ov.embedding::text AS embedding
+               FROM organizations o
+               JOIN organizations_vec ov ON o.organization_id = ov.organization_id
+               WHERE ov.embedding IS NOT NULL
+               ORDER BY o.organization_id"""
         )
-        row = cur.fetchone()
-        if row and row["similarity"] > 0.92:
-            return row["solution_id"]
+        orgs = [dict(r) for r in cur.fetchall()]
         cur.execute(
-            """INSERT INTO solutions (name, context, content, embedding)
-               VALUES (%s, %s, %s, %s::vector) RETURNING solution_id""",
-            (name, context, content, embedding_str),
+            """SELECT p.project_id, p.name, p.description,
+                      o.name AS org_name, o.website AS org_website,
+                      pv.embedding::text AS embedding
+               FROM projects p
+               JOIN projects_vec pv ON p.project_id = pv.project_id
+               LEFT JOIN organizations o ON p.organization_id = o.organization_id
+               WHERE pv.embedding IS NOT NULL
+               ORDER BY p.project_id"""
         )
-        return cur.fetchone()["solution_id"]
+        projects = [dict(r) for r in cur.fetchall()]
+    for row in orgs + projects:
+        row["embedding"] = parse_pgvector(row["embedding"])
+    return orgs, projects
 
 
-def link_problem_solution(problem_id: int, solution_id: int, score: float):
-    with db_cursor() as cur:
+def _catalog_fingerprint(timeout: float | None = None) -> tuple:
+    """Cheap summary that changes whenever catalog rows or vectors change."""
+    with db_cursor(timeout) as cur:
         cur.execute(
-            """INSERT INTO problems_solutions (problem_id, solution_id, similarity_score)
-               VALUES (%s, %s, %s)
-               ON CONFLICT (problem_id, solution_id) DO UPDATE SET similarity_score = EXCLUDED.similarity_score""",
-            (problem_id, solution_id, score),
+            """SELECT
+                   (SELECT count(*) FROM organizations_vec) AS org_vectors,
+                   (SELECT max(updated_at) FROM organizations_vec) AS org_vectors_at,
+                   (SELECT count(*) FROM projects_vec) AS project_vectors,
+                   (SELECT max(updated_at) FROM projects_vec) AS project_vectors_at,
+                   (SELECT md5(string_agg(concat_ws('|', organization_id, name, description, website),
+                                          '|' ORDER BY organization_id))
+                      FROM organizations) AS orgs_md5,
+                   (SELECT md5(string_agg(concat_ws('|', project_id, name, description, organization_id),
+                                          '|' ORDER BY project_id))
+                      FROM projects) AS projects_md5"""
         )
+        return tuple(cur.fetchone().values())
+
+
+def _invalidates_catalog(func):
+    """Mark the catalog index stale after a successful catalog write."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        CATALOG_INDEX.invalidate()
+        return result
+    return wrapper
+
+
+CATALOG_INDEX_ENABLED = os.getenv("CATALOG_INDEX", "on").strip().lower() not in ("off", "0", "false")
+CATALOG_INDEX = CatalogIndex(
+    _load_catalog,
+    _catalog_fingerprint,
+    check_interval=float(os.getenv("CATALOG_INDEX_CHECK_SECONDS", "30")),
+    hnsw_min_rows=int(os.getenv("CATALOG_INDEX_HNSW_MIN_ROWS", "50000")),
+)
+
+
+def find_orgs_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    if CATALOG_INDEX_ENABLED:
+        rows = CATALOG_INDEX.search_orgs(embedding, top_n, min_similarity, timeout=timeout)
+        if rows is not None:
+            return rows
+    return _sql_find_orgs_by_embedding(embedding, top_n, min_similarity, timeout=timeout)
+
+
+def find_projects_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    if CATALOG_INDEX_ENABLED:
+        rows = CATALOG_INDEX.search_projects(embedding, top_n, min_similarity, timeout=timeout)
+        if rows is not None:
+            return rows
+    return _sql_find_projects_by_embedding(embedding, top_n, min_similarity, timeout=timeout)
+
+
+# Vector parameters are sent once per statement: a one-row CTE holds the
+# vector and the ORDER BY reads it through an uncorrelated scalar subquery,
+# which Postgres evaluates once (InitPlan) and which the HNSW index accepts.
+_ORGS_BY_EMBEDDING = STATEMENTS.register(
+    "orgs_by_embedding",
+    """WITH q AS (SELECT %s::vector AS vec)
+       SELECT organization_id, name, description, website, similarity FROM (
+           SELECT o.organization_id, o.name, o.description, o.website,
+                  1 - (ov.embedding <=> (SELECT vec FROM q)) AS similarity
+           FROM organizations o
+           JOIN organizations_vec ov ON o.organization_id = ov.organization_id
+           WHERE ov.embedding IS NOT NULL
+           ORDER BY ov.embedding <=> (SELECT vec FROM q)
+           LIMIT %s
+       ) ranked
+       WHERE similarity >= %s""",
+)
+_PROJECTS_BY_EMBEDDING = STATEMENTS.register(
+    "projects_by_embedding",
+    """WITH q AS (SELECT %s::vector AS vec)
+       SELECT project_id, name, description, org_name, org_website, similarity FROM (
+           SELECT p.project_id, p.name, p.description,
+                  o.name AS org_name, o.website AS org_website,
+                  1 - (pv.embedding <=> (SELECT vec FROM q)) AS similarity
+           FROM projects p
+           JOIN projects_vec pv ON p.project_id = pv.project_id
+           LEFT JOIN organizations o ON p.organization_id = o.organization_id
+           WHERE pv.embedding IS NOT NULL
+           ORDER BY pv.embedding <=> (SELECT vec FROM q)
+           LIMIT %s
+       ) ranked
+       WHERE similarity >= %s""",
+)
+
+
+def _sql_find_orgs_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    embedding_str = to_pgvector(embedding)
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _ORGS_BY_EMBEDDING, (embedding_str, top_n, min_similarity))
+        return [dict(r) for r in cur.fetchall()]
 
-def find_orgs_by_embedding(embedding: list[float], top_n: int = 5, min_similarity: float = 0.0) -> list[dict]:
-    embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
-    with db_cursor() as cur:
-        cur.execute(
-            """SELECT organization_id, name, description, website, similarity FROM (
-                   SELECT o.organization_id, o.name, o.description, o.website,
-                          1 - (ov.embedding <=> %s::vector) AS similarity
-                   FROM organizations o
-                   JOIN organizations_vec ov ON o.organization_id = ov.organization_id
-                   WHERE ov.embedding IS NOT NULL
-                   ORDER BY ov.embedding <=> %s::vector
-                   LIMIT %s
-               ) ranked
-               WHERE similarity >= %s""",
-            (embedding_str, embedding_str, top_n, min_similarity),
-        )
+
+def _sql_find_projects_by_embedding(
+    embedding: Embedding, top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[dict]:
+    embedding_str = to_pgvector(embedding)
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _PROJECTS_BY_EMBEDDING, (embedding_str, top_n, min_similarity))
         return [dict(r) for r in cur.fetchall()]
 
 
-def find_projects_by_embedding(embedding: list[float], top_n: int = 5, min_similarity: float = 0.0) -> list[dict]:
-    embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
-    with db_cursor() as cur:
-        cur.execute(
-            """SELECT project_id, name, description, org_name, org_website, similarity FROM (
-                   SELECT p.project_id, p.name, p.description,
-                          o.name AS org_name, o.website AS org_website,
-                          1 - (pv.embedding <=> %s::vector) AS similarity
-                   FROM projects p
-                   JOIN projects_vec pv ON p.project_id = pv.project_id
-                   LEFT JOIN organizations o ON p.organization_id = o.organization_id
-                   WHERE pv.embedding IS NOT NULL
-                   ORDER BY pv.embedding <=> %s::vector
-                   LIMIT %s
-               ) ranked
-               WHERE similarity >= %s""",
-            (embedding_str, embedding_str, top_n, min_similarity),
-        )
+def _by_embeddings_sql(nearest_sql: str, vectors_param: str = "%s::text[]") -> str:
+    """Run `nearest_sql` (a LATERAL top-n over `q.vec`) for every vector in one statement."""
+    return f"""SELECT q.ord, ranked.* FROM
+                   (SELECT vec::vector AS vec, ord
+                    FROM unnest({vectors_param}) WITH ORDINALITY AS u(vec, ord)) q
+                CROSS JOIN LATERAL ({nearest_sql}) ranked
+                WHERE ranked.similarity >= %s
+                ORDER BY q.ord, ranked.similarity DESC"""
+
+
+_NEAREST_ORGS_SQL = """SELECT o.organization_id, o.name, o.description, o.website,
+                  1 - (ov.embedding <=> q.vec) AS similarity
+           FROM organizations o
+           JOIN organizations_vec ov ON o.organization_id = ov.organization_id
+           WHERE ov.embedding IS NOT NULL
+           ORDER BY ov.embedding <=> q.vec
+           LIMIT %s"""
+_NEAREST_PROJECTS_SQL = """SELECT p.project_id, p.name, p.description,
+                  o.name AS org_name, o.website AS org_website,
+                  1 - (pv.embedding <=> q.vec) AS similarity
+           FROM projects p
+           JOIN projects_vec pv ON p.project_id = pv.project_id
+           LEFT JOIN organizations o ON p.organization_id = o.organization_id
+           WHERE pv.embedding IS NOT NULL
+           ORDER BY pv.embedding <=> q.vec
+           LIMIT %s"""
+_ORGS_BY_EMBEDDINGS = STATEMENTS.register("orgs_by_embeddings", _by_embeddings_sql(_NEAREST_ORGS_SQL))
+_PROJECTS_BY_EMBEDDINGS = STATEMENTS.register("projects_by_embeddings", _by_embeddings_sql(_NEAREST_PROJECTS_SQL))
+
+
+def find_orgs_by_embeddings(
+    embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[list[dict]]:
+    """One ranked org list per query vector (same semantics as find_orgs_by_embedding)."""
+    if not embeddings:
+        return []
+    if CATALOG_INDEX_ENABLED:
+        ranked = CATALOG_INDEX.search_orgs_many(embeddings, top_n, min_similarity, timeout=timeout)
+        if ranked is not None:
+            return ranked
+    return _sql_find_by_embeddings(_ORGS_BY_EMBEDDINGS, embeddings, top_n, min_similarity, timeout)
+
+
+def find_projects_by_embeddings(
+    embeddings: list[Embedding], top_n: int = 5, min_similarity: float = 0.0, timeout: float | None = None
+) -> list[list[dict]]:
+    """One ranked project list per query vector (same semantics as find_projects_by_embedding)."""
+    if not embeddings:
+        return []
+    if CATALOG_INDEX_ENABLED:
+        ranked = CATALOG_INDEX.search_projects_many(embeddings, top_n, min_similarity, timeout=timeout)
+        if ranked is not None:
+            return ranked
+    return _sql_find_by_embeddings(_PROJECTS_BY_EMBEDDINGS, embeddings, top_n, min_similarity, timeout)
+
+
+def _sql_find_by_embeddings(
+    statement: Statement, embeddings: list[Embedding], top_n: int, min_similarity: float, timeout: float | None
+) -> list[list[dict]]:
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, statement, ([to_pgvector(e) for e in embeddings], top_n, min_similarity))
+        ranked: list[list[dict]] = [[] for _ in embeddings]
+        for r in cur.fetchall():
+            row = dict(r)
+            ranked[row.pop("ord") - 1].append(row)
+        return ranked
+
+
+# ── Catalog full-text search ─────────────────────────────────────────────
+# Ukrainian words are indexed unstemmed ('simple' config); trimming the last
+# letters of longer query words turns them into prefixes that also match other
+# inflections ("освіта" -> "осві:*" matches "освітні").
+_LEXICAL_STEM_MIN_LENGTH = 6
+_LEXICAL_MAX_TERMS = 8
+
+
+def _lexical_tsqueries(text: str) -> tuple[str, str] | None:
+    """(simple, english) `to_tsquery` inputs OR-ing the words of `text`; None if it has none."""
+    words = list(dict.fromkeys(w for w in re.findall(r"\w+", text.lower()) if len(w) > 1))[:_LEXICAL_MAX_TERMS]
+    if not words:
+        return None
+    prefixes = [w[:-2] if len(w) >= _LEXICAL_STEM_MIN_LENGTH else w for w in words]
+    return " | ".join(f"{p}:*" for p in prefixes), " | ".join(f"{w}:*" for w in words)
+
+
+_ORGS_BY_TEXT = STATEMENTS.register(
+    "orgs_by_text",
+    """WITH q AS (SELECT to_tsquery('simple', %s) AS uk, to_tsquery('english', %s) AS en)
+       SELECT o.organization_id, o.name, o.description, o.website,
+              ts_rank_cd(o.search_uk, q.uk) + ts_rank_cd(o.search_en, q.en) AS lexical_score
+       FROM organizations o, q
+       WHERE o.search_uk @@ q.uk OR o.search_en @@ q.en
+       ORDER BY lexical_score DESC, o.organization_id
+       LIMIT %s""",
+)
+_PROJECTS_BY_TEXT = STATEMENTS.register(
+    "projects_by_text",
+    """WITH q AS (SELECT to_tsquery('simple', %s) AS uk, to_tsquery('english', %s) AS en)
+       SELECT p.project_id, p.name, p.description,
+              o.name AS org_name, o.website AS org_website,
+              ts_rank_cd(p.search_uk, q.uk) + ts_rank_cd(p.search_en, q.en) AS lexical_score
+       FROM projects p
+       CROSS JOIN q
+       LEFT JOIN organizations o ON p.organization_id = o.organization_id
+       WHERE p.search_uk @@ q.uk OR p.search_en @@ q.en
+       ORDER BY lexical_score DESC, p.project_id
+       LIMIT %s""",
+)
+
+
+def find_orgs_by_text(text: str, top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    """Organizations ranked by full-text match of `text` (GIN-indexed, no embedding needed)."""
+    tsqueries = _lexical_tsqueries(text)
+    if tsqueries is None:
+        return []
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _ORGS_BY_TEXT, (*tsqueries, top_n))
         return [dict(r) for r in cur.fetchall()]
 
 
-def find_orgs_via_solutions(problem_ids: list[int], top_n: int = 5) -> list[dict]:
+def find_projects_by_text(text: str, top_n: int = 5, timeout: float | None = None) -> list[dict]:
+    """Projects ranked by full-text match of `text` (GIN-indexed, no embedding needed)."""
+    tsqueries = _lexical_tsqueries(text)
+    if tsqueries is None:
+        return []
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _PROJECTS_BY_TEXT, (*tsqueries, top_n))
+        return [dict(r) for r in cur.fetchall()]
+
+
+# Problem ids go in as one array parameter, so the statement text (and its
+# prepared plan) is the same for any number of problems.
+_ORGS_VIA_SOLUTIONS = STATEMENTS.register(
+    "orgs_via_solutions",
+    """SELECT o.organization_id, o.name, o.description, o.website,
+              SUM(ps.similarity_score * os.similarity_score) AS combined_score
+       FROM problems_solutions ps
+       JOIN organizations_solutions os ON ps.solution_id = os.solution_id
+       JOIN organizations o ON os.organization_id = o.organization_id
+       WHERE ps.problem_id = ANY(%s::bigint[])
+       GROUP BY o.organization_id, o.name, o.description, o.website
+       ORDER BY combined_score DESC
+       LIMIT %s""",
+)
+_PROJECTS_VIA_SOLUTIONS = STATEMENTS.register(
+    "projects_via_solutions",
+    """SELECT p.project_id, p.name, p.description,
+              o.name AS org_name, o.website AS org_website,
+              SUM(ps.similarity_score * prs.similarity_score) AS combined_score
+       FROM problems_solutions ps
+       JOIN projects_solutions prs ON ps.solution_id = prs.solution_id
+       JOIN projects p ON prs.project_id = p.project_id
+       LEFT JOIN organizations o ON p.organization_id = o.organization_id
+       WHERE ps.problem_id = ANY(%s::bigint[])
+       GROUP BY p.project_id, p.name, p.description, o.name, o.website
+       ORDER BY combined_score DESC
+       LIMIT %s""",
+)
+
+
+def find_orgs_via_solutions(problem_ids: list[int], top_n: int = 5, timeout: float | None = None) -> list[dict]:
     """Ranked orgs by chaining problems→solutions→organizations similarity scores."""
     if not problem_ids:
         return []
-    placeholders = ",".join(["%s"] * len(problem_ids))
-    with db_cursor() as cur:
-        cur.execute(
-            f"""SELECT o.organization_id, o.name, o.description, o.website,
-                       SUM(ps.similarity_score * os.similarity_score) AS combined_score
-                FROM problems_solutions ps
-                JOIN organizations_solutions os ON ps.solution_id = os.solution_id
-                JOIN organizations o ON os.organization_id = o.organization_id
-                WHERE ps.problem_id IN ({placeholders})
-                GROUP BY o.organization_id, o.name, o.description, o.website
-                ORDER BY combined_score DESC
-                LIMIT %s""",
-            (*problem_ids, top_n),
-        )
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _ORGS_VIA_SOLUTIONS, (list(problem_ids), top_n))
         return [dict(r) for r in cur.fetchall()]
 
 
-def find_projects_via_solutions(problem_ids: list[int], top_n: int = 5) -> list[dict]:
+def find_projects_via_solutions(problem_ids: list[int], top_n: int = 5, timeout: float | None = None) -> list[dict]:
     if not problem_ids:
         return []
-    placeholders = ",".join(["%s"] * len(problem_ids))
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(cur, _PROJECTS_VIA_SOLUTIONS, (list(problem_ids), top_n))
+        return [dict(r) for r in cur.fetchall()]
+
+
+# ── Combined retrieval ───────────────────────────────────────────────────
+def _recommendations_sql(vectors_param: str = "%(vectors)s::text[]") -> str:
+    return f"""
+    WITH graph_orgs AS (
+        SELECT o.organization_id AS item_id, o.name, o.description, o.website,
+               NULL::text AS org_name, NULL::text AS org_website,
+               SUM(ps.similarity_score * os.similarity_score) AS score
+        FROM problems_solutions ps
+        JOIN organizations_solutions os ON ps.solution_id = os.solution_id
+        JOIN organizations o ON os.organization_id = o.organization_id
+        WHERE ps.problem_id = ANY(%(problem_ids)s::bigint[])
+        GROUP BY o.organization_id
+        ORDER BY score DESC
+        LIMIT %(top_n)s
+    ),
+    graph_projects AS (
+        SELECT p.project_id AS item_id, p.name, p.description, NULL::varchar AS website,
+               o.name AS org_name, o.website::text AS org_website,
+               SUM(ps.similarity_score * prs.similarity_score) AS score
+        FROM problems_solutions ps
+        JOIN projects_solutions prs ON ps.solution_id = prs.solution_id
+        JOIN projects p ON prs.project_id = p.project_id
+        LEFT JOIN organizations o ON p.organization_id = o.organization_id
+        WHERE ps.problem_id = ANY(%(problem_ids)s::bigint[])
+        GROUP BY p.project_id, o.organization_id
+        ORDER BY score DESC
+        LIMIT %(top_n)s
+    ),
+    graph AS (
+        SELECT 'organization' AS kind, * FROM graph_orgs
+        UNION ALL
+        SELECT 'project', * FROM graph_projects
+    ),
+    -- The vector path runs only when the graph path found nothing.
+    q AS (
+        SELECT vec::vector AS vec, ord
+        FROM unnest({vectors_param}) WITH ORDINALITY AS u(vec, ord)
+        WHERE NOT EXISTS (SELECT 1 FROM graph)
+    ),
+    vector_orgs AS (
+        SELECT q.ord, ranked.* FROM q CROSS JOIN LATERAL (
+            SELECT o.organization_id AS item_id, o.name, o.description, o.website,
+                   NULL::text AS org_name, NULL::text AS org_website,
+                   1 - (ov.embedding <=> q.vec) AS score
+            FROM organizations o
+            JOIN organizations_vec ov ON o.organization_id = ov.organization_id
+            WHERE ov.embedding IS NOT NULL
+            ORDER BY ov.embedding <=> q.vec
+            LIMIT %(fallback_top_n)s
+        ) ranked
+        WHERE ranked.score >= %(min_similarity)s
+    ),
+    vector_projects AS (
+        SELECT q.ord, ranked.* FROM q CROSS JOIN LATERAL (
+            SELECT p.project_id AS item_id, p.name, p.description, NULL::varchar AS website,
+                   o.name AS org_name, o.website::text AS org_website,
+                   1 - (pv.embedding <=> q.vec) AS score
+            FROM projects p
+            JOIN projects_vec pv ON p.project_id = pv.project_id
+            LEFT JOIN organizations o ON p.organization_id = o.organization_id
+            WHERE pv.embedding IS NOT NULL
+            ORDER BY pv.embedding <=> q.vec
+            LIMIT %(fallback_top_n)s
+        ) ranked
+        WHERE ranked.score >= %(min_similarity)s
+    )
+    SELECT 'graph' AS source, NULL::bigint AS ord, kind, item_id, name, description, website,
+           org_name, org_website, score
+    FROM graph
+    UNION ALL
+    SELECT 'vector', ord, 'organization', item_id, name, description, website, org_name, org_website, score
+    FROM vector_orgs
+    UNION ALL
+    SELECT 'vector', ord, 'project', item_id, name, description, website, org_name, org_website, score
+    FROM vector_projects
+    ORDER BY source, kind, ord, score DESC"""
+
+
+_RECOMMENDATIONS = STATEMENTS.register("recommendations", _recommendations_sql())
+
+
+def _recommendation_row(row: dict) -> dict:
+    """Shape a combined-retrieval row like the `find_*` row of its kind and source."""
+    if row["kind"] == "organization":
+        shaped = {"organization_id": row["item_id"], "name": row["name"],
+                  "description": row["description"], "website": row["website"]}
+    else:
+        shaped = {"project_id": row["item_id"], "name": row["name"], "description": row["description"],
+                  "org_name": row["org_name"], "org_website": row["org_website"]}
+    if row["source"] == "graph":
+        shaped["combined_score"] = row["score"]
+    else:
+        shaped["similarity"] = row["score"]
+        shaped["query"] = row["ord"] - 1
+    shaped["source"] = row["source"]
+    return shaped
+
+
+def find_recommendations(
+    problem_ids: list[int],
+    embeddings: list[Embedding],
+    top_n: int = 5,
+    fallback_top_n: int = 3,
+    min_similarity: float = 0.0,
+    timeout: float | None = None,
+) -> tuple[list[dict], list[dict]]:
+    """Organizations and projects for a message in one round trip.
+
+    Graph path: rows linked to `problem_ids` through solutions, ranked like
+    `find_*_via_solutions` (`source` "graph", `combined_score`). Only when it
+    finds nothing, the vector path: the `fallback_top_n` nearest rows per
+    embedding with similarity >= `min_similarity` (`source` "vector",
+    `similarity`, `query` = index into `embeddings`), like `find_*_by_embeddings`.
+
+    With the in-process catalog index loaded, the vector path is served from
+    memory and the statement carries only the graph path.
+    """
+    snapshot = CATALOG_INDEX.get(timeout) if CATALOG_INDEX_ENABLED and embeddings else None
+    orgs: list[dict] = []
+    projects: list[dict] = []
+    if problem_ids or (embeddings and snapshot is None):
+        with db_cursor(timeout) as cur:
+            STATEMENTS.execute(
+                cur,
+                _RECOMMENDATIONS,
+                {
+                    "problem_ids": list(problem_ids),
+                    "vectors": [] if snapshot is not None else [to_pgvector(e) for e in embeddings],
+                    "top_n": top_n,
+                    "fallback_top_n": fallback_top_n,
+                    "min_similarity": min_similarity,
+                },
+            )
+            for row in cur.fetchall():
+                shaped = _recommendation_row(row)
+                (orgs if row["kind"] == "organization" else projects).append(shaped)
+    if orgs or projects or snapshot is None:
+        return orgs, projects
+    for query, ranked in enumerate(snapshot.orgs.search_many(embeddings, fallback_top_n, min_similarity)):
+        orgs += [{**row, "source": "vector", "query": query} for row in ranked]
+    for query, ranked in enumerate(snapshot.projects.search_many(embeddings, fallback_top_n, min_similarity)):
+        projects += [{**row, "source": "vector", "query": query} for row in ranked]
+    return orgs, projects
+
+
+# ── Org categories ───────────────────────────────────────────────────────
+def list_entity_embeddings(table: str) -> list[tuple[int, Embedding]]:
+    """(id, embedding) for every `problems` or `solutions` row with a vector."""
+    id_column = {"problems": "problem_id", "solutions": "solution_id"}[table]
     with db_cursor() as cur:
         cur.execute(
-            f"""SELECT p.project_id, p.name, p.description,
-                       o.name AS org_name, o.website AS org_website,
-                       SUM(ps.similarity_score * prs.similarity_score) AS combined_score
-                FROM problems_solutions ps
-                JOIN projects_solutions prs ON ps.solution_id = prs.solution_id
-                JOIN projects p ON prs.project_id = p.project_id
-                LEFT JOIN organizations o ON p.organization_id = o.organization_id
-                WHERE ps.problem_id IN ({placeholders})
-                GROUP BY p.project_id, p.name, p.description, o.name, o.website
-                ORDER BY combined_score DESC
-                LIMIT %s""",
-            (*problem_ids, top_n),
+            f"SELECT {id_column} AS id, embedding::text AS embedding FROM {table} "
+            f"WHERE embedding IS NOT NULL ORDER BY {id_column}"
         )
-        return [dict(r) for r in cur.fetchall()]
+        return [(row["id"], parse_pgvector(row["embedding"])) for row in cur.fetchall()]
 
 
-# ── CRUD: Organizations ──────────────────────────────────────────────────
-def list_organizations() -> list[dict]:
+def list_org_category_centroids() -> list[dict]:
     with db_cursor() as cur:
         cur.execute(
-            "SELECT organization_id, name, description, website, contact_email, created_at "
-            "FROM organizations ORDER BY name"
+            "SELECT slug, centroid::text AS centroid, member_count, updated_at "
+            "FROM org_categories WHERE centroid IS NOT NULL"
         )
-        return [dict(r) for r in cur.fetchall()]
+        rows = [dict(r) for r in cur.fetchall()]
+    for row in rows:
+        row["centroid"] = parse_pgvector(row["centroid"])
+    return rows
+
+
+def rebuild_org_category_centroid(slug: str, patterns: list[str], expand_min_similarity: float = 0.5) -> int:
+    """Recompute one category centroid from organization/project vectors.
+
+    Catalog rows whose embedded text matches ``patterns`` (ILIKE) seed the
+    category; rows within ``expand_min_similarity`` of the seed centroid are
+    added as auto-derived members. Returns the member count (0 = no centroid).
+    """
+    with db_cursor() as cur:
+        cur.execute(
+            """WITH catalog AS (
+                   SELECT text_to_embed, embedding FROM organizations_vec WHERE embedding IS NOT NULL
+                   UNION ALL
+                   SELECT text_to_embed, embedding FROM projects_vec WHERE embedding IS NOT NULL
+               ),
+               seed AS (
+                   SELECT AVG(embedding) AS centroid FROM catalog WHERE text_to_embed ILIKE ANY(%s)
+               ),
+               members AS (
+                   SELECT c.embedding
+                   FROM catalog c CROSS JOIN seed s
+                   WHERE s.centroid IS NOT NULL
+                     AND (c.text_to_embed ILIKE ANY(%s) OR 1 - (c.embedding <=> s.centroid) >= %s)
+               )
+               INSERT INTO org_categories (slug, centroid, member_count, updated_at)
+               SELECT %s, AVG(embedding), COUNT(*), now() FROM members
+               HAVING COUNT(*) > 0
+               ON CONFLICT (slug) DO UPDATE SET
+                   centroid = EXCLUDED.centroid,
+                   member_count = EXCLUDED.member_count,
+                   updated_at = now()
+               RETURNING member_count""",
+            (list(patterns), list(patterns), expand_min_similarity, slug),
+        )
+        row = cur.fetchone()
+        return row["member_count"] if row else 0
+
+
+# ── Admin listing: keyset pagination ────────────────────────────────────
+# List endpoints return one page at a time, ordered by a unique key and
+# continued with an opaque cursor holding the last row's key. Each page is an
+# index range scan of `limit + 1` rows however large the table grows.
+LIST_DEFAULT_LIMIT = 100
+LIST_MAX_LIMIT = 500
+
+
+@dataclass(frozen=True)
+class _ListSpec:
+    source: str                         # FROM clause
+    columns: dict[str, str]             # field -> SQL expression
+    order: tuple[tuple[str, str], ...]  # (field, SQL type) keyset, unique as a whole
+    descending: bool = False
+
+
+@dataclass
+class _ListPage:
+    sql: str
+    params: list
+    fields: list[str]
+    limit: int
+
+
+def _encode_cursor(values: list) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _prefix_pattern(prefix: str) -> str:
+    escaped = prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def _list_page_sql(
+    spec: _ListSpec,
+    where: list[str],
+    params: list,
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+) -> _ListPage:
+    """Build one page's statement; raises ValueError for unknown fields or a bad cursor.
+
+    `where` holds SQL conditions over `spec.source` (with `%s` placeholders
+    for `params`). `fields` defaults to every column of the spec.
+    """
+    unknown = [f for f in fields or [] if f not in spec.columns]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    selected = list(dict.fromkeys(fields)) if fields else list(spec.columns)
+    limit = min(max(1, limit or LIST_DEFAULT_LIMIT), LIST_MAX_LIMIT)
+    where, params = list(where), list(params)
+    key = [spec.columns[field] for field, _ in spec.order]
+    if cursor:
+        values = _decode_cursor(cursor, len(spec.order))
+        placeholders = ", ".join(f"%s::{sql_type}" for _, sql_type in spec.order)
+        where.append(f"({', '.join(key)}) {'<' if spec.descending else '>'} ({placeholders})")
+        params.extend(values)
+    output = dict.fromkeys([*selected, *(field for field, _ in spec.order)])
+    sql = f"SELECT {', '.join(f'{spec.columns[f]} AS {f}' for f in output)} FROM {spec.source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    direction = " DESC" if spec.descending else ""
+    sql += " ORDER BY " + ", ".join(column + direction for column in key) + " LIMIT %s"
+    params.append(limit + 1)
+    return _ListPage(sql, params, selected, limit)
+
+
+def _list_page_rows(spec: _ListSpec, page: _ListPage, rows: list[dict]) -> tuple[list[dict], str | None]:
+    """Trim the fetched `limit + 1` rows to one page; returns (rows, next cursor or None)."""
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        next_cursor = _encode_cursor([rows[-1][field] for field, _ in spec.order])
+    return [{f: row[f] for f in page.fields} for row in rows], next_cursor
+
+
+def _list(spec: _ListSpec, where: list[str], params: list, limit, cursor, fields) -> tuple[list[dict], str | None]:
+    page = _list_page_sql(spec, where, params, limit, cursor, fields)
+    with db_cursor() as cur:
+        cur.execute(page.sql, page.params)
+        return _list_page_rows(spec, page, [dict(r) for r in cur.fetchall()])
+
+
+# Dashboard totals without listing rows. The catalog tables are counted
+# exactly; messages_history grows without bound, so its total is the
+# planner's row estimate summed over the partitions (current as of the last
+# ANALYZE / autovacuum), reported in `approximate`.
+_LIST_COUNTS_SQL = """
+    SELECT (SELECT count(*) FROM organizations) AS organizations,
+           (SELECT count(*) FROM projects) AS projects,
+           (SELECT count(*) FROM problems) AS problems,
+           (SELECT count(*) FROM solutions) AS solutions,
+           (SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'public.messages_history'::regclass) AS messages"""
+LIST_APPROXIMATE_COUNTS = ("messages",)
+
+
+def list_counts() -> dict:
+    """Row totals per admin list; names in `approximate` are estimates."""
+    with db_cursor() as cur:
+        cur.execute(_LIST_COUNTS_SQL)
+        return {**dict(cur.fetchone()), "approximate": list(LIST_APPROXIMATE_COUNTS)}
+
+
+def _common_filters(
+    name_column: str | None,
+    created_column: str,
+    name_prefix: str | None,
+    created_after: datetime | None,
+    created_before: datetime | None,
+) -> tuple[list[str], list]:
+    where, params = [], []
+    if name_prefix and name_column:
+        where.append(f"lower({name_column}) LIKE %s")
+        params.append(_prefix_pattern(name_prefix))
+    if created_after is not None:
+        where.append(f"{created_column} >= %s")
+        params.append(created_after)
+    if created_before is not None:
+        where.append(f"{created_column} < %s")
+        params.append(created_before)
+    return where, params
+
+
+# ── CRUD: Organizations ──────────────────────────────────────────────────
+_ORGANIZATION_LIST = _ListSpec(
+    source="organizations",
+    columns={
+        "organization_id": "organization_id",
+        "name": "name",
+        "description": "description",
+        "website": "website",
+        "contact_email": "contact_email",
+        "created_at": "created_at",
+    },
+    order=(("name", "text"), ("organization_id", "bigint")),
+)
+
+
+def list_organizations(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    name_prefix: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> tuple[list[dict], str | None]:
+    """One page of organizations by name; returns (rows, next cursor or None)."""
+    where, params = _common_filters("name", "created_at", name_prefix, created_after, created_before)
+    return _list(_ORGANIZATION_LIST, where, params, limit, cursor, fields)
 
 
 def get_organization(organization_id: int) -> dict | None:
@@ -332,8 +1527,9 @@ def get_organization(organization_id: int) -> dict | None:
         return org
 
 
-def upsert_organization_embedding(organization_id: int, text: str, embedding: list[float]):
-    embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
+@_invalidates_catalog
+def upsert_organization_embedding(organization_id: int, text: str, embedding: Embedding):
+    embedding_str = to_pgvector(embedding)
     with db_cursor() as cur:
         cur.execute(
             """INSERT INTO organizations_vec (organization_id, text_to_embed, embedding)
@@ -346,6 +1542,7 @@ def upsert_organization_embedding(organization_id: int, text: str, embedding: li
         )
 
 
+@_invalidates_catalog
 def create_organization(name: str, description: str | None, website: str | None, contact_email: str | None) -> dict:
     with db_cursor() as cur:
         cur.execute(
@@ -356,6 +1553,7 @@ def create_organization(name: str, description: str | None, website: str | None,
         return dict(cur.fetchone())
 
 
+@_invalidates_catalog
 def update_organization(organization_id: int, name: str, description: str | None, website: str | None, contact_email: str | None) -> dict | None:
     with db_cursor() as cur:
         cur.execute(
@@ -367,6 +1565,7 @@ def update_organization(organization_id: int, name: str, description: str | None
         return dict(row) if row else None
 
 
+@_invalidates_catalog
 def delete_organization(organization_id: int) -> bool:
     with db_cursor() as cur:
         cur.execute("DELETE FROM organizations_solutions WHERE organization_id = %s", (organization_id,))
@@ -377,15 +1576,35 @@ def delete_organization(organization_id: int) -> bool:
 
 
 # ── CRUD: Projects ───────────────────────────────────────────────────────
-def list_projects() -> list[dict]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT p.project_id, p.name, p.description, p.organization_id, p.created_at, "
-            "       o.name AS organization_name "
-            "FROM projects p LEFT JOIN organizations o ON p.organization_id = o.organization_id "
-            "ORDER BY p.name"
-        )
-        return [dict(r) for r in cur.fetchall()]
+_PROJECT_LIST = _ListSpec(
+    source="projects p LEFT JOIN organizations o ON p.organization_id = o.organization_id",
+    columns={
+        "project_id": "p.project_id",
+        "name": "p.name",
+        "description": "p.description",
+        "organization_id": "p.organization_id",
+        "created_at": "p.created_at",
+        "organization_name": "o.name",
+    },
+    order=(("name", "text"), ("project_id", "bigint")),
+)
+
+
+def list_projects(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    name_prefix: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    organization_id: int | None = None,
+) -> tuple[list[dict], str | None]:
+    """One page of projects by name; returns (rows, next cursor or None)."""
+    where, params = _common_filters("p.name", "p.created_at", name_prefix, created_after, created_before)
+    if organization_id is not None:
+        where.append("p.organization_id = %s")
+        params.append(organization_id)
+    return _list(_PROJECT_LIST, where, params, limit, cursor, fields)
 
 
 def get_project(project_id: int) -> dict | None:
@@ -399,8 +1618,9 @@ def get_project(project_id: int) -> dict | None:
         return dict(row) if row else None
 
 
-def upsert_project_embedding(project_id: int, text: str, embedding: list[float]):
-    embedding_str = "[" + ",".join(str(v) for v in embedding) + "]"
+@_invalidates_catalog
+def upsert_project_embedding(project_id: int, text: str, embedding: Embedding):
+    embedding_str = to_pgvector(embedding)
     with db_cursor() as cur:
         cur.execute(
             """INSERT INTO projects_vec (project_id, text_to_embed, embedding)
@@ -413,6 +1633,7 @@ def upsert_project_embedding(project_id: int, text: str, embedding: list[float])
         )
 
 
+@_invalidates_catalog
 def create_project(name: str, description: str | None, organization_id: int | None) -> dict:
     with db_cursor() as cur:
         cur.execute(
@@ -423,6 +1644,7 @@ def create_project(name: str, description: str | None, organization_id: int | No
         return dict(cur.fetchone())
 
 
+@_invalidates_catalog
 def update_project(project_id: int, name: str, description: str | None, organization_id: int | None) -> dict | None:
     with db_cursor() as cur:
         cur.execute(
@@ -434,6 +1656,7 @@ def update_project(project_id: int, name: str, description: str | None, organiza
         return dict(row) if row else None
 
 
+@_invalidates_catalog
 def delete_project(project_id: int) -> bool:
     with db_cursor() as cur:
         cur.execute("DELETE FROM projects_solutions WHERE project_id = %s", (project_id,))
@@ -443,13 +1666,36 @@ def delete_project(project_id: int) -> bool:
 
 
 # ── CRUD: Problems ───────────────────────────────────────────────────────
-def list_problems() -> list[dict]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT problem_id, name, context, content, is_processed, created_at "
-            "FROM problems ORDER BY created_at DESC"
-        )
-        return [dict(r) for r in cur.fetchall()]
+_PROBLEM_LIST = _ListSpec(
+    source="problems",
+    columns={
+        "problem_id": "problem_id",
+        "name": "name",
+        "context": "context",
+        "content": "content",
+        "is_processed": "is_processed",
+        "created_at": "created_at",
+    },
+    order=(("created_at", "timestamptz"), ("problem_id", "bigint")),
+    descending=True,
+)
+
+
+def list_problems(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    name_prefix: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    is_processed: bool | None = None,
+) -> tuple[list[dict], str | None]:
+    """One page of problems, newest first; returns (rows, next cursor or None)."""
+    where, params = _common_filters("name", "created_at", name_prefix, created_after, created_before)
+    if is_processed is not None:
+        where.append("is_processed = %s")
+        params.append(is_processed)
+    return _list(_PROBLEM_LIST, where, params, limit, cursor, fields)
 
 
 def get_problem(problem_id: int) -> dict | None:
@@ -491,17 +1737,37 @@ def delete_problem(problem_id: int) -> bool:
     with db_cursor() as cur:
         cur.execute("DELETE FROM problems_solutions WHERE problem_id = %s", (problem_id,))
         cur.execute("DELETE FROM problems WHERE problem_id = %s", (problem_id,))
-        return cur.rowcount > 0
+        deleted = cur.rowcount > 0
+    _store_forget(PROBLEM_STORE, problem_id)
+    return deleted
 
 
 # ── CRUD: Solutions ──────────────────────────────────────────────────────
-def list_solutions() -> list[dict]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT solution_id, name, context, content, created_at "
-            "FROM solutions ORDER BY created_at DESC"
-        )
-        return [dict(r) for r in cur.fetchall()]
+_SOLUTION_LIST = _ListSpec(
+    source="solutions",
+    columns={
+        "solution_id": "solution_id",
+        "name": "name",
+        "context": "context",
+        "content": "content",
+        "created_at": "created_at",
+    },
+    order=(("created_at", "timestamptz"), ("solution_id", "bigint")),
+    descending=True,
+)
+
+
+def list_solutions(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    name_prefix: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> tuple[list[dict], str | None]:
+    """One page of solutions, newest first; returns (rows, next cursor or None)."""
+    where, params = _common_filters("name", "created_at", name_prefix, created_after, created_before)
+    return _list(_SOLUTION_LIST, where, params, limit, cursor, fields)
 
 
 def get_solution(solution_id: int) -> dict | None:
@@ -544,38 +1810,149 @@ def delete_solution(solution_id: int) -> bool:
         cur.execute("DELETE FROM organizations_solutions WHERE solution_id = %s", (solution_id,))
         cur.execute("DELETE FROM projects_solutions WHERE solution_id = %s", (solution_id,))
         cur.execute("DELETE FROM solutions WHERE solution_id = %s", (solution_id,))
-        return cur.rowcount > 0
+        deleted = cur.rowcount > 0
+    _store_forget(SOLUTION_STORE, solution_id)
+    return deleted
 
 
 # ── Messages ─────────────────────────────────────────────────────────────
-def list_messages(limit: int = 200) -> list[dict]:
-    with db_cursor() as cur:
-        cur.execute(
-            "SELECT m.message_id, m.chat_id, m.user_id, m.message_text, m.reply_text, "
-            "       m.pipeline_used, m.date, "
-            "       u.username AS user_username, u.first_name AS user_first_name, "
-            "       c.type AS chat_type "
-            "FROM messages_history m "
-            "LEFT JOIN users u ON m.user_id = u.user_id "
-            "LEFT JOIN chats c ON m.chat_id = c.chat_id "
-            "ORDER BY m.date DESC LIMIT %s",
-            (limit,),
-        )
-        return [dict(r) for r in cur.fetchall()]
+_MESSAGE_LIST = _ListSpec(
+    source=(
+        "messages_history m "
+        "LEFT JOIN users u ON m.user_id = u.user_id "
+        "LEFT JOIN chats c ON m.chat_id = c.chat_id"
+    ),
+    columns={
+        "message_id": "m.message_id",
+        "chat_id": "m.chat_id",
+        "user_id": "m.user_id",
+        "message_text": "m.message_text",
+        "reply_text": "m.reply_text",
+        "pipeline_used": "m.pipeline_used",
+        "date": "m.date",
+        "user_username": "u.username",
+        "user_first_name": "u.first_name",
+        "chat_type": "c.type",
+    },
+    order=(("date", "timestamptz"), ("message_id", "bigint")),
+    descending=True,
+)
+
+
+def _message_list_filters(
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    pipeline: str | None = None,
+    chat_id: int | None = None,
+    user_id: int | None = None,
+) -> tuple[list[str], list]:
+    where, params = _common_filters(None, "m.date", None, created_after, created_before)
+    for column, value in (("m.pipeline_used", pipeline), ("m.chat_id", chat_id), ("m.user_id", user_id)):
+        if value is not None:
+            where.append(f"{column} = %s")
+            params.append(value)
+    return where, params
+
+
+def list_messages(
+    limit: int | None = None,
+    cursor: str | None = None,
+    fields: list[str] | None = None,
+    **filters,
+) -> tuple[list[dict], str | None]:
+    """One page of messages, newest first; `filters` as in `_message_list_filters`."""
+    where, params = _message_list_filters(**filters)
+    return _list(_MESSAGE_LIST, where, params, limit, cursor, fields)
+
+
+_GET_MESSAGE_SQL = (
+    "SELECT m.message_id, m.chat_id, m.user_id, m.message_text, m.reply_text, "
+    "       m.pipeline_used, m.date, "
+    "       u.username AS user_username, u.first_name AS user_first_name, "
+    "       c.type AS chat_type "
+    "FROM messages_history m "
+    "LEFT JOIN users u ON m.user_id = u.user_id "
+    "LEFT JOIN chats c ON m.chat_id = c.chat_id "
+    "WHERE m.message_id = %s"
+)
 
 
 def get_message(message_id: int) -> dict | None:
     with db_cursor() as cur:
-        cur.execute(
-            "SELECT m.message_id, m.chat_id, m.user_id, m.message_text, m.reply_text, "
-            "       m.pipeline_used, m.date, "
-            "       u.username AS user_username, u.first_name AS user_first_name, "
-            "       c.type AS chat_type "
-            "FROM messages_history m "
-            "LEFT JOIN users u ON m.user_id = u.user_id "
-            "LEFT JOIN chats c ON m.chat_id = c.chat_id "
-            "WHERE m.message_id = %s",
-            (message_id,),
-        )
+        cur.execute(_GET_MESSAGE_SQL, (message_id,))
         row = cur.fetchone()
         return dict(row) if row else None
+
+
+# ── Stage timings ────────────────────────────────────────────────────────
+_INSERT_STAGE_TIMING = STATEMENTS.register(
+    "insert_stage_timing",
+    """INSERT INTO message_stage_timings (message_id, pipeline_used, total_ms, timings)
+       VALUES (%s, %s, %s, %s)
+       ON CONFLICT (message_id) DO NOTHING""",
+)
+
+
+def save_stage_timings(
+    message_id: int,
+    pipeline_used: str | None,
+    total_seconds: float,
+    timings: dict[str, float],
+    timeout: float | None = None,
+):
+    """Store one message's stage timings (seconds in, milliseconds stored).
+
+    Queued behind the message itself when MESSAGE_WRITE_BEHIND is on.
+    """
+    if MESSAGE_WRITE_BEHIND:
+        _enqueue_stage_timings(message_id, pipeline_used, total_seconds, timings)
+        return
+    with db_cursor(timeout) as cur:
+        STATEMENTS.execute(
+            cur,
+            _INSERT_STAGE_TIMING,
+            (
+                message_id,
+                pipeline_used,
+                round(total_seconds * 1000),
+                psycopg2.extras.Json({k: round(v * 1000) for k, v in timings.items()}),
+            ),
+        )
+
+
+def _enqueue_stage_timings(
+    message_id: int, pipeline_used: str | None, total_seconds: float, timings: dict[str, float]
+) -> None:
+    MESSAGE_WRITER.enqueue_timings({
+        "message_id": message_id,
+        "pipeline_used": pipeline_used,
+        "total_ms": round(total_seconds * 1000),
+        "timings": json.dumps({k: round(v * 1000) for k, v in timings.items()}),
+    })
+
+
+_STAGE_LATENCY_SQL = """
+    SELECT t.pipeline_used, GROUPING(t.pipeline_used) = 1 AS all_pipelines,
+           s.key AS stage, count(*) AS samples,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY s.value::int) AS p50,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY s.value::int) AS p95,
+           percentile_cont(0.99) WITHIN GROUP (ORDER BY s.value::int) AS p99
+    FROM message_stage_timings t
+    CROSS JOIN LATERAL jsonb_each_text(
+        t.timings || jsonb_build_object('total', t.total_ms)
+    ) AS s
+    WHERE t.recorded_at >= now() - %s * interval '1 hour'
+      AND (%s::text IS NULL OR t.pipeline_used = %s)
+    GROUP BY GROUPING SETS ((s.key), (t.pipeline_used, s.key))
+    ORDER BY all_pipelines DESC, t.pipeline_used, p95 DESC"""
+
+
+def stage_latency_stats(hours: float = 24, pipeline: str | None = None) -> list[dict]:
+    """p50/p95/p99 (ms) per stage, overall and per pipeline, over the last `hours`.
+
+    Rows with `all_pipelines` set aggregate every pipeline; the pseudo-stage
+    `total` is the whole message.
+    """
+    with db_cursor() as cur:
+        cur.execute(_STAGE_LATENCY_SQL, (hours, pipeline, pipeline))
+        return [dict(r) for r in cur.fetchall()]
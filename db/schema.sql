@@ -20,9 +20,33 @@ CREATE TABLE IF NOT EXISTS public.chats (
     CONSTRAINT chats_pkey PRIMARY KEY (chat_id)
 );
 
--- Messages history table
+-- Messages history table, range-partitioned by month on `date`
+-- (messages_history_YYYY_MM, UTC month boundaries). Partitions are created
+-- ahead of time by ensure_messages_history_partitions() (called below, at bot
+-- startup and by scripts/archive_messages_history.py, which also detaches and
+-- exports partitions past the retention window). There is deliberately no
+-- default partition: it would stop the planner from scanning partitions in
+-- date order, which keeps "newest N messages" reads bounded.
+CREATE SEQUENCE IF NOT EXISTS public.messages_history_message_id_seq;
+
+-- Upgrade path: an unpartitioned messages_history from an older schema is
+-- renamed here and its rows are moved into the partitioned table below.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('public.messages_history') AND relkind = 'r') THEN
+        ALTER TABLE IF EXISTS public.message_stage_timings
+            DROP CONSTRAINT IF EXISTS message_stage_timings_message_id_fkey;
+        ALTER SEQUENCE public.messages_history_message_id_seq OWNED BY NONE;
+        ALTER TABLE public.messages_history ALTER COLUMN message_id DROP DEFAULT;
+        ALTER TABLE public.messages_history RENAME TO messages_history_unpartitioned;
+        ALTER TABLE public.messages_history_unpartitioned
+            RENAME CONSTRAINT messages_history_pkey TO messages_history_unpartitioned_pkey;
+    END IF;
+END
+$$;
+
 CREATE TABLE IF NOT EXISTS public.messages_history (
-    message_id BIGSERIAL NOT NULL,
+    message_id BIGINT NOT NULL DEFAULT nextval('public.messages_history_message_id_seq'),
     chat_id BIGINT NOT NULL,
     user_id BIGINT,
     tg_message_id BIGINT,
@@ -30,8 +54,55 @@ CREATE TABLE IF NOT EXISTS public.messages_history (
     message_text TEXT NOT NULL,
     reply_text TEXT,
     pipeline_used TEXT,
-    CONSTRAINT messages_history_pkey PRIMARY KEY (message_id)
-);
+    CONSTRAINT messages_history_pkey PRIMARY KEY (message_id, date)
+) PARTITION BY RANGE (date);
+ALTER SEQUENCE public.messages_history_message_id_seq OWNED BY public.messages_history.message_id;
+
+-- Create the monthly partitions from `from_date`'s month through
+-- `months_ahead` months past the current one; returns how many were created.
+CREATE OR REPLACE FUNCTION public.ensure_messages_history_partitions(
+    from_date date DEFAULT current_date,
+    months_ahead integer DEFAULT 3
+) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month date := date_trunc('month', from_date)::date;
+    last_month date := (date_trunc('month', current_date) + make_interval(months => months_ahead))::date;
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        partition_name := 'messages_history_' || to_char(month, 'YYYY_MM');
+        IF to_regclass('public.' || partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE public.%I PARTITION OF public.messages_history FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month::timestamp AT TIME ZONE 'UTC',
+                (month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+DO $$
+BEGIN
+    IF to_regclass('public.messages_history_unpartitioned') IS NOT NULL THEN
+        PERFORM public.ensure_messages_history_partitions(
+            coalesce((SELECT min(date) FROM public.messages_history_unpartitioned)::date, current_date)
+        );
+        INSERT INTO public.messages_history
+            (message_id, chat_id, user_id, tg_message_id, date, message_text, reply_text, pipeline_used)
+        SELECT message_id, chat_id, user_id, tg_message_id, date, message_text, reply_text, pipeline_used
+        FROM public.messages_history_unpartitioned;
+        DROP TABLE public.messages_history_unpartitioned;
+    END IF;
+END
+$$;
+SELECT public.ensure_messages_history_partitions();
 
 -- Organizations table
 CREATE TABLE IF NOT EXISTS public.organizations (
@@ -161,11 +232,52 @@ CREATE TABLE IF NOT EXISTS public.organizations_solutions (
         REFERENCES public.solutions(solution_id)
 );
 
+-- Precomputed /orgs categories: centroid of member organization/project vectors.
+-- Built by scripts/build_org_categories.py; labels and aliases live in code.
+CREATE TABLE IF NOT EXISTS public.org_categories (
+    slug TEXT NOT NULL,
+    centroid vector(1536),
+    member_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    CONSTRAINT org_categories_pkey PRIMARY KEY (slug)
+);
+
+-- Per-message stage timings (milliseconds), one row per answered message.
+-- `timings` maps stage name -> ms as recorded by the message's Deadline;
+-- stages that did not run are absent. Written by the orchestrator after save.
+-- No foreign key: message_id alone is not unique in the partitioned
+-- messages_history. The archival job prunes rows past the retention window.
+CREATE TABLE IF NOT EXISTS public.message_stage_timings (
+    message_id BIGINT NOT NULL,
+    recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    pipeline_used TEXT,
+    total_ms INTEGER NOT NULL,
+    timings JSONB NOT NULL,
+    CONSTRAINT message_stage_timings_pkey PRIMARY KEY (message_id)
+);
+
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON public.messages_history(chat_id);
+-- Serves the per-conversation "newest N" reads (session load, history, last
+-- context) and chat-only filters by prefix; created on every partition.
+CREATE INDEX IF NOT EXISTS idx_messages_chat_user_date
+    ON public.messages_history(chat_id, user_id, date DESC);
 CREATE INDEX IF NOT EXISTS idx_messages_user_id ON public.messages_history(user_id);
+CREATE INDEX IF NOT EXISTS idx_stage_timings_recorded_at ON public.message_stage_timings(recorded_at);
 CREATE INDEX IF NOT EXISTS idx_problems_processed ON public.problems(is_processed);
 
+-- Keyset pagination of the admin list endpoints: each index matches a list's
+-- sort order, so a page is an index range scan whatever its depth.
+CREATE INDEX IF NOT EXISTS idx_organizations_name_id ON public.organizations(name, organization_id);
+CREATE INDEX IF NOT EXISTS idx_projects_name_id ON public.projects(name, project_id);
+CREATE INDEX IF NOT EXISTS idx_problems_created_id ON public.problems(created_at DESC, problem_id DESC);
+CREATE INDEX IF NOT EXISTS idx_solutions_created_id ON public.solutions(created_at DESC, solution_id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_date_id ON public.messages_history(date DESC, message_id DESC);
+-- name_prefix filters (lower(name) LIKE 'prefix%').
+CREATE INDEX IF NOT EXISTS idx_organizations_name_prefix ON public.organizations(lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_projects_name_prefix ON public.projects(lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_problems_name_prefix ON public.problems(lower(name) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_solutions_name_prefix ON public.solutions(lower(name) text_pattern_ops);
+
 -- Vector (HNSW) indexes for cosine-similarity search.
 -- Cover exactly the embedding columns queried with the <=> operator at runtime.
 -- problems/solutions grow with every user message, so their ANN indexes matter most.
@@ -177,3 +289,71 @@ CREATE INDEX IF NOT EXISTS idx_problems_embedding_hnsw
     ON public.problems USING hnsw (embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_solutions_embedding_hnsw
     ON public.solutions USING hnsw (embedding vector_cosine_ops);
+
+-- Full-text search columns for hybrid (lexical + vector) /orgs retrieval.
+-- Postgres ships no Ukrainian stemmer, so Ukrainian text is indexed with the
+-- 'simple' config (lower-cased whole words, matched by prefix at query time);
+-- English text gets the stemming 'english' config.
+ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS search_uk tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED;
+ALTER TABLE public.organizations ADD COLUMN IF NOT EXISTS search_en tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED;
+ALTER TABLE public.projects ADD COLUMN IF NOT EXISTS search_uk tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED;
+ALTER TABLE public.projects ADD COLUMN IF NOT EXISTS search_en tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_organizations_search_uk ON public.organizations USING gin (search_uk);
+CREATE INDEX IF NOT EXISTS idx_organizations_search_en ON public.organizations USING gin (search_en);
+CREATE INDEX IF NOT EXISTS idx_projects_search_uk ON public.projects USING gin (search_uk);
+CREATE INDEX IF NOT EXISTS idx_projects_search_en ON public.projects USING gin (search_en);
+
+-- Session cache invalidation (db/session_cache.py). Bots LISTEN on
+-- 'session_invalidate'; payloads name the changed key: 'user:<id>',
+-- 'chat:<id>', 'history:<chat_id>:<user_id>', or 'history:*' after a
+-- DELETE/UPDATE statement (statement-level, so a bulk delete sends one).
+-- Detaching an archived partition sends nothing; those rows are older than
+-- any cached ring's TTL.
+CREATE OR REPLACE FUNCTION public.notify_session_invalidate() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'users' THEN
+        PERFORM pg_notify('session_invalidate', 'user:' || NEW.user_id);
+    ELSIF TG_TABLE_NAME = 'chats' THEN
+        PERFORM pg_notify('session_invalidate', 'chat:' || NEW.chat_id);
+    ELSIF TG_OP = 'INSERT' THEN
+        IF NEW.user_id IS NOT NULL THEN
+            PERFORM pg_notify('session_invalidate', 'history:' || NEW.chat_id || ':' || NEW.user_id);
+        END IF;
+    ELSE
+        PERFORM pg_notify('session_invalidate', 'history:*');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_users_session_invalidate
+    AFTER UPDATE OF response_style ON public.users
+    FOR EACH ROW WHEN (OLD.response_style IS DISTINCT FROM NEW.response_style)
+    EXECUTE FUNCTION public.notify_session_invalidate();
+CREATE OR REPLACE TRIGGER trg_chats_session_invalidate
+    AFTER UPDATE OF response_style ON public.chats
+    FOR EACH ROW WHEN (OLD.response_style IS DISTINCT FROM NEW.response_style)
+    EXECUTE FUNCTION public.notify_session_invalidate();
+CREATE OR REPLACE TRIGGER trg_messages_session_invalidate
+    AFTER INSERT ON public.messages_history
+    FOR EACH ROW EXECUTE FUNCTION public.notify_session_invalidate();
+CREATE OR REPLACE TRIGGER trg_messages_session_invalidate_bulk
+    AFTER DELETE OR UPDATE ON public.messages_history
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_session_invalidate();
@@ -0,0 +1,236 @@
+"""
+In-process cache of per-message session state.
+
+Purpose:
+- Serve what every message reads before routing, without a Postgres round
+  trip: the user's and the chat's response style, and the recent history ring
+  of a (chat, user) conversation (the last exchange drives routing, the last
+  few feed the reply prompt).
+
+Semantics:
+- Styles are cached per user / per chat. The history ring holds the newest
+  `history_size` messages of one conversation, oldest first, and is exact: it
+  is seeded from the DB and then extended by this process's own writes, so
+  any `limit <= history_size` can be served from it.
+- Bounded: each map keeps at most `max_entries` keys (least recently used are
+  evicted) and an entry older than `ttl` seconds is a miss.
+
+Freshness:
+- Write-through: `queries.set_user_style` and `queries.save_message` update
+  the cache after their statement commits.
+- Writes by other processes (another bot instance, the admin server, SQL)
+  arrive as `session_invalidate` notifications (triggers in `db/schema.sql`)
+  and are applied with `invalidate(payload)`.
+- A fill carries the `token()` taken before its DB read; if the key was
+  invalidated after that, the fill is dropped instead of caching a value that
+  may predate the write.
+- The cache only serves while `listening` is set, i.e. while the notification
+  listener is connected; on (re)connect it is cleared, so a gap in
+  notifications cannot leave stale entries behind.
+
+Metrics: `snapshot()` (served by the bot's health server on `/session_cache`).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+MISS = object()
+
+
+class _LRU:
+    """Bounded map of key -> (stored_at, value), least recently used first."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.items: OrderedDict = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key, now: float, ttl: float):
+        item = self.items.get(key)
+        if item is None:
+            return MISS
+        if now - item[0] > ttl:
+            del self.items[key]
+            return MISS
+        self.items.move_to_end(key)
+        return item[1]
+
+    def put(self, key, value, now: float) -> None:
+        self.items[key] = (now, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_entries:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+
+class SessionCache:
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: float = 300.0,
+        history_size: int = 6,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.history_size = history_size
+        self.listening = False
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._maps = {
+            "user": _LRU(max_entries),
+            "chat": _LRU(max_entries),
+            "history": _LRU(max_entries),
+        }
+        # key -> sequence number of its last invalidation, for dropping fills
+        # that raced an invalidation. Bounded; a forgotten key raises the floor.
+        self._seq = 0
+        self._invalidated: OrderedDict = OrderedDict()
+        self._invalidated_floor = 0
+        self._max_invalidated = max_entries
+        self._hits = {kind: 0 for kind in self._maps}
+        self._misses = {kind: 0 for kind in self._maps}
+        self.invalidations = 0
+
+    # ── Reads ──────────────────────────────────────────────────────────────
+    def _get(self, kind: str, key) -> Any:
+        with self._lock:
+            value = self._maps[kind].get(key, self._clock(), self.ttl) if self.listening else MISS
+            if value is MISS:
+                self._misses[kind] += 1
+            else:
+                self._hits[kind] += 1
+            return value
+
+    def user_style(self, user_id: int) -> Any:
+        return self._get("user", user_id)
+
+    def chat_style(self, chat_id: int) -> Any:
+        return self._get("chat", chat_id)
+
+    def history(self, chat_id: int, user_id: int, limit: int | None = None) -> Any:
+        """Newest `limit` messages, oldest first; MISS unless the ring covers them."""
+        if limit is not None and limit > self.history_size:
+            with self._lock:
+                self._misses["history"] += 1
+            return MISS
+        ring = self._get("history", (chat_id, user_id))
+        if ring is MISS:
+            return MISS
+        rows = ring if limit is None else ring[len(ring) - min(limit, len(ring)):]
+        return [dict(row) for row in rows]
+
+    # ── Fills and write-through ────────────────────────────────────────────
+    def token(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def _put(self, kind: str, key, value, token: int | None) -> None:
+        with self._lock:
+            if not self.listening:
+                return
+            if token is not None:
+                stamp = self._invalidated.get((kind, key), self._invalidated_floor)
+                if stamp > token:
+                    return
+            self._maps[kind].put(key, value, self._clock())
+
+    def put_user_style(self, user_id: int, style: str, token: int | None = None) -> None:
+        self._put("user", user_id, style, token)
+
+    def put_chat_style(self, chat_id: int, style: str, token: int | None = None) -> None:
+        self._put("chat", chat_id, style, token)
+
+    def put_history(self, chat_id: int, user_id: int, rows: list[dict], token: int | None = None) -> None:
+        """Seed the ring from the DB's newest `history_size` rows, oldest first."""
+        ring = tuple(dict(row) for row in rows[-self.history_size:])
+        self._put("history", (chat_id, user_id), ring, token)
+
+    def write_user_style(self, user_id: int, style: str) -> None:
+        """Write-through after this process changed the user's style."""
+        with self._lock:
+            self._stamp("user", user_id)
+            if self.listening:
+                self._maps["user"].put(user_id, style, self._clock())
+
+    def append_message(self, chat_id: int, user_id: int, row: dict) -> None:
+        """Write-through after this process saved a message: extend a cached ring."""
+        key = (chat_id, user_id)
+        with self._lock:
+            # Also drops in-flight fills that may have missed this message.
+            self._stamp("history", key)
+            if not self.listening:
+                return
+            history = self._maps["history"]
+            ring = history.get(key, self._clock(), self.ttl)
+            if ring is not MISS:
+                history.put(key, (ring + (dict(row),))[-self.history_size:], self._clock())
+
+    # ── Invalidation ───────────────────────────────────────────────────────
+    def _stamp(self, kind: str, key) -> None:
+        """Record a change to `key` (caller holds the lock)."""
+        self._seq += 1
+        self._invalidated[(kind, key)] = self._seq
+        self._invalidated.move_to_end((kind, key))
+        while len(self._invalidated) > self._max_invalidated:
+            _, stamp = self._invalidated.popitem(last=False)
+            self._invalidated_floor = max(self._invalidated_floor, stamp)
+
+    def invalidate(self, payload: str) -> None:
+        """Apply one notification: `user:<id>`, `chat:<id>`, `history:<chat>:<user>` or `history:*`."""
+        kind, _, rest = payload.partition(":")
+        if kind not in self._maps:
+            self.clear()
+            return
+        if rest == "*":
+            with self._lock:
+                self._seq += 1
+                self._maps[kind].items.clear()
+                self._invalidated_floor = self._seq
+                self.invalidations += 1
+            return
+        try:
+            parts = tuple(int(part) for part in rest.split(":"))
+        except ValueError:
+            self.clear()
+            return
+        key = parts if kind == "history" else parts[0]
+        with self._lock:
+            self._maps[kind].items.pop(key, None)
+            self._stamp(kind, key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seq += 1
+            for lru in self._maps.values():
+                lru.items.clear()
+            self._invalidated.clear()
+            self._invalidated_floor = self._seq
+
+    def set_listening(self, listening: bool) -> None:
+        """Serve only while notifications flow; every transition starts empty."""
+        self.clear()
+        with self._lock:
+            self.listening = listening
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind, lru in self._maps.items():
+                hits, misses = self._hits[kind], self._misses[kind]
+                kinds[kind] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                    "size": len(lru.items),
+                    "evictions": lru.evictions,
+                }
+            hits, misses = sum(self._hits.values()), sum(self._misses.values())
+            return {
+                "listening": self.listening,
+                "ttl_seconds": self.ttl,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                "invalidations": self.invalidations,
+                **kinds,
+            }
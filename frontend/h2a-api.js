@@ -8,7 +8,7 @@ window.api = (() => {
   }
   function saveConfig(cfg) { localStorage.setItem(STORAGE_KEY, JSON.stringify(cfg)); }
 
-  async function request(path, options = {}) {
+  async function send(path, options = {}) {
     const cfg = getConfig();
     const baseURL = cfg.baseURL || window.location.origin;
     const apiKey = cfg.apiKey || '';
@@ -20,44 +20,77 @@ window.api = (() => {
       const txt = await res.text().catch(() => '');
       throw new Error(`${res.status} ${res.statusText}${txt ? ': ' + txt.slice(0, 120) : ''}`);
     }
+    return res;
+  }
+
+  async function request(path, options = {}) {
+    const res = await send(path, options);
     if (res.status === 204) return null;
     return res.json();
   }
 
+  // List endpoints are keyset-paginated: `limit`, `cursor`, `fields` and
+  // filters go in the query string, the next page's cursor comes back in
+  // the X-Next-Cursor header (absent on the last page).
+  function query(params = {}) {
+    const q = new URLSearchParams();
+    Object.entries(params).forEach(([k, v]) => { if (v !== undefined && v !== null && v !== '') q.set(k, v); });
+    const s = q.toString();
+    return s ? `?${s}` : '';
+  }
+
+  async function requestPage(path, params = {}) {
+    const res = await send(`${path}${query(params)}`);
+    return { items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+  }
+
+  // Follows cursors to the end; for the small catalog lists behind dropdowns.
+  async function requestAll(path, params = {}) {
+    let items = [], cursor = null;
+    do {
+      const page = await requestPage(path, { limit: 500, ...params, cursor });
+      items = items.concat(page.items);
+      cursor = page.nextCursor;
+    } while (cursor);
+    return items;
+  }
+
   const json = (data) => JSON.stringify(data);
 
   return {
     getConfig, saveConfig,
     // Organizations
-    getOrganizations:    ()        => request('/organizations'),
+    getOrganizations:    (params)  => requestAll('/organizations', params),
     getOrganization:     (id)      => request(`/organizations/${id}`),
     createOrganization:  (data)    => request('/organizations',    { method: 'POST',   body: json(data) }),
     updateOrganization:  (id, data)=> request(`/organizations/${id}`, { method: 'PUT',body: json(data) }),
     deleteOrganization:  (id)      => request(`/organizations/${id}`, { method: 'DELETE' }),
     // Projects
-    getProjects:    ()        => request('/projects'),
+    getProjects:    (params)  => requestAll('/projects', params),
     getProject:     (id)      => request(`/projects/${id}`),
     createProject:  (data)    => request('/projects',       { method: 'POST',   body: json(data) }),
     updateProject:  (id, data)=> request(`/projects/${id}`, { method: 'PUT',    body: json(data) }),
     deleteProject:  (id)      => request(`/projects/${id}`, { method: 'DELETE' }),
     // Problems
-    getProblems:    ()        => request('/problems'),
+    getProblemsPage: (params) => requestPage('/problems', params),
     getProblem:     (id)      => request(`/problems/${id}`),
     createProblem:  (data)    => request('/problems',       { method: 'POST',   body: json(data) }),
     updateProblem:  (id, data)=> request(`/problems/${id}`, { method: 'PUT',    body: json(data) }),
     deleteProblem:  (id)      => request(`/problems/${id}`, { method: 'DELETE' }),
     // Solutions
-    getSolutions:    ()        => request('/solutions'),
+    getSolutionsPage: (params) => requestPage('/solutions', params),
     getSolution:     (id)      => request(`/solutions/${id}`),
     createSolution:  (data)    => request('/solutions',       { method: 'POST',   body: json(data) }),
     updateSolution:  (id, data)=> request(`/solutions/${id}`, { method: 'PUT',    body: json(data) }),
     deleteSolution:  (id)      => request(`/solutions/${id}`, { method: 'DELETE' }),
     // Messages
-    getMessages: ()   => request('/messages'),
+    getMessagesPage: (params) => requestPage('/messages', params),
     getMessage:  (id) => request(`/messages/${id}`),
+    // Dashboard totals
+    getCounts: () => request('/stats/counts'),
     // Process message
-    processMessage: (message, response_style) =>
-      request('/process-message', { method: 'POST', body: json({ message, response_style }) }),
+    processMessage: (message, response_style, dry_run = false) =>
+      request('/process-message', { method: 'POST', body: json({ message, response_style, dry_run }) }),
     // Test cases
     getTestCases:   ()         => request('/test-cases'),
     updateTestCase: (id, data) => request(`/test-cases/${id}`, { method: 'PUT', body: json(data) }),
@@ -62,6 +62,27 @@ function useData(fetchFn) {
   return { data, loading, error, reload, setData };
 }
 
+// Keyset-paginated lists: the first page on mount, `loadMore()` appends the
+// page behind `nextCursor` (null on the last page).
+function usePagedData(fetchPage) {
+  const { data, loading, error, reload, setData } = useData(() => fetchPage());
+  const [loadingMore, setLoadingMore] = useState(false);
+  async function loadMore() {
+    if (!data?.nextCursor) return;
+    setLoadingMore(true);
+    try { const next = await fetchPage({ cursor: data.nextCursor }); setData(p => ({ items: [...p.items, ...next.items], nextCursor: next.nextCursor })); }
+    catch (e) { toast.error(e.message); }
+    finally { setLoadingMore(false); }
+  }
+  const setItems = (fn) => setData(p => ({ items: fn(p?.items || []), nextCursor: p?.nextCursor ?? null }));
+  return { items: data?.items, nextCursor: data?.nextCursor, loading, loadingMore, error, reload, loadMore, setItems };
+}
+
+function LoadMore({ list }) {
+  if (list.loading || !list.nextCursor) return null;
+  return <div className="flex justify-center mt-5"><Button variant="ghost" onClick={list.loadMore} disabled={list.loadingMore}>{list.loadingMore ? 'Loading…' : 'Load more'}</Button></div>;
+}
+
 /* ══════════════════════════════════════════
    ROUTER
 ══════════════════════════════════════════ */
@@ -149,10 +170,8 @@ function RequireAuth({ children, minRole = 'user', onLogin }) {
 ══════════════════════════════════════════ */
 function HomePage({ navigate }) {
   const { role, isDev, isUser } = useAuth();
-  const orgs     = useData(() => window.api.getOrganizations());
-  const projects = useData(() => window.api.getProjects());
-  const problems = useData(() => window.api.getProblems());
-  const messages = useData(() => window.api.getMessages());
+  const { data: counts } = useData(() => window.api.getCounts());
+  const count = (name) => counts ? `${counts.approximate?.includes(name) ? '~' : ''}${counts[name].toLocaleString()}` : '—';
 
   const cards = [
     { page: 'organizations',   icon: '🏢', title: 'Organizations', desc: 'Partner groups & NGOs',          always: true },
@@ -188,10 +207,10 @@ function HomePage({ navigate }) {
         ))}
       </div>
       <div className="grid grid-cols-2 sm:grid-cols-4 gap-4">
-        <StatCard label="Organizations" value={orgs.data?.length    ?? '—'} icon="🏢" color="navy"  />
-        <StatCard label="Projects"      value={projects.data?.length ?? '—'} icon="📋" color="coral" />
-        {isDev && <StatCard label="Problems" value={problems.data?.length ?? '—'} icon="⚠️" color="teal"  />}
-        {isDev && <StatCard label="Messages" value={messages.data?.length ?? '—'} icon="💬" color="sage"  />}
+        <StatCard label="Organizations" value={count('organizations')} icon="🏢" color="navy"  />
+        <StatCard label="Projects"      value={count('projects')}      icon="📋" color="coral" />
+        {isDev && <StatCard label="Problems" value={count('problems')} icon="⚠️" color="teal"  />}
+        {isDev && <StatCard label="Messages" value={count('messages')} icon="💬" color="sage"  />}
       </div>
     </div>
   );
@@ -500,11 +519,12 @@ function ProjectFormModal({ project, orgs, mode='edit', onSave, onClose, inline,
    PROBLEMS (developer only)
 ══════════════════════════════════════════ */
 function ProblemsPage({ navigate }) {
-  const { data: problems, loading, error, reload, setData } = useData(() => window.api.getProblems());
+  const list = usePagedData(window.api.getProblemsPage);
+  const { items: problems, loading, error, reload } = list;
   const [search, setSearch] = useState('');
   const [showForm, setShowForm] = useState(false);
   async function handleAdd(form) {
-    try { const c=await window.api.createProblem(form); setData(p=>[...(p||[]),c]); setShowForm(false); toast('Problem added'); }
+    try { const c=await window.api.createProblem(form); list.setItems(p=>[c,...p]); setShowForm(false); toast('Problem added'); }
     catch(e) { toast.error(e.message); }
   }
   const filtered = (problems||[]).filter(p=>p.name.toLowerCase().includes(search.toLowerCase())||(p.context||'').toLowerCase().includes(search.toLowerCase()));
@@ -526,6 +546,7 @@ function ProblemsPage({ navigate }) {
           ))}
         </div>
       )}
+      <LoadMore list={list} />
       {showForm && <ProblemFormModal onSave={handleAdd} onClose={()=>setShowForm(false)} />}
     </div>
   );
@@ -576,10 +597,11 @@ function ProblemFormModal({ problem, onSave, onClose }) {
    SOLUTIONS (developer only)
 ══════════════════════════════════════════ */
 function SolutionsPage({ navigate }) {
-  const { data: solutions, loading, error, reload, setData } = useData(()=>window.api.getSolutions());
+  const list = usePagedData(window.api.getSolutionsPage);
+  const { items: solutions, loading, error, reload } = list;
   const [search, setSearch] = useState('');
   const [showForm, setShowForm] = useState(false);
-  async function handleAdd(form) { try { const c=await window.api.createSolution(form); setData(s=>[...(s||[]),c]); setShowForm(false); toast('Added'); } catch(e){toast.error(e.message);} }
+  async function handleAdd(form) { try { const c=await window.api.createSolution(form); list.setItems(s=>[c,...s]); setShowForm(false); toast('Added'); } catch(e){toast.error(e.message);} }
   const filtered = (solutions||[]).filter(s=>s.name.toLowerCase().includes(search.toLowerCase())||(s.context||'').toLowerCase().includes(search.toLowerCase()));
   return (
     <div className="max-w-5xl mx-auto px-6 py-8">
@@ -596,6 +618,7 @@ function SolutionsPage({ navigate }) {
           ))}
         </div>
       )}
+      <LoadMore list={list} />
       {showForm && <SolutionFormModal onSave={handleAdd} onClose={()=>setShowForm(false)} />}
     </div>
   );
@@ -691,12 +714,13 @@ function ProcessMessagePage({ navigate }) {
    MESSAGES (developer only)
 ══════════════════════════════════════════ */
 function MessagesPage({ navigate }) {
-  const { data: messages, loading, error, reload } = useData(()=>window.api.getMessages());
+  const list = usePagedData(window.api.getMessagesPage);
+  const { items: messages, loading, error, reload } = list;
   const [search, setSearch] = useState('');
   const filtered = (messages||[]).filter(m=>(m.text||'').toLowerCase().includes(search.toLowerCase())||(m.user_username||'').toLowerCase().includes(search.toLowerCase()));
   return (
     <div className="max-w-4xl mx-auto px-6 py-8">
-      <PageHeader title="Messages" subtitle={messages?`${messages.length} processed messages`:''} />
+      <PageHeader title="Messages" subtitle={messages?`${messages.length}${list.nextCursor?'+':''} processed messages`:''} />
       {error && <ApiErrorBanner error={error} onRetry={reload} />}
       <SearchBar value={search} onChange={e=>setSearch(e.target.value)} placeholder="Search messages…" />
       {loading ? <Spinner /> : filtered.length===0
@@ -716,6 +740,7 @@ function MessagesPage({ navigate }) {
             </Card>
           ))}</div>
       }
+      <LoadMore list={list} />
     </div>
   );
 }
@@ -890,7 +915,7 @@ function BotTestLabPage() {
     .slice(0, limit ? Number(limit) : undefined);
 
   async function runOne(c) {
-    const res    = await window.api.processMessage(c.message_input, c.style);
+    const res    = await window.api.processMessage(c.message_input, c.style, true);
     const output = (res?.text || '').trim();
     await window.api.updateTestCase(c.id, { output });
     setData(prev => prev.map(x => x.id === c.id ? { ...x, output } : x));
@@ -898,7 +923,7 @@ function BotTestLabPage() {
   }
 
   async function rerunOne(c) {
-    const res = await window.api.processMessage(c.message_input, c.style);
+    const res = await window.api.processMessage(c.message_input, c.style, true);
     const new_output = (res?.text || '').trim();
     await window.api.updateTestCase(c.id, { new_output });
     setData(prev => prev.map(x => x.id === c.id ? { ...x, new_output } : x));
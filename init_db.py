@@ -14,6 +14,7 @@ import psycopg2
 import psycopg2.extras
 from dotenv import load_dotenv
 from db.config import DEFAULT_DATABASE_URL, get_database_url
+from utils.vectors import to_pgvector
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
@@ -199,7 +200,7 @@ def run_embeddings(conn):
     for row in rows:
         text = f"{row['name']}: {row['description'] or ''}"
         emb = get_embedding(text)
-        emb_str = "[" + ",".join(str(v) for v in emb) + "]"
+        emb_str = to_pgvector(emb)
         cur.execute(
             """INSERT INTO public.organizations_vec (organization_id, text_to_embed, embedding)
                VALUES (%s, %s, %s::vector)
@@ -222,7 +223,7 @@ def run_embeddings(conn):
     for row in rows:
         text = f"{row['name']}: {row['description'] or ''}"
         emb = get_embedding(text)
-        emb_str = "[" + ",".join(str(v) for v in emb) + "]"
+        emb_str = to_pgvector(emb)
         cur.execute(
             """INSERT INTO public.projects_vec (project_id, text_to_embed, embedding)
                VALUES (%s, %s, %s::vector)
@@ -245,7 +246,7 @@ def run_embeddings(conn):
     for row in rows:
         text = f"{row['name']}: {row['context'] or ''} {row['content'] or ''}"
         emb = get_embedding(text)
-        emb_str = "[" + ",".join(str(v) for v in emb) + "]"
+        emb_str = to_pgvector(emb)
         cur.execute(
             """INSERT INTO public.problems_vec (problem_id, text_to_embed, embedding)
                VALUES (%s, %s, %s::vector)
@@ -272,7 +273,7 @@ def run_embeddings(conn):
     for row in rows:
         text = f"{row['name']}: {row['context'] or ''} {row['content'] or ''}"
         emb = get_embedding(text)
-        emb_str = "[" + ",".join(str(v) for v in emb) + "]"
+        emb_str = to_pgvector(emb)
         cur.execute(
             """INSERT INTO public.solutions_vec (solution_id, text_to_embed, embedding)
                VALUES (%s, %s, %s::vector)
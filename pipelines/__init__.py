@@ -10,8 +10,9 @@ Design:
 - This file re-exports selected symbols and defines `__all__` so callers can
   import from `pipelines` without needing module-level knowledge.
 """
-from .change_style import STYLES, STYLE_LABELS_UA, STYLE_LABELS, pipeline_change_style, resolve_style
+from .change_style import STYLES, STYLE_LABELS_UA, STYLE_LABELS, pipeline_change_style, effective_style, resolve_style
 from .message_orchestrator import pipeline_process_message
+from .org_categories import ORG_CATEGORIES, ORG_CATEGORIES_BY_SLUG, match_org_category
 from .pipeline_factory import (
     ABOUT_TEXT,
     START_TEXT,
@@ -20,6 +21,7 @@ from .pipeline_factory import (
 )
 from .problem_solution import pipeline_problem_solution
 from .show_organizations import pipeline_show_orgs
+from .stage_graph import Stage, StageError, StageGraph
 __all__ = [
     "pipeline_process_message",
     "pipeline_problem_solution",
@@ -28,9 +30,16 @@ __all__ = [
     "pipeline_about_me",
     "pipeline_start",
     "resolve_style",
+    "effective_style",
     "STYLES",
     "STYLE_LABELS_UA",
     "STYLE_LABELS",
     "ABOUT_TEXT",
     "START_TEXT",
+    "ORG_CATEGORIES",
+    "ORG_CATEGORIES_BY_SLUG",
+    "match_org_category",
+    "Stage",
+    "StageError",
+    "StageGraph",
 ]
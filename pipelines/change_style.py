@@ -19,7 +19,8 @@ Core logic:
    - a style-picker help message when style is missing/invalid.
 
 Style precedence model:
-- Runtime response style is resolved elsewhere through `resolve_style(...)`:
+- Runtime response style is resolved elsewhere through `effective_style(...)`
+  (styles loaded by `queries.load_session`) or `resolve_style(...)`:
   user non-default style -> chat non-default style -> user/default `normal`.
 """
 
@@ -80,16 +81,21 @@ def _style_help_line(style: str, lang: str = "uk") -> str:
     )
 
 
-def resolve_style(user_id: int, chat_id: int) -> str:
-    user_style = queries.get_user_style(user_id)
+def effective_style(user_style: str | None, chat_style: str | None) -> str:
     if user_style and user_style != "normal":
         return user_style
-    chat_style = queries.get_chat_style(chat_id)
     if chat_style and chat_style != "normal":
         return chat_style
     return user_style or "normal"
 
 
+def resolve_style(user_id: int, chat_id: int) -> str:
+    user_style = queries.get_user_style(user_id)
+    if user_style and user_style != "normal":
+        return user_style
+    return effective_style(user_style, queries.get_chat_style(chat_id))
+
+
 async def pipeline_change_style(
     user_id: int,
     chat_id: int,
@@ -0,0 +1,126 @@
+"""
+Per-message latency budget.
+
+Purpose:
+- Bound the end-to-end latency of one incoming message across routing, the
+  selected pipeline and the style rewrite.
+- Derive a timeout for every LLM/DB call from what is left of the budget, so a
+  slow provider cannot stretch a reply to a minute.
+- Let optional stages (graph linking, style rewrite) be skipped when the
+  remaining budget is too small, and record per-stage timings and overruns.
+
+Usage:
+- The orchestrator creates one `Deadline` per message and passes it through
+  `PipelineContext.deadline`.
+- `Deadline()` (no budget) is unbounded: `timeout()` returns the cap (or None),
+  `can_afford()` is always true. Callers outside the bot (server, scripts) use it
+  to keep pre-deadline behavior.
+- An optional `cancelled` event (set by the bot's coalescer when a follow-up
+  message supersedes this one) is checked at the start of every `stage()`;
+  once set, the next stage raises `Superseded` instead of running, so no
+  further LLM calls are made and nothing is saved.
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Never hand out a timeout shorter than this; a call that cannot finish in
+# half a second is better skipped by the caller than started.
+MIN_CALL_TIMEOUT_SECONDS = 0.5
+
+
+class Superseded(BaseException):
+    """The message was superseded by a newer one; abandon it at the next stage.
+
+    A BaseException, like `asyncio.CancelledError`, so the pipelines' broad
+    `except Exception` fallbacks let it through instead of replying with an error.
+    """
+
+
+class Deadline:
+    __slots__ = ("budget", "expires_at", "timings", "overruns", "skipped", "_clock", "_started", "_cancelled")
+
+    def __init__(
+        self,
+        budget_seconds: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        cancelled: threading.Event | None = None,
+    ):
+        self._clock = clock
+        self._cancelled = cancelled
+        self._started = clock()
+        self.budget = budget_seconds
+        self.expires_at = math.inf if budget_seconds is None else self._started + budget_seconds
+        self.timings: dict[str, float] = {}
+        self.overruns: dict[str, float] = {}
+        self.skipped: list[str] = []
+
+    @property
+    def bounded(self) -> bool:
+        return self.budget is not None
+
+    def elapsed(self) -> float:
+        return self._clock() - self._started
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def can_afford(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+    def timeout(self, cap: float | None = None) -> float | None:
+        """Timeout for the next call: the remaining budget, optionally capped."""
+        if not self.bounded:
+            return cap
+        remaining = max(self.remaining(), MIN_CALL_TIMEOUT_SECONDS)
+        return remaining if cap is None else min(remaining, cap)
+
+    def timed(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Callable[[], Any]:
+        """Zero-arg call of `fn` whose `timeout` is taken when the call starts.
+
+        For calls queued behind a concurrency limit (`fan_out`): a timeout taken
+        when the call list is built would be stale by the time the call runs.
+        """
+        return lambda: fn(*args, timeout=self.timeout(), **kwargs)
+
+    def check_cancelled(self) -> None:
+        """Raise `Superseded` if the message was superseded."""
+        if self._cancelled is not None and self._cancelled.is_set():
+            raise Superseded()
+
+    def skip(self, stage: str) -> None:
+        self.skipped.append(stage)
+        logger.info(f"Skipping stage={stage}: {self.remaining():.2f}s of budget left")
+
+    @contextmanager
+    def stage(self, name: str, allowance: float | None = None) -> Iterator[None]:
+        """Time a stage; record an overrun if it outlived its allowance or the budget."""
+        self.check_cancelled()
+        remaining_at_start = self.remaining()
+        started = self._clock()
+        try:
+            yield
+        finally:
+            took = self._clock() - started
+            self.timings[name] = self.timings.get(name, 0.0) + took
+            limit = remaining_at_start if allowance is None else min(allowance, remaining_at_start)
+            if took > limit:
+                self.overruns[name] = self.overruns.get(name, 0.0) + (took - limit)
+                logger.warning(f"Stage {name} overran its budget by {took - limit:.2f}s")
+
+    def summary(self) -> dict:
+        return {
+            "budget": self.budget,
+            "elapsed": round(self.elapsed(), 3),
+            "timings": {k: round(v, 3) for k, v in self.timings.items()},
+            "overruns": {k: round(v, 3) for k, v in self.overruns.items()},
+            "skipped": list(self.skipped),
+        }
@@ -0,0 +1,187 @@
+"""
+Background graph linker.
+
+Purpose:
+- Take graph writes (solution -> organization/project links and
+  problem -> solution links) off the reply path. The pipeline enqueues them
+  and answers from direct vector retrieval; a worker thread writes the links.
+
+Batching and deduplication:
+- The worker waits up to `flush_interval` seconds for `batch_size` jobs, then
+  processes them together.
+- A solution is linked to organizations/projects once per batch and is skipped
+  if it was linked recently (`recent_limit` ids are remembered); near-duplicate
+  solutions reuse one id, so popular topics would otherwise be re-linked on
+  every message.
+- problem -> solution pairs are merged by key (keeping the highest score) and
+  written in one statement.
+
+Observability:
+- `snapshot()` reports queue depth, lag (age of the oldest queued job and the
+  lag of the last processed batch), counters and the last error. Failures are
+  logged as warnings and counted; failed writes are not retried, because the
+  next message on the same topic enqueues them again.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from utils.vectors import Embedding
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class _LinkJob:
+    solutions: list[tuple[int, Embedding]]
+    pairs: list[tuple[int, int, float]]
+    enqueued_at: float = field(default=0.0)
+
+
+class GraphLinker:
+    def __init__(
+        self,
+        link_solution: Callable[[int, Embedding], None],
+        link_pairs: Callable[[list[tuple[int, int, float]]], None],
+        batch_size: int = 32,
+        flush_interval: float = 1.0,
+        recent_limit: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._link_solution = link_solution
+        self._link_pairs = link_pairs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recent_limit = recent_limit
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._jobs: deque[_LinkJob] = deque()
+        self._recent_solutions: OrderedDict[int, None] = OrderedDict()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._enqueued = 0
+        self._deduplicated = 0
+        self._linked_solutions = 0
+        self._linked_pairs = 0
+        self._failures = 0
+        self._last_error: str | None = None
+        self._last_batch_lag = 0.0
+
+    def enqueue(
+        self,
+        solutions: list[tuple[int, Embedding]],
+        pairs: list[tuple[int, int, float]],
+    ) -> None:
+        """Queue links for the worker; starts the worker on first use."""
+        if not solutions and not pairs:
+            return
+        with self._cond:
+            self._jobs.append(_LinkJob(list(solutions), list(pairs), self._clock()))
+            self._enqueued += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="graph-linker", daemon=True)
+                self._thread.start()
+            # Wake the worker for the first job (it then waits out the flush
+            # interval) or a full batch; other enqueues just join the batch.
+            if len(self._jobs) == 1 or len(self._jobs) >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._jobs and not self._stopping:
+                    self._cond.wait()
+                if not self._jobs:
+                    return
+                if len(self._jobs) < self.batch_size and not self._stopping:
+                    self._cond.wait(self.flush_interval)
+            self.process_pending()
+
+    def process_pending(self) -> int:
+        """Process one batch of queued jobs in the calling thread; return its size."""
+        with self._cond:
+            jobs = [self._jobs.popleft() for _ in range(min(self.batch_size, len(self._jobs)))]
+        if jobs:
+            self._process_batch(jobs)
+        return len(jobs)
+
+    def _process_batch(self, jobs: list[_LinkJob]) -> None:
+        solutions: dict[int, Embedding] = {}
+        pairs: dict[tuple[int, int], float] = {}
+        deduplicated = 0
+        for job in jobs:
+            for solution_id, embedding in job.solutions:
+                if solution_id in solutions or solution_id in self._recent_solutions:
+                    deduplicated += 1
+                    continue
+                solutions[solution_id] = embedding
+            for problem_id, solution_id, score in job.pairs:
+                key = (problem_id, solution_id)
+                if key in pairs:
+                    deduplicated += 1
+                pairs[key] = max(score, pairs.get(key, score))
+
+        linked_solutions, failures, last_error = 0, 0, None
+        for solution_id, embedding in solutions.items():
+            try:
+                self._link_solution(solution_id, embedding)
+            except Exception as e:
+                failures += 1
+                last_error = f"solution {solution_id}: {e}"
+                logger.warning(f"Background linking failed for solution {solution_id}: {e}")
+                continue
+            linked_solutions += 1
+            self._recent_solutions[solution_id] = None
+            if len(self._recent_solutions) > self.recent_limit:
+                self._recent_solutions.popitem(last=False)
+        linked_pairs = 0
+        if pairs:
+            try:
+                self._link_pairs([(p, s, score) for (p, s), score in pairs.items()])
+                linked_pairs = len(pairs)
+            except Exception as e:
+                failures += 1
+                last_error = f"problem-solution pairs: {e}"
+                logger.warning(f"Background linking failed for {len(pairs)} problem-solution pair(s): {e}")
+
+        lag = self._clock() - min(job.enqueued_at for job in jobs)
+        with self._cond:
+            self._deduplicated += deduplicated
+            self._linked_solutions += linked_solutions
+            self._linked_pairs += linked_pairs
+            self._failures += failures
+            if last_error:
+                self._last_error = last_error
+            self._last_batch_lag = lag
+        logger.info(
+            f"Linked batch: jobs={len(jobs)} solutions={linked_solutions} pairs={linked_pairs} "
+            f"deduplicated={deduplicated} failures={failures} lag={lag:.2f}s"
+        )
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Drain the queue and stop the worker (registered at interpreter exit)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            oldest = self._jobs[0].enqueued_at if self._jobs else None
+            return {
+                "queue_depth": len(self._jobs),
+                "oldest_job_age": round(self._clock() - oldest, 3) if oldest is not None else 0.0,
+                "last_batch_lag": round(self._last_batch_lag, 3),
+                "enqueued": self._enqueued,
+                "deduplicated": self._deduplicated,
+                "linked_solutions": self._linked_solutions,
+                "linked_pairs": self._linked_pairs,
+                "failures": self._failures,
+                "last_error": self._last_error,
+            }
@@ -4,23 +4,60 @@ Message orchestrator pipeline.
 Purpose:
 - Serve as the single entrypoint for incoming user text.
 - Select pipeline intent and delegate execution to a factory-created handler.
+- Own the per-message latency budget (`Deadline`): created here, passed through
+  `PipelineContext`, and used to skip the style rewrite when time is short.
+- Consult the overload governor (`pipelines.overload.OVERLOAD`): in degraded
+  mode routing uses keyword heuristics instead of `detect_pipeline`, the style
+  rewrite is skipped and pipelines run their cheap variants.
+- With `SPECULATIVE_EXTRACTION=on`, start `problem_solution`'s extraction and
+  history fetch while `detect_pipeline` runs (`pipelines.speculation`); the
+  results are used if routing confirms `problem_solution`, discarded otherwise.
+- Bootstrap the session in one round trip (`queries.load_session`, none when
+  `queries.SESSION_CACHE` holds it): the user/chat rows, both response styles
+  and the previous exchange for routing.
+- Persist each answered message's stage timings (`message_stage_timings`,
+  keyed by `message_id`); the server aggregates them on `/stats/latency`.
+- Abandon a message whose `cancel_event` is set (the bot's coalescer
+  superseded it): the next stage raises `Superseded`, so no further LLM call
+  runs and nothing is saved; the caller gets an empty reply.
 """
 
 import logging
+import os
+import threading
 
 from db import queries
 from utils import llm
 
 from .telegram_format import sanitize_markdown
 
-from .change_style import resolve_style
+from .change_style import effective_style
+from .deadline import Deadline, Superseded
+from .org_categories import match_org_category
+from .overload import OVERLOAD
 from .pipeline_factory import PipelineContext, PipelineFactory
+from .recommendation import EXTRACTION_MIN_BUDGET_SECONDS
+from .speculation import SPECULATIVE_EXTRACTION, Speculation
 
 logger = logging.getLogger(__name__)
 
 PIPELINE_FACTORY = PipelineFactory()
 INTENT_PIPELINES = PIPELINE_FACTORY.intents
 
+# End-to-end budget for one message, from routing to the saved reply.
+MESSAGE_BUDGET_SECONDS = float(os.getenv("MESSAGE_BUDGET_SECONDS", "25"))
+# The style rewrite is cosmetic; below this much remaining budget the baseline
+# reply is sent as is.
+STYLE_REWRITE_MIN_BUDGET_SECONDS = 4.0
+# Timings are written after the reply is final; never hold it up for long.
+STAGE_TIMINGS_TIMEOUT_SECONDS = 1.0
+
+# Keyword hints for routing without an LLM call (degraded mode). Matched as
+# substrings of the lowercased message, so stems cover inflected forms.
+_STYLE_HINTS = ("стиль", "style", "ввічлив", "politely", "саркаст", "sarcas", "смішн", "funny")
+_ABOUT_HINTS = ("хто ти", "що ти вмієш", "як тобою", "who are you", "what can you do", "how do you work")
+_ORGS_HINTS = ("організац", "фонд", "нго", "гаряч", "organization", "organisation", "ngo", "charit", "hotline")
+
 
 def _apply_style_filter(
     reply: str,
@@ -28,6 +65,7 @@ def _apply_style_filter(
     pipeline_name: str,
     lang: str = "uk",
     original_message: str | None = None,
+    deadline: Deadline | None = None,
 ) -> str:
     if not reply:
         return reply
@@ -35,8 +73,19 @@ def _apply_style_filter(
         return reply
     if style == "normal":
         return reply
+    deadline = deadline or Deadline()
+    if not deadline.can_afford(STYLE_REWRITE_MIN_BUDGET_SECONDS):
+        deadline.skip("style_rewrite")
+        return reply
     try:
-        return llm.rewrite_reply_with_style(reply, style, lang=lang, original_message=original_message)
+        with deadline.stage("style_rewrite"):
+            return llm.rewrite_reply_with_style(
+                reply,
+                style,
+                lang=lang,
+                original_message=original_message,
+                timeout=deadline.timeout(),
+            )
     except Exception as e:
         logger.warning(f"Style filter failed for pipeline={pipeline_name}: {e}")
         return reply
@@ -45,6 +94,7 @@ def _apply_style_filter(
 def _detect_pipeline_name(
     message_text: str,
     last_message_context: dict | None = None,
+    timeout: float | None = None,
 ) -> str:
     """Safely detect the intent pipeline. Fall back to problem_solution."""
     try:
@@ -65,6 +115,7 @@ def _detect_pipeline_name(
                 if isinstance(last_message_context, dict)
                 else None
             ),
+            timeout=timeout,
         )
     except Exception as e:
         logger.warning(
@@ -79,13 +130,49 @@ def _detect_pipeline_name(
     return detected if detected in INTENT_PIPELINES else "problem_solution"
 
 
-def _get_last_message_context(chat_id: int, user_id: int) -> dict | None:
+def _heuristic_pipeline_name(message_text: str, last_message_context: dict | None = None) -> str:
+    """Route by keywords only; used instead of `detect_pipeline` under overload."""
+    text = (message_text or "").strip().lower()
+    if any(hint in text for hint in _STYLE_HINTS):
+        return "change_style"
+    if any(hint in text for hint in _ABOUT_HINTS):
+        return "about_me"
+    if any(hint in text for hint in _ORGS_HINTS):
+        return "show_orgs"
+    if match_org_category(text):
+        return "show_orgs"
+    previous_pipeline = (
+        last_message_context.get("pipeline_used")
+        if isinstance(last_message_context, dict)
+        else None
+    )
+    if previous_pipeline == "show_orgs" and len(text.split()) <= 3:
+        return "show_orgs"
+    return "problem_solution"
+
+
+def _load_session(user_id: int, chat_id: int, chat_type: str, timeout: float | None = None) -> tuple[str, dict | None]:
+    """Return (effective style, last message context) from one statement."""
+    session = queries.load_session(user_id, chat_id, chat_type, timeout=timeout)
+    context = session.get("last_message_context")
+    style = effective_style(session.get("user_style"), session.get("chat_style"))
+    return style, context if isinstance(context, dict) else None
+
+
+def _record_stage_timings(message_id: int | None, pipeline_name: str, deadline: Deadline) -> None:
+    """Persist the message's stage timings; a failure only costs the sample."""
+    if message_id is None:
+        return
     try:
-        context = queries.get_last_message_context(chat_id, user_id)
+        queries.save_stage_timings(
+            message_id,
+            pipeline_name,
+            deadline.elapsed(),
+            deadline.timings,
+            timeout=STAGE_TIMINGS_TIMEOUT_SECONDS,
+        )
     except Exception as e:
-        logger.warning(f"Could not load last message context for routing: {e}")
-        return None
-    return context if isinstance(context, dict) else None
+        logger.warning(f"Could not save stage timings for message {message_id}: {e}")
 
 
 async def pipeline_process_message(
@@ -96,30 +183,79 @@ async def pipeline_process_message(
     tg_message_id: int = None,
     forced_pipeline: str | None = None,
     lang: str | None = None,
+    cancel_event: threading.Event | None = None,
 ) -> str:
     """
     Main message entrypoint:
-    - classify intent via LLM or explicit command override
+    - classify intent via LLM (keyword heuristics under overload) or explicit
+      command override
     - execute selected pipeline through factory
     - apply style filter and persist response
+    All stages share one `Deadline` of `MESSAGE_BUDGET_SECONDS`. Returns ""
+    if `cancel_event` was set before the reply was saved.
     """
+    with OVERLOAD.track_message() as degraded:
+        return await _process_message(
+            user_id,
+            chat_id,
+            chat_type,
+            message_text,
+            tg_message_id=tg_message_id,
+            forced_pipeline=forced_pipeline,
+            lang=lang,
+            degraded=degraded,
+            cancel_event=cancel_event,
+        )
+
+
+async def _process_message(
+    user_id: int,
+    chat_id: int,
+    chat_type: str,
+    message_text: str,
+    tg_message_id: int = None,
+    forced_pipeline: str | None = None,
+    lang: str | None = None,
+    degraded: bool = False,
+    cancel_event: threading.Event | None = None,
+) -> str:
+    deadline = Deadline(MESSAGE_BUDGET_SECONDS, cancelled=cancel_event)
+    speculation = None
+    speculation_committed = False
     try:
         if lang is None:
             lang = llm.detect_language(message_text)
-        queries.get_or_create_user(user_id)
-        queries.get_or_create_chat(chat_id, chat_type)
-        last_message_context = _get_last_message_context(chat_id, user_id)
-        pipeline_name = (
-            forced_pipeline.strip().lower()
-            if isinstance(forced_pipeline, str)
-            and forced_pipeline.strip().lower() in INTENT_PIPELINES
-            else _detect_pipeline_name(
-                message_text=message_text,
-                last_message_context=last_message_context,
+        with deadline.stage("session"):
+            style, last_message_context = _load_session(
+                user_id, chat_id, chat_type, timeout=deadline.timeout()
             )
+        if (
+            isinstance(forced_pipeline, str)
+            and forced_pipeline.strip().lower() in INTENT_PIPELINES
+        ):
+            pipeline_name = forced_pipeline.strip().lower()
+        elif degraded:
+            pipeline_name = _heuristic_pipeline_name(message_text, last_message_context)
+        else:
+            if SPECULATIVE_EXTRACTION and deadline.can_afford(EXTRACTION_MIN_BUDGET_SECONDS):
+                speculation = Speculation(message_text, chat_id, user_id, deadline)
+            with deadline.stage("routing"):
+                pipeline_name = _detect_pipeline_name(
+                    message_text=message_text,
+                    last_message_context=last_message_context,
+                    timeout=deadline.timeout(),
+                )
+            if speculation is not None:
+                if PIPELINE_FACTORY.uses_extraction(pipeline_name):
+                    speculation.commit()
+                    speculation_committed = True
+                else:
+                    speculation.discard()
+                    speculation = None
+        logger.info(
+            f"Detected pipeline: {pipeline_name} for user {user_id} "
+            f"(lang={lang}, degraded={degraded})"
         )
-        logger.info(f"Detected pipeline: {pipeline_name} for user {user_id} (lang={lang})")
-        style = resolve_style(user_id, chat_id)
         context = PipelineContext(
             user_id=user_id,
             chat_id=chat_id,
@@ -127,31 +263,49 @@ async def pipeline_process_message(
             message_text=message_text,
             tg_message_id=tg_message_id,
             lang=lang,
+            deadline=deadline,
+            degraded=degraded,
+            speculation=speculation,
         )
         pipeline = PIPELINE_FACTORY.create(pipeline_name)
         result = await pipeline.run(context)
-        reply = (
-            _apply_style_filter(
+        if not result.apply_style_filter:
+            reply = result.reply
+        elif degraded and style != "normal":
+            deadline.skip("style_rewrite")
+            reply = result.reply
+        else:
+            reply = _apply_style_filter(
                 result.reply,
                 style,
                 result.pipeline_used,
                 lang=lang,
                 original_message=message_text,
+                deadline=deadline,
             )
-            if result.apply_style_filter
-            else result.reply
-        )
         reply = sanitize_markdown(reply)
-        queries.save_message(
-            chat_id,
-            user_id,
-            message_text,
-            reply,
-            tg_message_id=tg_message_id,
-            pipeline_used=result.pipeline_used,
-        )
+        with deadline.stage("save"):
+            message_id = queries.save_message(
+                chat_id,
+                user_id,
+                message_text,
+                reply,
+                tg_message_id=tg_message_id,
+                pipeline_used=result.pipeline_used,
+            )
+        _record_stage_timings(message_id, result.pipeline_used, deadline)
+        summary = deadline.summary()
+        if summary["overruns"] or summary["skipped"]:
+            logger.warning(f"Message budget pressure pipeline={result.pipeline_used}: {summary}")
+        else:
+            logger.info(f"Message timings pipeline={result.pipeline_used}: {summary}")
         return reply
 
+    except Superseded:
+        if speculation is not None and not speculation_committed:
+            speculation.discard()
+        logger.info(f"Message superseded by a follow-up, dropped after {deadline.elapsed():.2f}s user={user_id}")
+        return ""
     except Exception as e:
         logger.error(f"pipeline_process_message error: {e}", exc_info=True)
         if lang == "en":
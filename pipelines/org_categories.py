@@ -0,0 +1,215 @@
+"""
+Organization category taxonomy for the `/orgs` flow.
+
+Purpose:
+- Offer the most common org-search topics as inline keyboard buttons.
+- Resolve typed categories locally (exact alias or close spelling), so common
+  searches skip both `llm.enrich_query` and `llm.get_embedding`.
+
+Data model:
+- `ORG_CATEGORIES` is the curated part: slug, user-facing labels, typed aliases
+  and the catalog text patterns used to seed membership.
+- Membership is auto-derived offline by `scripts/build_org_categories.py`:
+  org/project vectors matching the patterns form a seed centroid, catalog rows
+  close to that seed are added, and the final centroid is stored in
+  `org_categories`.
+- Centroids are loaded lazily and refreshed every `CENTROID_TTL_SECONDS`, so a
+  rebuild reaches running bots without a restart.
+"""
+import difflib
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from db import queries
+from utils.vectors import Embedding, as_embedding
+
+logger = logging.getLogger(__name__)
+
+CENTROID_TTL_SECONDS = 600
+FUZZY_MATCH_CUTOFF = 0.82
+MAX_CATEGORY_WORDS = 4
+
+
+@dataclass(slots=True, frozen=True)
+class OrgCategory:
+    slug: str
+    label_uk: str
+    label_en: str
+    aliases: tuple[str, ...]
+    patterns: tuple[str, ...]
+
+    def label(self, lang: str = "uk") -> str:
+        return self.label_en if lang == "en" else self.label_uk
+
+
+ORG_CATEGORIES: tuple[OrgCategory, ...] = (
+    OrgCategory(
+        slug="army",
+        label_uk="🪖 Армія",
+        label_en="🪖 Army",
+        aliases=("армія", "армії", "зсу", "військо", "військові", "оборона", "дрони", "army", "military", "defense", "drones"),
+        patterns=("%зсу%", "%військов%", "%бригад%", "%бпла%", "%оборон%"),
+    ),
+    OrgCategory(
+        slug="veterans",
+        label_uk="🎖 Ветерани",
+        label_en="🎖 Veterans",
+        aliases=("ветерани", "ветеранів", "реабілітація", "протезування", "veterans", "rehabilitation"),
+        patterns=("%ветеран%", "%реабілітац%", "%протез%"),
+    ),
+    OrgCategory(
+        slug="health",
+        label_uk="🏥 Здоровʼя",
+        label_en="🏥 Health",
+        aliases=("здоровʼя", "здоров'я", "медицина", "лікарні", "health", "healthcare", "medicine", "hospitals"),
+        patterns=("%медич%", "%лікар%", "%здоров%", "%госпітал%"),
+    ),
+    OrgCategory(
+        slug="children",
+        label_uk="🧒 Діти",
+        label_en="🧒 Children",
+        aliases=("діти", "дітей", "дитинство", "сироти", "children", "kids", "orphans"),
+        patterns=("%діт%", "%дитяч%", "%дитин%"),
+    ),
+    OrgCategory(
+        slug="education",
+        label_uk="📚 Освіта",
+        label_en="📚 Education",
+        aliases=("освіта", "освіти", "школи", "навчання", "education", "schools", "learning"),
+        patterns=("%освіт%", "%школ%", "%навчан%"),
+    ),
+    OrgCategory(
+        slug="animals",
+        label_uk="🐾 Права тварин",
+        label_en="🐾 Animal rights",
+        aliases=("права тварин", "тварини", "тварин", "котики", "собаки", "притулки", "animal rights", "animals", "pets", "shelters"),
+        patterns=("%тварин%", "%котик%", "%собак%", "%притул%", "%animal%"),
+    ),
+    OrgCategory(
+        slug="humanitarian",
+        label_uk="📦 Гуманітарна допомога",
+        label_en="📦 Humanitarian aid",
+        aliases=("гуманітарна допомога", "гуманітарка", "переселенці", "впо", "humanitarian aid", "humanitarian", "refugees", "displaced"),
+        patterns=("%гуманітарн%", "%переселен%", "%евакуац%"),
+    ),
+    OrgCategory(
+        slug="demining",
+        label_uk="💣 Розмінування",
+        label_en="💣 Demining",
+        aliases=("розмінування", "міни", "demining", "landmines", "mines"),
+        patterns=("%розмінуван%", "%вибухонебезпеч%", "%demining%"),
+    ),
+    OrgCategory(
+        slug="rebuilding",
+        label_uk="🏗 Відбудова",
+        label_en="🏗 Rebuilding",
+        aliases=("відбудова", "відновлення", "житло", "громади", "rebuilding", "reconstruction", "housing"),
+        patterns=("%відбудов%", "%відновлен%", "%житл%"),
+    ),
+    OrgCategory(
+        slug="corruption",
+        label_uk="⚖️ Корупція",
+        label_en="⚖️ Corruption",
+        aliases=("корупція", "корупції", "прозорість", "підзвітність", "corruption", "transparency", "accountability"),
+        patterns=("%корупц%", "%прозор%", "%підзвітн%"),
+    ),
+    OrgCategory(
+        slug="human_rights",
+        label_uk="🕊 Права людини",
+        label_en="🕊 Human rights",
+        aliases=("права людини", "правозахист", "полонені", "human rights", "civil rights", "prisoners of war"),
+        patterns=("%прав людини%", "%правозахис%", "%полонен%"),
+    ),
+    OrgCategory(
+        slug="mental_health",
+        label_uk="🧠 Психологічна підтримка",
+        label_en="🧠 Mental health",
+        aliases=("психологічна підтримка", "психологія", "ментальне здоровʼя", "mental health", "psychological support", "therapy"),
+        patterns=("%психолог%", "%ментальн%", "%психічн%"),
+    ),
+)
+
+ORG_CATEGORIES_BY_SLUG: dict[str, OrgCategory] = {c.slug: c for c in ORG_CATEGORIES}
+
+_APOSTROPHES_RE = re.compile(r"[ʼ’`']")
+_NON_WORD_RE = re.compile(r"[^\w' ]+")
+
+
+def _normalize(text: str) -> str:
+    text = _APOSTROPHES_RE.sub("'", (text or "").lower())
+    text = _NON_WORD_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def _build_alias_index() -> dict[str, OrgCategory]:
+    index: dict[str, OrgCategory] = {}
+    for category in ORG_CATEGORIES:
+        for alias in (category.label_uk, category.label_en, *category.aliases):
+            key = _normalize(alias)
+            if key:
+                index.setdefault(key, category)
+    return index
+
+
+_ALIAS_INDEX = _build_alias_index()
+
+
+def match_org_category(text: str) -> OrgCategory | None:
+    """Return the known category that `text` names, or None.
+
+    Only short inputs are considered: a full complaint that happens to contain
+    "освіта" should still go through routing and enrichment.
+    """
+    normalized = _normalize(text)
+    if not normalized or len(normalized.split()) > MAX_CATEGORY_WORDS:
+        return None
+    exact = _ALIAS_INDEX.get(normalized)
+    if exact is not None:
+        return exact
+    close = difflib.get_close_matches(
+        normalized, list(_ALIAS_INDEX), n=1, cutoff=FUZZY_MATCH_CUTOFF
+    )
+    return _ALIAS_INDEX[close[0]] if close else None
+
+
+_centroids: dict[str, Embedding] = {}
+_centroids_loaded_at: float | None = None
+_centroids_lock = threading.Lock()
+
+
+def _load_centroids() -> dict[str, Embedding]:
+    try:
+        rows = queries.list_org_category_centroids()
+    except Exception as e:
+        logger.warning(f"Could not load org category centroids: {e}")
+        return {}
+    centroids = {}
+    for row in rows or []:
+        if not isinstance(row, dict):
+            continue
+        centroid = row.get("centroid")
+        if row.get("slug") in ORG_CATEGORIES_BY_SLUG and centroid is not None and len(centroid):
+            centroids[row["slug"]] = as_embedding(centroid)
+    return centroids
+
+
+def get_category_centroid(slug: str) -> Embedding | None:
+    """Return the precomputed centroid embedding for `slug`, if one was built."""
+    global _centroids, _centroids_loaded_at
+    now = time.monotonic()
+    if _centroids_loaded_at is None or now - _centroids_loaded_at > CENTROID_TTL_SECONDS:
+        with _centroids_lock:
+            if _centroids_loaded_at is None or now - _centroids_loaded_at > CENTROID_TTL_SECONDS:
+                _centroids = _load_centroids()
+                _centroids_loaded_at = now
+    return _centroids.get(slug)
+
+
+def invalidate_category_centroids() -> None:
+    """Force the next lookup to reload centroids (after a rebuild)."""
+    global _centroids_loaded_at
+    with _centroids_lock:
+        _centroids_loaded_at = None
@@ -0,0 +1,174 @@
+"""
+System-wide overload (degrade) mode.
+
+Purpose:
+- Keep the bot answering during load spikes (for example after a news event)
+  instead of letting every message run into its latency budget.
+
+Signals:
+- `in_flight`: messages currently inside `pipeline_process_message`; each one
+  holds queued LLM work, so this is the LLM queue depth seen by this process.
+- `pending_updates`: Telegram updates waiting in the bot's update queue,
+  reported by the bot handlers.
+
+Modes:
+- `normal`: full pipelines.
+- `degraded`: heuristic routing (no `detect_pipeline` call), no
+  solution->org/project linking, no style rewrite, template replies for
+  `show_orgs`.
+
+Hysteresis:
+- Enter degraded mode when either signal reaches its `enter` threshold.
+- Leave it only when both are at or below their `exit` thresholds and the mode
+  has been held for at least `min_degraded_seconds`.
+
+Overrides:
+- `OVERLOAD_MODE=auto|normal|degraded` sets the startup override; admins can
+  change it at runtime via `OVERLOAD.force(...)` (bot `/overload` command).
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+MODE_NORMAL = "normal"
+MODE_DEGRADED = "degraded"
+MODE_AUTO = "auto"
+FORCE_MODES = (MODE_AUTO, MODE_NORMAL, MODE_DEGRADED)
+
+
+class OverloadGovernor:
+    def __init__(
+        self,
+        enter_in_flight: int = 8,
+        exit_in_flight: int = 2,
+        enter_pending_updates: int = 20,
+        exit_pending_updates: int = 5,
+        min_degraded_seconds: float = 30.0,
+        forced_mode: str = MODE_AUTO,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if forced_mode not in FORCE_MODES:
+            raise ValueError(f"Unknown overload mode {forced_mode!r}; use one of {FORCE_MODES}")
+        self.enter_in_flight = enter_in_flight
+        self.exit_in_flight = exit_in_flight
+        self.enter_pending_updates = enter_pending_updates
+        self.exit_pending_updates = exit_pending_updates
+        self.min_degraded_seconds = min_degraded_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._forced_mode = forced_mode
+        self._auto_mode = MODE_NORMAL
+        self._entered_at: float | None = None
+        self._in_flight = 0
+        self._pending_updates = 0
+        self._transitions = 0
+        self._degraded_messages = 0
+        self._total_messages = 0
+        self._degraded_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "OverloadGovernor":
+        return cls(
+            enter_in_flight=int(os.getenv("OVERLOAD_ENTER_IN_FLIGHT", "8")),
+            exit_in_flight=int(os.getenv("OVERLOAD_EXIT_IN_FLIGHT", "2")),
+            enter_pending_updates=int(os.getenv("OVERLOAD_ENTER_PENDING_UPDATES", "20")),
+            exit_pending_updates=int(os.getenv("OVERLOAD_EXIT_PENDING_UPDATES", "5")),
+            min_degraded_seconds=float(os.getenv("OVERLOAD_MIN_DEGRADED_SECONDS", "30")),
+            forced_mode=(os.getenv("OVERLOAD_MODE") or MODE_AUTO).strip().lower(),
+        )
+
+    @property
+    def mode(self) -> str:
+        with self._lock:
+            return self._effective_mode()
+
+    @property
+    def degraded(self) -> bool:
+        return self.mode == MODE_DEGRADED
+
+    def _effective_mode(self) -> str:
+        return self._auto_mode if self._forced_mode == MODE_AUTO else self._forced_mode
+
+    def _evaluate(self) -> None:
+        """Apply the hysteresis rule to the current signals. Caller holds the lock."""
+        now = self._clock()
+        if self._auto_mode == MODE_NORMAL:
+            if (
+                self._in_flight >= self.enter_in_flight
+                or self._pending_updates >= self.enter_pending_updates
+            ):
+                self._auto_mode = MODE_DEGRADED
+                self._entered_at = now
+                self._transitions += 1
+                logger.warning(
+                    f"Entering degraded mode: in_flight={self._in_flight} "
+                    f"pending_updates={self._pending_updates}"
+                )
+            return
+        held = now - (now if self._entered_at is None else self._entered_at)
+        if (
+            self._in_flight <= self.exit_in_flight
+            and self._pending_updates <= self.exit_pending_updates
+            and held >= self.min_degraded_seconds
+        ):
+            self._auto_mode = MODE_NORMAL
+            self._degraded_seconds += held
+            self._entered_at = None
+            self._transitions += 1
+            logger.warning(f"Leaving degraded mode after {held:.1f}s")
+
+    def report_pending_updates(self, pending: int) -> None:
+        with self._lock:
+            self._pending_updates = max(0, int(pending))
+            self._evaluate()
+
+    @contextmanager
+    def track_message(self) -> Iterator[bool]:
+        """Count one in-flight message; yields whether it should run degraded."""
+        with self._lock:
+            self._in_flight += 1
+            self._total_messages += 1
+            self._evaluate()
+            degraded = self._effective_mode() == MODE_DEGRADED
+            if degraded:
+                self._degraded_messages += 1
+        try:
+            yield degraded
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._evaluate()
+
+    def force(self, mode: str) -> None:
+        """Override automatic switching (`normal`/`degraded`) or return to `auto`."""
+        mode = (mode or "").strip().lower()
+        if mode not in FORCE_MODES:
+            raise ValueError(f"Unknown overload mode {mode!r}; use one of {FORCE_MODES}")
+        with self._lock:
+            self._forced_mode = mode
+        logger.warning(f"Overload mode forced to {mode}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            degraded_seconds = self._degraded_seconds
+            if self._entered_at is not None:
+                degraded_seconds += self._clock() - self._entered_at
+            return {
+                "mode": self._effective_mode(),
+                "auto_mode": self._auto_mode,
+                "forced_mode": self._forced_mode,
+                "in_flight": self._in_flight,
+                "pending_updates": self._pending_updates,
+                "transitions": self._transitions,
+                "total_messages": self._total_messages,
+                "degraded_messages": self._degraded_messages,
+                "degraded_seconds": round(degraded_seconds, 1),
+            }
+
+
+OVERLOAD = OverloadGovernor.from_env()
@@ -4,17 +4,24 @@ Pipeline factory and concrete pipeline handlers.
 Purpose:
 - Encapsulate pipeline creation and execution contracts behind a factory pattern.
 - Keep pipeline-specific behavior out of message orchestrator routing glue.
+- `StagedPipeline` lets a pipeline be declared as a `StageGraph` of named
+  stages; the executor runs independent stages concurrently and records
+  per-stage timing on `ctx.deadline`.
 """
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable
 
 from utils import llm
 
 from .change_style import pipeline_change_style
+from .deadline import Deadline
 from .problem_solution import pipeline_problem_solution
-from .show_organizations import pipeline_show_orgs
+from .show_organizations import show_orgs_error_reply, show_orgs_stages
+from .speculation import Speculation
+from .stage_graph import Stage, StageGraph
+
 ABOUT_TEXT = {
     "uk": (
         "👋 *Hate-2-Action Bot*\n\n"
@@ -80,6 +87,9 @@ class PipelineContext:
     message_text: str
     tg_message_id: int | None = None
     lang: str = "uk"
+    deadline: Deadline = field(default_factory=Deadline)
+    degraded: bool = False
+    speculation: Speculation | None = None
 
 
 @dataclass(slots=True, frozen=True)
@@ -97,6 +107,36 @@ class BasePipeline(ABC):
         raise NotImplementedError
 
 
+class StagedPipeline(BasePipeline):
+    """Pipeline declared as stages; the `reply_stage` result becomes the reply.
+
+    A failed run raises unless `fallback_reply` returns text for it.
+    """
+    reply_stage: str = "generation"
+    apply_style_filter: bool = True
+
+    @abstractmethod
+    def stages(self, ctx: PipelineContext) -> list[Stage]:
+        raise NotImplementedError
+
+    def fallback_reply(self, ctx: PipelineContext, error: Exception) -> str | None:
+        return None
+
+    async def run(self, ctx: PipelineContext) -> PipelineResult:
+        try:
+            results = await StageGraph(self.stages(ctx)).run(ctx, ctx.deadline)
+            reply = results[self.reply_stage]
+        except Exception as e:
+            reply = self.fallback_reply(ctx, e)
+            if reply is None:
+                raise
+        return PipelineResult(
+            reply=reply,
+            pipeline_used=self.name,
+            apply_style_filter=self.apply_style_filter,
+        )
+
+
 class AboutPipeline(BasePipeline):
     name = "about_me"
     async def run(self, ctx: PipelineContext) -> PipelineResult:
@@ -112,7 +152,9 @@ class StartPipeline(BasePipeline):
 class ChangeStylePipeline(BasePipeline):
     name = "change_style"
     async def run(self, ctx: PipelineContext) -> PipelineResult:
-        requested_style = llm.detect_style_from_message(ctx.message_text)
+        requested_style = llm.detect_style_from_message(
+            ctx.message_text, timeout=ctx.deadline.timeout()
+        )
         reply = await pipeline_change_style(
             ctx.user_id,
             ctx.chat_id,
@@ -128,18 +170,14 @@ class ChangeStylePipeline(BasePipeline):
         )
 
 
-class ShowOrgsPipeline(BasePipeline):
+class ShowOrgsPipeline(StagedPipeline):
     name = "show_orgs"
-    async def run(self, ctx: PipelineContext) -> PipelineResult:
-        reply = await pipeline_show_orgs(
-            ctx.user_id,
-            ctx.chat_id,
-            ctx.chat_type,
-            ctx.message_text,
-            tg_message_id=ctx.tg_message_id,
-            lang=ctx.lang,
-        )
-        return PipelineResult(reply=reply, pipeline_used=self.name)
+
+    def stages(self, ctx: PipelineContext) -> list[Stage]:
+        return show_orgs_stages(ctx.message_text, ctx.lang, ctx.deadline, ctx.degraded)
+
+    def fallback_reply(self, ctx: PipelineContext, error: Exception) -> str:
+        return show_orgs_error_reply(error, ctx.lang)
 
 
 class ProcessMessagePipeline(BasePipeline):
@@ -153,6 +191,9 @@ class ProcessMessagePipeline(BasePipeline):
             ctx.message_text,
             tg_message_id=ctx.tg_message_id,
             lang=ctx.lang,
+            deadline=ctx.deadline,
+            degraded=ctx.degraded,
+            speculation=ctx.speculation,
         )
         return PipelineResult(reply=reply, pipeline_used=self.name)
 
@@ -170,6 +211,9 @@ class PipelineFactory:
     @property
     def intents(self) -> set[str]:
         return set(self._registry.keys())
+    def uses_extraction(self, pipeline_name: str) -> bool:
+        """True if `pipeline_name` runs problem/solution extraction (speculation target)."""
+        return self._registry.get(pipeline_name, self._registry["problem_solution"]) is ProcessMessagePipeline
     def create(self, pipeline_name: str) -> BasePipeline:
         builder = self._registry.get(
             pipeline_name,
@@ -0,0 +1,414 @@
+"""
+Recommendation engine shared by the bot and the admin server.
+
+Purpose:
+- Turn complaint text into recommended organizations/projects through entity
+  extraction + semantic linking. `pipeline_problem_solution` (bot) and
+  `POST /process-message` (server, reply lab) both call `recommend()`, so the
+  two cannot drift apart.
+
+Inputs:
+- `message_text`; optional `user_id`/`chat_id` to fetch chat history alongside
+  extraction.
+- Optional `speculation` (pipelines/speculation.py): extraction and history
+  already started by the orchestrator during routing.
+- `deadline` / `degraded` from the orchestrator (unbounded / off by default).
+- `dry_run`: compute everything without writing to the DB (see below).
+
+Data flow:
+1. Extract structured `problems` and `solutions` from text using LLM, while
+   chat history is fetched concurrently.
+2. Normalize entity payloads to a strict schema: `name`, `context`, `content`.
+3. Build embeddings concurrently (bounded by `FANOUT_CONCURRENCY`), then
+   upsert all problems and all solutions with one set-based statement each
+   (`queries.upsert_problems` / `upsert_solutions`: dedup probe + insert).
+4. Create graph links, concurrently per solution (or, with
+   `GRAPH_LINKING_MODE=background`, enqueue them to `GRAPH_LINKER` and skip
+   graph retrieval):
+   - solution -> organizations/projects by vector similarity threshold.
+   - problem -> solutions by cosine similarity threshold.
+5. Retrieve candidate organizations/projects with `queries.find_recommendations`,
+   one round trip: graph retrieval via problem->solution links, and, if that
+   is empty or linking was skipped, direct vector search with every fresh
+   problem and solution embedding in the same statement (or the in-process
+   catalog index). Rows carry `source` ("graph" / "vector").
+6. Fuse the per-vector rankings of the vector path by reciprocal rank
+   (`utils.ranking`). Only when no entity was embedded is the message text
+   embedded.
+
+Dry run:
+- No upserts and no link rows. Entities keep `problem_id`/`solution_id` None.
+- Solution -> organization/project links come from the same (read-only)
+  catalog search, problem -> solution links from the same similarity matrix;
+  both stay in memory and graph retrieval ranks them exactly like the SQL
+  join (sum of problem->solution x solution->catalog scores).
+- Links written by earlier messages are not consulted, so a dry run matches
+  what a fresh database would recommend. Lab runs therefore never grow the
+  graph tables.
+
+Latency budget:
+- Every LLM/DB call takes its timeout from the per-message `Deadline`.
+- Extraction is skipped when too little budget is left; the message is then
+  matched by direct vector search.
+- Graph linking (and graph retrieval, which depends on fresh links) is skipped
+  when the budget cannot cover it; retrieval falls back to direct vector search
+  with the embeddings already computed.
+
+Overload (degraded) mode:
+- Solution -> organization/project linking is skipped; problem -> solution
+  links are still written, so graph retrieval keeps working through solutions
+  linked earlier.
+
+Reliability behavior:
+- Similarity thresholds prevent weak links from polluting join tables.
+- Failures of individual concurrent tasks (history, extraction, one entity's
+  embedding, one solution's linking) are logged as warnings and the entity is
+  dropped; a failed upsert batch drops all problems (or solutions). Other
+  exceptions propagate to the caller.
+"""
+import atexit
+import logging
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from db import queries
+from utils import llm
+from utils.ranking import reciprocal_rank_fusion
+from utils.vectors import Embedding, as_embedding, cosine_matrix, stack_embeddings
+
+from .deadline import Deadline
+from .graph_linker import GraphLinker
+from .speculation import HISTORY_LIMIT, Speculation
+from .stage_graph import Stage, StageGraph, fan_out
+
+logger = logging.getLogger(__name__)
+ORG_PROJECT_LINK_THRESHOLD = 0.3
+PROBLEM_SOLUTION_LINK_THRESHOLD = 0.35
+# Remaining budget (seconds) required to start an optional stage; both leave
+# room for the final `generate_reply` call.
+EXTRACTION_MIN_BUDGET_SECONDS = 8.0
+LINKING_MIN_BUDGET_SECONDS = 8.0
+# Per-message cap on concurrent embedding/DB calls. Every DB call holds a pool
+# connection (DB_POOL_MAX, default 10) and the pool raises when exhausted, so
+# keep this well below it.
+FANOUT_CONCURRENCY = int(os.getenv("PIPELINE_FANOUT_CONCURRENCY", "4"))
+# "inline": write graph links before replying (replies use graph retrieval).
+# "background": reply from direct vector retrieval and hand the links to
+# GRAPH_LINKER.
+GRAPH_LINKING_MODE = os.getenv("GRAPH_LINKING_MODE", "inline").strip().lower()
+GRAPH_RETRIEVAL_TOP_N = 5
+FALLBACK_TOP_N = 3
+
+
+@dataclass(slots=True)
+class Recommendation:
+    """Entities extracted from a message and the catalog rows recommended for it.
+
+    `problems` / `solutions` rows carry `name`, `embedding` and their DB id
+    (`problem_id` / `solution_id`, None in a dry run).
+    """
+    problems: list[dict] = field(default_factory=list)
+    solutions: list[dict] = field(default_factory=list)
+    orgs: list[dict] = field(default_factory=list)
+    projects: list[dict] = field(default_factory=list)
+    history: list[dict] = field(default_factory=list)
+    dry_run: bool = False
+
+
+def _normalize_entities(items: list[dict] | None) -> list[dict]:
+    normalized = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        name = str(item.get("name", "")).strip()
+        if not name:
+            continue
+        normalized.append(
+            {
+                "name": name,
+                "context": str(item.get("context", "")).strip(),
+                "content": str(item.get("content", "")).strip(),
+            }
+        )
+    return normalized
+
+
+def _embedding_text(entity: dict) -> str:
+    return (
+        f"{entity['name']}: {entity.get('context', '')} {entity.get('content', '')}"
+    ).strip()
+
+
+def _solution_catalog_links(embedding: Embedding, timeout: float | None = None) -> tuple[list[dict], list[dict]]:
+    """Organizations and projects close enough to a solution to be linked to it."""
+    orgs = queries.find_orgs_by_embedding(embedding, top_n=5, timeout=timeout)
+    projects = queries.find_projects_by_embedding(embedding, top_n=5, timeout=timeout)
+    return (
+        [org for org in orgs if float(org.get("similarity", 0)) >= ORG_PROJECT_LINK_THRESHOLD],
+        [project for project in projects if float(project.get("similarity", 0)) >= ORG_PROJECT_LINK_THRESHOLD],
+    )
+
+
+def _link_solution_to_orgs_and_projects(solution_id: int, embedding: Embedding, timeout: float | None = None):
+    """Populate organizations_solutions and projects_solutions by vector similarity."""
+    orgs, projects = _solution_catalog_links(embedding, timeout=timeout)
+    with queries.db_cursor(timeout) as cur:
+        for org in orgs:
+            cur.execute(
+                """INSERT INTO organizations_solutions (organization_id, solution_id, similarity_score)
+                   VALUES (%s, %s, %s) ON CONFLICT DO NOTHING""",
+                (org["organization_id"], solution_id, float(org["similarity"])),
+            )
+        for project in projects:
+            cur.execute(
+                """INSERT INTO projects_solutions (project_id, solution_id, similarity_score)
+                   VALUES (%s, %s, %s) ON CONFLICT DO NOTHING""",
+                (project["project_id"], solution_id, float(project["similarity"])),
+            )
+
+
+def _pair_scores(problem_rows: list[dict], solution_rows: list[dict]) -> list[tuple[int, int, float]]:
+    """(problem index, solution index, score) for every pair above the link threshold.
+
+    All pairs are scored with one normalized matrix product and thresholded
+    with a mask. Problems with no solution above the threshold are left
+    unlinked rather than force-linked to their closest (but weak) match — a
+    forced link pollutes org/project retrieval with off-topic recommendations.
+    """
+    if not problem_rows or not solution_rows:
+        return []
+    scores = cosine_matrix(
+        stack_embeddings(row["embedding"] for row in problem_rows),
+        stack_embeddings(row["embedding"] for row in solution_rows),
+    )
+    return [
+        (int(i), int(j), float(scores[i, j]))
+        for i, j in zip(*np.nonzero(scores >= PROBLEM_SOLUTION_LINK_THRESHOLD))
+    ]
+
+
+def _problem_solution_pairs(problem_rows: list[dict], solution_rows: list[dict]) -> list[tuple[int, int, float]]:
+    """(problem_id, solution_id, score) for every pair above the link threshold."""
+    return [
+        (problem_rows[i]["problem_id"], solution_rows[j]["solution_id"], score)
+        for i, j, score in _pair_scores(problem_rows, solution_rows)
+    ]
+
+
+def _link_problems_to_solutions(problem_rows: list[dict], solution_rows: list[dict], timeout: float | None = None):
+    """Link each problem to its relevant solutions using cosine similarity."""
+    queries.link_problems_solutions(_problem_solution_pairs(problem_rows, solution_rows), timeout=timeout)
+
+
+def _rank_in_memory_graph(
+    pairs: list[tuple[int, int, float]],
+    solution_links: list[list[dict] | None],
+    key: str,
+    top_n: int = GRAPH_RETRIEVAL_TOP_N,
+) -> list[dict]:
+    """In-memory equivalent of `find_*_via_solutions` over unsaved links.
+
+    `pairs` are (problem index, solution index, score); `solution_links[j]`
+    holds the catalog rows (with `similarity`) linked to solution j.
+    """
+    scores: dict[int, float] = defaultdict(float)
+    rows: dict[int, dict] = {}
+    for _, j, pair_score in pairs:
+        for row in solution_links[j] or []:
+            scores[row[key]] += pair_score * float(row["similarity"])
+            rows[row[key]] = row
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    return [
+        {**{k: v for k, v in rows[item_id].items() if k != "similarity"}, "combined_score": scores[item_id]}
+        for item_id in ranked
+    ]
+
+
+def _fuse_vector_rows(rows: list[dict], key: str) -> list[dict]:
+    """Reciprocal-rank fuse vector-path rows (one ranking per query embedding)."""
+    if not rows or rows[0].get("source") != "vector":
+        return rows
+    rankings: dict[int, list[dict]] = defaultdict(list)
+    for row in rows:
+        rankings[row["query"]].append(row)
+    return reciprocal_rank_fusion(
+        [rankings[query] for query in sorted(rankings)], key, top_n=FALLBACK_TOP_N
+    )
+
+
+GRAPH_LINKER = GraphLinker(
+    link_solution=_link_solution_to_orgs_and_projects,
+    link_pairs=lambda pairs: queries.link_problems_solutions(pairs),
+)
+atexit.register(GRAPH_LINKER.stop)
+
+
+async def recommend(
+    message_text: str,
+    user_id: int | None = None,
+    chat_id: int | None = None,
+    deadline: Deadline | None = None,
+    degraded: bool = False,
+    dry_run: bool = False,
+    speculation: Speculation | None = None,
+) -> Recommendation:
+    """
+    complaint text -> structured entities -> semantic linking -> recommended orgs/projects.
+
+    Chat history is fetched only when `chat_id` is given. With a committed
+    `speculation`, extraction and history are taken from it instead.
+    """
+    deadline = deadline or Deadline()
+    stages = []
+    if speculation is not None:
+        # Started by the orchestrator while routing; only the rest is awaited.
+        async def speculative_history(_ctx):
+            return await speculation.history()
+
+        async def speculative_extraction(_ctx):
+            return await speculation.extraction()
+
+        stages += [
+            Stage("history", speculative_history, optional=True),
+            Stage("extraction", speculative_extraction, optional=True),
+        ]
+    else:
+        if chat_id is not None:
+            stages.append(
+                Stage(
+                    "history",
+                    lambda _ctx: queries.get_chat_history(
+                        chat_id, user_id, limit=HISTORY_LIMIT, timeout=deadline.timeout()
+                    ),
+                    optional=True,
+                )
+            )
+        if deadline.can_afford(EXTRACTION_MIN_BUDGET_SECONDS):
+            stages.append(
+                Stage(
+                    "extraction",
+                    lambda _ctx: llm.extract_problems_and_solutions(
+                        message_text, timeout=deadline.timeout()
+                    ),
+                    optional=True,
+                )
+            )
+        else:
+            deadline.skip("extraction")
+    results = await StageGraph(stages).run(None, deadline)
+    history = results.get("history") or []
+    extracted = results.get("extraction") or {}
+    problems_data = _normalize_entities(extracted.get("problems"))
+    solutions_data = _normalize_entities(extracted.get("solutions"))
+    entities = problems_data + solutions_data
+
+    with deadline.stage("embeddings"):
+        embeddings = await fan_out(
+            [
+                deadline.timed(llm.get_embedding, _embedding_text(entity))
+                for entity in entities
+            ],
+            FANOUT_CONCURRENCY,
+            what="Entity embedding",
+        )
+    problem_rows, solution_rows = [], []
+    for index, (entity, embedding) in enumerate(zip(entities, embeddings)):
+        if embedding is None:
+            continue
+        row = {**entity, "embedding": as_embedding(embedding)}
+        (problem_rows if index < len(problems_data) else solution_rows).append(row)
+    if dry_run:
+        problem_ids, solution_ids = [None] * len(problem_rows), [None] * len(solution_rows)
+    else:
+        with deadline.stage("upserts"):
+            problem_ids, solution_ids = await fan_out(
+                [
+                    deadline.timed(queries.upsert_problems, problem_rows),
+                    deadline.timed(queries.upsert_solutions, solution_rows),
+                ],
+                FANOUT_CONCURRENCY,
+                what="Entity upsert",
+            )
+        # A failed batch drops all entities of its kind.
+        problem_ids = problem_ids or []
+        solution_ids = solution_ids or []
+    problem_rows = [
+        {"problem_id": problem_id, "name": row["name"], "embedding": row["embedding"]}
+        for row, problem_id in zip(problem_rows, problem_ids)
+    ]
+    solution_rows = [
+        {"solution_id": solution_id, "name": row["name"], "embedding": row["embedding"]}
+        for row, solution_id in zip(solution_rows, solution_ids)
+    ]
+
+    background = GRAPH_LINKING_MODE == "background"
+    link_graph = not background and deadline.can_afford(LINKING_MIN_BUDGET_SECONDS)
+    orgs, projects, graph_problem_ids = [], [], []
+    if background:
+        if not dry_run:
+            GRAPH_LINKER.enqueue(
+                [] if degraded else [(row["solution_id"], row["embedding"]) for row in solution_rows],
+                _problem_solution_pairs(problem_rows, solution_rows),
+            )
+    elif link_graph and dry_run:
+        with deadline.stage("linking"):
+            solution_links = [None] * len(solution_rows) if degraded else await fan_out(
+                [
+                    deadline.timed(_solution_catalog_links, row["embedding"])
+                    for row in solution_rows
+                ],
+                FANOUT_CONCURRENCY,
+                what="Graph linking",
+            )
+        pairs = _pair_scores(problem_rows, solution_rows)
+        orgs = _rank_in_memory_graph(pairs, [links and links[0] for links in solution_links], "organization_id")
+        projects = _rank_in_memory_graph(pairs, [links and links[1] for links in solution_links], "project_id")
+    elif link_graph:
+        link_calls = [] if degraded else [
+            deadline.timed(_link_solution_to_orgs_and_projects, row["solution_id"], row["embedding"])
+            for row in solution_rows
+        ]
+        link_calls.append(
+            deadline.timed(_link_problems_to_solutions, problem_rows, solution_rows)
+        )
+        with deadline.stage("linking"):
+            await fan_out(link_calls, FANOUT_CONCURRENCY, what="Graph linking")
+        graph_problem_ids = [row["problem_id"] for row in problem_rows]
+    else:
+        deadline.skip("linking")
+    if not orgs and not projects:
+        # One round trip: graph retrieval, and direct vector search only if
+        # the graph finds nothing.
+        fallback_embeddings = [row["embedding"] for row in problem_rows + solution_rows]
+        if not fallback_embeddings:
+            with deadline.stage("embeddings"):
+                fallback_embeddings = [llm.get_embedding(message_text, timeout=deadline.timeout())]
+        with deadline.stage("retrieval"):
+            (retrieved,) = await fan_out(
+                [
+                    deadline.timed(
+                        queries.find_recommendations,
+                        graph_problem_ids,
+                        fallback_embeddings,
+                        top_n=GRAPH_RETRIEVAL_TOP_N,
+                        fallback_top_n=FALLBACK_TOP_N,
+                        min_similarity=ORG_PROJECT_LINK_THRESHOLD,
+                    )
+                ],
+                FANOUT_CONCURRENCY,
+                what="Retrieval",
+            )
+        orgs, projects = retrieved or ([], [])
+        orgs = _fuse_vector_rows(orgs, "organization_id")
+        projects = _fuse_vector_rows(projects, "project_id")
+    return Recommendation(
+        problems=problem_rows,
+        solutions=solution_rows,
+        orgs=orgs or [],
+        projects=projects or [],
+        history=history,
+        dry_run=dry_run,
+    )
@@ -5,28 +5,153 @@ Purpose:
 - Return relevant organizations and projects for an explicit user category/topic.
 
 Inputs:
-- `user_id`, `chat_id`, `chat_type` for context and persistence.
+- `user_id`, `chat_id`, `chat_type` for the orchestrator's interface; the
+  user/chat rows already exist (`load_session`, before routing).
 - `category_message` containing the requested domain (for example climate, health).
 - Optional `tg_message_id` for Telegram traceability.
 
-Execution steps:
-1. Ensure user/chat records exist.
-2. Enrich category query text through LLM to improve semantic recall.
-3. Convert enriched query into embedding vector.
-4. Run nearest-neighbor search for organizations and projects.
-5. Generate a baseline response (normal tone) from retrieved candidates.
-6. Return text to orchestrator for tone filtering and persistence.
+Execution steps (stages of one `StageGraph`, see `show_orgs_stages`):
+1. `query_vector`: resolve the category locally against the `/orgs` taxonomy;
+   a known category with a precomputed centroid is used directly (no
+   LLM/embedding calls). Otherwise enrich the category text through the LLM
+   and embed it. Short queries (at most `SHORT_QUERY_WORDS` words) are
+   embedded as-is: the lexical search already covers their exact terms.
+2. `retrieval`: vector search for organizations and projects in one
+   `find_recommendations` call, once the query vector is ready.
+3. `lexical_orgs`, `lexical_projects`: full-text search (GIN-indexed
+   `tsvector` columns, Ukrainian + English), started right away and run
+   concurrently with steps 1-2.
+4. `generation`: fuse each vector/lexical pair of rankings by reciprocal rank
+   and generate a baseline response (normal tone) from the fused candidates,
+   or render the fixed template in degraded mode.
+5. Return text to the orchestrator for tone filtering and persistence.
+
+Latency budget:
+- Every LLM/DB call takes its timeout from the per-message `Deadline`.
+
+Overload (degraded) mode:
+- Skip enrichment (the raw category text is embedded) and render the reply from
+  a fixed template instead of `generate_org_reply`; the orchestrator also skips
+  the style rewrite for these replies.
 
 Failure behavior:
+- A failed full-text stage (for example before the schema migration) is
+  logged and retrieval continues vector-only.
 - Exceptions are logged with stack traces and return a safe retry message.
 """
 import logging
 from db import queries
 from utils import llm
+from utils.ranking import reciprocal_rank_fusion
+
+from .deadline import Deadline
+from .org_categories import get_category_centroid, match_org_category
+from .stage_graph import Stage, StageGraph
 
 logger = logging.getLogger(__name__)
 
 MIN_SIMILARITY = 0.3
+TOP_N = 5
+# Queries this short skip LLM enrichment (hybrid retrieval handles them).
+SHORT_QUERY_WORDS = 3
+
+TEMPLATE_TEXT = {
+    "uk": {
+        "header": "🏢 *Організації та проєкти за запитом «{query}»:*",
+        "orgs": "*Організації:*",
+        "projects": "*Проєкти:*",
+        "empty": "😔 Не знайшлося організацій за запитом «{query}». Спробуй іншу категорію.",
+    },
+    "en": {
+        "header": "🏢 *Organizations and projects for “{query}”:*",
+        "orgs": "*Organizations:*",
+        "projects": "*Projects:*",
+        "empty": "😔 No organizations found for “{query}”. Try another category.",
+    },
+}
+
+
+def _render_org_template(query: str, orgs: list[dict], projects: list[dict], lang: str = "uk") -> str:
+    """Reply built without an LLM call, used in degraded mode."""
+    text = TEMPLATE_TEXT.get(lang, TEMPLATE_TEXT["uk"])
+    query = query.strip()
+    if not orgs and not projects:
+        return text["empty"].format(query=query)
+    lines = [text["header"].format(query=query)]
+    if orgs:
+        lines += ["", text["orgs"]]
+        for org in orgs:
+            line = f"• {org.get('name', '')}"
+            if org.get("website"):
+                line += f" — {org['website']}"
+            lines.append(line)
+    if projects:
+        lines += ["", text["projects"]]
+        for project in projects:
+            line = f"• {project.get('name', '')}"
+            if project.get("org_name"):
+                line += f" ({project['org_name']})"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def show_orgs_stages(category_message: str, lang: str, deadline: Deadline, degraded: bool) -> list[Stage]:
+    """Stages of the pipeline; the reply is the result of `generation`."""
+
+    def query_vector(_ctx):
+        category = match_org_category(category_message)
+        emb = get_category_centroid(category.slug) if category else None
+        if emb is not None:
+            logger.info(f"show_orgs: using precomputed centroid for category={category.slug}")
+            return emb
+        query = category_message
+        if not degraded and len(category_message.split()) > SHORT_QUERY_WORDS:
+            with deadline.stage("enrichment"):
+                query = llm.enrich_query(category_message, timeout=deadline.timeout())
+        return llm.get_embedding(query, timeout=deadline.timeout())
+
+    def retrieval(_ctx, query_vector):
+        # Vector path of the combined retrieval only: orgs and projects in one call.
+        return queries.find_recommendations(
+            [], [query_vector], fallback_top_n=TOP_N, min_similarity=MIN_SIMILARITY, timeout=deadline.timeout()
+        )
+
+    def lexical_orgs(_ctx):
+        return queries.find_orgs_by_text(category_message, top_n=TOP_N, timeout=deadline.timeout())
+
+    def lexical_projects(_ctx):
+        return queries.find_projects_by_text(category_message, top_n=TOP_N, timeout=deadline.timeout())
+
+    def generation(_ctx, retrieval, lexical_orgs, lexical_projects):
+        vector_orgs, vector_projects = retrieval
+        orgs = reciprocal_rank_fusion([vector_orgs, lexical_orgs], "organization_id", top_n=TOP_N)
+        projects = reciprocal_rank_fusion([vector_projects, lexical_projects], "project_id", top_n=TOP_N)
+        if degraded:
+            return _render_org_template(category_message, orgs, projects, lang=lang)
+        return llm.generate_org_reply(
+            category_message, orgs, projects, "normal",
+            lang=lang, timeout=deadline.timeout(),
+        )
+
+    return [
+        Stage("query_vector", query_vector),
+        Stage("retrieval", retrieval, depends_on=("query_vector",), retries=1),
+        Stage("lexical_orgs", lexical_orgs, optional=True),
+        Stage("lexical_projects", lexical_projects, optional=True),
+        Stage(
+            "generation",
+            generation,
+            depends_on=("retrieval", "lexical_orgs", "lexical_projects"),
+        ),
+    ]
+
+
+def show_orgs_error_reply(error: Exception, lang: str = "uk") -> str:
+    """Log a failed run; the safe retry message shown instead of a reply."""
+    logger.error(f"show_orgs pipeline error: {error}", exc_info=error)
+    if lang == "en":
+        return "⚠️ Could not find organizations right now. Please try again."
+    return "⚠️ Зараз не вдалося знайти організації. Спробуй ще раз."
 
 
 async def pipeline_show_orgs(
@@ -36,18 +161,14 @@ async def pipeline_show_orgs(
     category_message: str,
     tg_message_id: int = None,
     lang: str = "uk",
+    deadline: Deadline | None = None,
+    degraded: bool = False,
 ) -> str:
     """Find organizations by user-specified category."""
+    deadline = deadline or Deadline()
+    _ = tg_message_id
     try:
-        _ = tg_message_id
-        enriched = llm.enrich_query(category_message)
-        emb = llm.get_embedding(enriched)
-        orgs = queries.find_orgs_by_embedding(emb, top_n=5, min_similarity=MIN_SIMILARITY)
-        projects = queries.find_projects_by_embedding(emb, top_n=5, min_similarity=MIN_SIMILARITY)
-        reply = llm.generate_org_reply(category_message, orgs, projects, "normal", lang=lang)
-        return reply
+        results = await StageGraph(show_orgs_stages(category_message, lang, deadline, degraded)).run(None, deadline)
+        return results["generation"]
     except Exception as e:
-        logger.error(f"show_orgs pipeline error: {e}", exc_info=True)
-        if lang == "en":
-            return "⚠️ Could not find organizations right now. Please try again."
-        return "⚠️ Зараз не вдалося знайти організації. Спробуй ще раз."
+        return show_orgs_error_reply(e, lang)
@@ -0,0 +1,125 @@
+"""
+Speculative extraction while routing is in flight.
+
+Purpose:
+- `problem_solution` is the most common route and the routing fallback, and its
+  first step (LLM extraction, plus the chat history fetch) does not depend on
+  the routing result. With `SPECULATIVE_EXTRACTION=on` the orchestrator starts
+  both before calling `detect_pipeline`, so the two LLM calls overlap.
+
+Lifecycle:
+- `Speculation(...)` submits the calls to a dedicated thread pool (not the
+  event loop's default executor, which `asyncio.run` would wait for when a
+  speculation is discarded).
+- Routing confirms `problem_solution`: `commit()`, and `recommend()` awaits
+  the speculative results instead of issuing its own calls.
+- Any other route: `discard()`. Calls that have not started are cancelled;
+  running calls cannot be interrupted, so their cost is counted as waste.
+
+Metrics (`SPECULATION_STATS.snapshot()`, also served by the bot's health
+server on `/speculation`):
+- `hits` / `misses` / `hit_rate`.
+- `wasted_calls` and `wasted_tokens_estimate`: extraction calls whose result
+  was discarded. Tokens are estimated from text length (~4 characters per
+  token) because the LLM helpers do not return usage.
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from db import queries
+from utils import llm
+
+from .deadline import Deadline
+
+SPECULATIVE_EXTRACTION = os.getenv("SPECULATIVE_EXTRACTION", "off").strip().lower() in ("on", "1", "true")
+HISTORY_LIMIT = 6
+# Rough size of the extraction prompt template around the message.
+_EXTRACTION_PROMPT_TOKENS = 150
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATION_WORKERS", "8")), thread_name_prefix="speculation"
+)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted_calls = 0
+        self.wasted_tokens_estimate = 0
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_started(self) -> None:
+        with self._lock:
+            self.started += 1
+
+    def record_waste(self, tokens: int) -> None:
+        with self._lock:
+            self.wasted_calls += 1
+            self.wasted_tokens_estimate += tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            decided = self.hits + self.misses
+            return {
+                "enabled": SPECULATIVE_EXTRACTION,
+                "started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / decided, 3) if decided else None,
+                "wasted_calls": self.wasted_calls,
+                "wasted_tokens_estimate": self.wasted_tokens_estimate,
+            }
+
+
+SPECULATION_STATS = SpeculationStats()
+
+
+class Speculation:
+    """Extraction and history for one message, started before routing finished."""
+
+    def __init__(self, message_text: str, chat_id: int, user_id: int, deadline: Deadline):
+        self.message_text = message_text
+        self._extraction: Future = _EXECUTOR.submit(
+            llm.extract_problems_and_solutions, message_text, timeout=deadline.timeout()
+        )
+        self._history: Future = _EXECUTOR.submit(
+            queries.get_chat_history, chat_id, user_id, limit=HISTORY_LIMIT, timeout=deadline.timeout()
+        )
+        SPECULATION_STATS.record_started()
+
+    async def extraction(self) -> dict:
+        return await asyncio.wrap_future(self._extraction)
+
+    async def history(self) -> list[dict]:
+        return await asyncio.wrap_future(self._history)
+
+    def commit(self) -> None:
+        SPECULATION_STATS.record(hit=True)
+
+    def discard(self) -> None:
+        SPECULATION_STATS.record(hit=False)
+        self._history.cancel()
+        if self._extraction.cancel():
+            return
+        self._extraction.add_done_callback(self._count_waste)
+
+    def _count_waste(self, future: Future) -> None:
+        tokens = _EXTRACTION_PROMPT_TOKENS + _estimate_tokens(self.message_text)
+        if not future.cancelled() and future.exception() is None:
+            tokens += _estimate_tokens(json.dumps(future.result(), ensure_ascii=False, default=str))
+        SPECULATION_STATS.record_waste(tokens)
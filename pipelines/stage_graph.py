@@ -0,0 +1,157 @@
+"""
+Stage-graph execution for pipelines.
+
+Purpose:
+- Declare a pipeline as named stages with explicit data dependencies instead of
+  one hand-sequenced coroutine.
+- Run independent stages concurrently, with per-stage timeouts, retries and
+  timing recorded on the per-message `Deadline`.
+
+Contract:
+- A stage function is called as `func(ctx, **deps)`, where `deps` maps each name
+  in `depends_on` to that stage's result. Sync functions (the DB and LLM
+  wrappers are blocking) run in a worker thread; coroutine functions are awaited.
+- A stage's timeout is the smaller of its own `timeout` and what is left of the
+  deadline. The timeout applies to each attempt; retries happen only while the
+  deadline can afford another attempt.
+- A failing `optional` stage yields None to its dependents; any other failure
+  cancels the running stages and raises `StageError`.
+
+`fan_out` covers the other shape of concurrency: the same blocking call over a
+variable number of items (one embedding per extracted entity, for example).
+"""
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+
+class StageError(RuntimeError):
+    """A required stage failed after exhausting its retries."""
+
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"Stage {stage!r} failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+
+@dataclass(slots=True, frozen=True)
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    depends_on: tuple[str, ...] = ()
+    timeout: float | None = None
+    retries: int = 0
+    optional: bool = False
+
+
+class StageGraph:
+    def __init__(self, stages: list[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            missing = [dep for dep in stage.depends_on if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} depends on unknown stage(s): {missing}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list[str]:
+        order: list[str] = []
+        state: dict[str, str] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage dependency cycle through {name!r}")
+            state[name] = "visiting"
+            for dep in self.stages[name].depends_on:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def _call(self, stage: Stage, ctx: Any, deps: dict[str, Any], timeout: float | None) -> Any:
+        if inspect.iscoroutinefunction(stage.func):
+            call = stage.func(ctx, **deps)
+        else:
+            call = asyncio.to_thread(stage.func, ctx, **deps)
+        return await asyncio.wait_for(call, timeout)
+
+    async def _run_stage(self, stage: Stage, ctx: Any, deps: dict[str, Any], deadline: Deadline) -> Any:
+        attempt = 0
+        while True:
+            timeout = deadline.timeout(stage.timeout)
+            try:
+                with deadline.stage(stage.name, allowance=stage.timeout):
+                    return await self._call(stage, ctx, deps, timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > stage.retries or deadline.expired():
+                    raise StageError(stage.name, e) from e
+                logger.warning(
+                    f"Stage {stage.name} attempt {attempt} failed, retrying: {e!r}"
+                )
+
+    async def run(self, ctx: Any, deadline: Deadline | None = None) -> dict[str, Any]:
+        """Run every stage once its dependencies are done; return results by name."""
+        deadline = deadline or Deadline()
+        results: dict[str, Any] = {}
+        running: dict[asyncio.Task, str] = {}
+        pending = list(self.order)
+        try:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    if all(dep in results for dep in stage.depends_on):
+                        deps = {dep: results[dep] for dep in stage.depends_on}
+                        task = asyncio.create_task(self._run_stage(stage, ctx, deps, deadline))
+                        running[task] = name
+                        pending.remove(name)
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        results[name] = task.result()
+                    except StageError as e:
+                        if not self.stages[name].optional:
+                            raise
+                        logger.warning(f"Optional stage {name} failed: {e.cause!r}")
+                        deadline.skip(name)
+                        results[name] = None
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return results
+
+
+async def fan_out(calls: list[Callable[[], Any]], limit: int, what: str = "task") -> list[Any]:
+    """Run blocking calls in worker threads, at most `limit` at a time.
+
+    Results keep the order of `calls`; a call that raises is logged and yields
+    None, so one failed item does not sink the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(call: Callable[[], Any]) -> Any:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(call)
+            except Exception as e:
+                logger.warning(f"{what} failed: {e!r}")
+                return None
+
+    return list(await asyncio.gather(*(run(call) for call in calls)))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+archive_messages_history.py — Retention job for the partitioned messages_history.
+
+messages_history is range-partitioned by month (db/schema.sql). This job keeps
+the table to the last N months so per-conversation reads stay bounded:
+
+1. Creates the partitions for the coming months (ensure_messages_history_partitions).
+2. Detaches every monthly partition that ended before the retention cutoff
+   (`DETACH PARTITION ... CONCURRENTLY`, so inserts are not blocked; an
+   interrupted detach is finalized on the next run).
+3. Exports each detached partition with COPY to a gzip-compressed CSV,
+   `<archive-dir>/messages_history_YYYY_MM.csv.gz` (written to a temp file,
+   fsynced, row count checked against the table, then renamed).
+4. Drops the detached table once its export is verified, and deletes
+   message_stage_timings rows recorded before the cutoff.
+
+Safe to re-run: a partition that was detached but not exported (or not
+dropped) by an earlier run is picked up again. Run it daily or monthly from
+cron / a scheduled job.
+
+Usage:
+  python scripts/archive_messages_history.py                     # show what would be archived
+  python scripts/archive_messages_history.py --apply
+  python scripts/archive_messages_history.py --apply --keep-months 6 --archive-dir /var/backups/h2a
+"""
+import argparse
+import csv
+import gzip
+import io
+import os
+import re
+import sys
+from datetime import date, datetime, timezone
+
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.config import DEFAULT_DATABASE_URL, get_database_url
+
+load_dotenv()
+DATABASE_URL = get_database_url(DEFAULT_DATABASE_URL)
+
+_PARTITION_NAME = re.compile(r"^messages_history_(\d{4})_(\d{2})$")
+
+
+def _cutoff_month(keep_months: int) -> date:
+    """First day of the oldest month kept (UTC); partitions before it are archived."""
+    today = datetime.now(timezone.utc).date()
+    months = today.year * 12 + today.month - 1 - keep_months
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _partition_month(name: str) -> date | None:
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _partitions(cur) -> tuple[dict[str, bool], list[str]]:
+    """({attached partition: detach pending}, [monthly tables no longer attached])."""
+    cur.execute(
+        """SELECT c.relname, i.inhdetachpending
+           FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = 'public.messages_history'::regclass"""
+    )
+    attached = {row["relname"]: row["inhdetachpending"] for row in cur.fetchall()}
+    cur.execute(
+        """SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+           WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname ~ '^messages_history_[0-9]{4}_[0-9]{2}$'"""
+    )
+    detached = [row["relname"] for row in cur.fetchall() if row["relname"] not in attached]
+    return attached, detached
+
+
+def _export(cur, table: str, archive_dir: str) -> tuple[str, int]:
+    """COPY `table` to a gzip CSV; returns (path, rows written), verified against the table."""
+    path = os.path.join(archive_dir, f"{table}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz, io.TextIOWrapper(gz, encoding="utf-8", newline="") as out:
+            cur.copy_expert(f'COPY public."{table}" TO STDOUT WITH (FORMAT csv, HEADER)', out)
+        raw.flush()
+        os.fsync(raw.fileno())
+    with gzip.open(tmp_path, "rt", encoding="utf-8", newline="") as f:
+        exported = sum(1 for _ in csv.reader(f)) - 1
+    cur.execute(f'SELECT count(*) AS n FROM public."{table}"')
+    expected = cur.fetchone()["n"]
+    if exported != expected:
+        os.remove(tmp_path)
+        raise RuntimeError(f"{table}: exported {exported} rows, table has {expected}")
+    os.replace(tmp_path, path)
+    return path, exported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detach, export and drop old messages_history partitions")
+    parser.add_argument("--apply", action="store_true", help="Actually archive (default: dry run)")
+    parser.add_argument(
+        "--keep-months", type=int, default=int(os.getenv("MESSAGES_RETENTION_MONTHS", "12")),
+        help="full months kept in addition to the current one",
+    )
+    parser.add_argument("--archive-dir", default=os.getenv("MESSAGES_ARCHIVE_DIR", "data/archive"))
+    parser.add_argument("--months-ahead", type=int, default=3, help="partitions to create in advance")
+    args = parser.parse_args()
+
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+    except psycopg2.OperationalError as exc:
+        print("Could not connect to PostgreSQL.")
+        print(f"DATABASE_URL: {DATABASE_URL}")
+        raise SystemExit(1) from exc
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block.
+    conn.autocommit = True
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    cutoff = _cutoff_month(args.keep_months)
+    if args.apply:
+        cur.execute("SELECT ensure_messages_history_partitions(current_date, %s) AS created", (args.months_ahead,))
+        print(f"Created {cur.fetchone()['created']} upcoming partition(s).")
+
+    attached, detached = _partitions(cur)
+    to_detach = sorted(n for n in attached if (_partition_month(n) or cutoff) < cutoff)
+    to_export = sorted(n for n in detached if (_partition_month(n) or cutoff) < cutoff)
+    print(f"Retention cutoff: {cutoff.isoformat()} (keeping {args.keep_months} month(s) + the current one)")
+    if not to_detach and not to_export:
+        print("No partitions past the cutoff. Nothing to do.")
+        conn.close()
+        return
+    if not args.apply:
+        for name in to_detach:
+            print(f"Dry run: would detach, export and drop {name}")
+        for name in to_export:
+            print(f"Dry run: would export and drop already detached {name}")
+        print("Re-run with --apply to archive them.")
+        conn.close()
+        return
+
+    os.makedirs(args.archive_dir, exist_ok=True)
+    for name in to_detach:
+        mode = "FINALIZE" if attached[name] else "CONCURRENTLY"
+        cur.execute(f'ALTER TABLE public.messages_history DETACH PARTITION public."{name}" {mode}')
+        print(f"Detached {name}")
+    failed = 0
+    for name in sorted(to_detach + to_export):
+        try:
+            path, rows = _export(cur, name, args.archive_dir)
+        except Exception as exc:
+            failed += 1
+            print(f"Export of {name} failed, table kept for the next run: {exc}")
+            continue
+        cur.execute(f'DROP TABLE public."{name}"')
+        print(f"Archived {rows} row(s) of {name} to {path}")
+
+    cur.execute(
+        "DELETE FROM message_stage_timings WHERE recorded_at < %s::timestamp AT TIME ZONE 'UTC'",
+        (cutoff,),
+    )
+    print(f"Deleted {cur.rowcount} message_stage_timings row(s) before the cutoff.")
+    conn.close()
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
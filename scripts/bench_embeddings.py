@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+bench_embeddings.py — Compare list[float] and float32 embeddings.
+
+Measures, for random 1536-dim vectors:
+- memory per vector (list of Python floats vs float32 array)
+- problem x solution linking: pure-Python pairwise cosine loops (the previous
+  `_cosine_similarity`) vs one normalized matrix product with a threshold mask
+- pgvector text serialization
+
+No DB or API access is needed.
+
+Usage:
+  python scripts/bench_embeddings.py
+  python scripts/bench_embeddings.py --problems 5 --solutions 5 --repeat 200
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from utils.vectors import EMBEDDING_DIM, as_embedding, cosine_matrix, stack_embeddings, to_pgvector
+
+THRESHOLD = 0.35
+
+
+def _list_size(vector: list[float]) -> int:
+    return sys.getsizeof(vector) + sum(sys.getsizeof(v) for v in vector)
+
+
+def _cosine_lists(vec_a: list[float], vec_b: list[float]) -> float:
+    dot = sum(a * b for a, b in zip(vec_a, vec_b))
+    norm_a = math.sqrt(sum(a * a for a in vec_a))
+    norm_b = math.sqrt(sum(b * b for b in vec_b))
+    return dot / (norm_a * norm_b) if norm_a and norm_b else 0.0
+
+
+def _pairs_lists(problems: list[list[float]], solutions: list[list[float]]) -> list[tuple[int, int, float]]:
+    pairs = []
+    for i, problem in enumerate(problems):
+        for j, solution in enumerate(solutions):
+            score = _cosine_lists(problem, solution)
+            if score >= THRESHOLD:
+                pairs.append((i, j, score))
+    return pairs
+
+
+def _pairs_matrix(problems: list[np.ndarray], solutions: list[np.ndarray]) -> list[tuple[int, int, float]]:
+    scores = cosine_matrix(stack_embeddings(problems), stack_embeddings(solutions))
+    return [(i, j, float(scores[i, j])) for i, j in zip(*np.nonzero(scores >= THRESHOLD))]
+
+
+def _timed(label: str, fn, repeat: int) -> float:
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"  {label:<34} {seconds * 1e3:9.3f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding representations")
+    parser.add_argument("--problems", type=int, default=3)
+    parser.add_argument("--solutions", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    problems = [[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)] for _ in range(args.problems)]
+    solutions = [[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)] for _ in range(args.solutions)]
+    problems_f32 = [as_embedding(v) for v in problems]
+    solutions_f32 = [as_embedding(v) for v in solutions]
+
+    print(f"Memory per {EMBEDDING_DIM}-dim vector:")
+    list_bytes = _list_size(problems[0])
+    array_bytes = sys.getsizeof(problems_f32[0])
+    print(f"  list[float]                        {list_bytes / 1024:9.1f} KB")
+    print(f"  float32 array                      {array_bytes / 1024:9.1f} KB  ({list_bytes / array_bytes:.1f}x smaller)")
+
+    print(f"\nLinking {args.problems} problems x {args.solutions} solutions (best of {args.repeat}):")
+    slow = _timed("pure-Python pairwise cosine", lambda: _pairs_lists(problems, solutions), args.repeat)
+    fast = _timed("normalized matrix product + mask", lambda: _pairs_matrix(problems_f32, solutions_f32), args.repeat)
+    print(f"  speedup                            {slow / fast:9.1f}x")
+
+    print(f"\npgvector text serialization (best of {args.repeat}):")
+    slow = _timed("str() per float", lambda: "[" + ",".join(str(v) for v in problems[0]) + "]", args.repeat)
+    fast = _timed("to_pgvector(float32)", lambda: to_pgvector(problems_f32[0]), args.repeat)
+    print(f"  speedup                            {slow / fast:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+build_org_categories.py — Precompute centroid embeddings for /orgs categories.
+
+For every category in `pipelines.org_categories.ORG_CATEGORIES`, organization
+and project vectors whose embedded text matches the category patterns seed a
+centroid; catalog rows close to that seed join as auto-derived members, and the
+averaged vector is stored in `org_categories`. The bot matches `/orgs` input to
+these centroids locally, without `enrich_query` or `get_embedding` calls.
+
+Re-run after adding organizations/projects or re-embedding the catalog. Running
+bots pick up new centroids within `CENTROID_TTL_SECONDS`.
+
+Usage:
+  python scripts/build_org_categories.py
+  python scripts/build_org_categories.py --expand-min-similarity 0.55
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import queries
+from pipelines.org_categories import ORG_CATEGORIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build /orgs category centroids")
+    parser.add_argument(
+        "--expand-min-similarity", type=float, default=0.5,
+        help="Similarity to the seed centroid required for auto-derived members",
+    )
+    args = parser.parse_args()
+
+    empty = []
+    for category in ORG_CATEGORIES:
+        members = queries.rebuild_org_category_centroid(
+            category.slug,
+            list(category.patterns),
+            expand_min_similarity=args.expand_min_similarity,
+        )
+        if members:
+            print(f"  ✓ {category.slug}: centroid from {members} catalog row(s)")
+        else:
+            empty.append(category.slug)
+            print(f"  ⚠️  {category.slug}: no matching catalog rows, centroid not built")
+
+    if empty:
+        print(f"\n{len(empty)} categor(y/ies) will fall back to query enrichment: {', '.join(empty)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 """
 cleanup_weak_links.py — One-off data fix for the force-link bug.
 
-Before the fix, `_link_problems_to_solutions` (pipelines/problem_solution.py)
+Before the fix, `_link_problems_to_solutions` (pipelines/recommendation.py)
 linked every problem to its best-scoring solution even when that score was
 below PROBLEM_SOLUTION_LINK_THRESHOLD, producing weak `problems_solutions`
 rows that fed irrelevant orgs/projects into recommendations. The code no
@@ -27,7 +27,7 @@ from dotenv import load_dotenv
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db.config import DEFAULT_DATABASE_URL, get_database_url
-from pipelines.problem_solution import PROBLEM_SOLUTION_LINK_THRESHOLD
+from pipelines.recommendation import PROBLEM_SOLUTION_LINK_THRESHOLD
 
 load_dotenv()
 DATABASE_URL = get_database_url(DEFAULT_DATABASE_URL)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+rebuild_embedding_store.py — Rebuild the memory-mapped problem/solution store.
+
+Reads every problem and solution embedding from Postgres (the source of truth)
+and atomically replaces `problems.store` / `solutions.store` in
+EMBEDDING_STORE_DIR. Running bots and the API server remap the new files on
+their next dedup probe.
+
+Run after enabling the store, after restoring the database, or when rows were
+inserted by tools that do not append to the store (seeding, other hosts).
+
+Usage:
+  EMBEDDING_STORE_DIR=data/embedding_store python scripts/rebuild_embedding_store.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import queries
+
+
+def main():
+    stores = {"problems": queries.PROBLEM_STORE, "solutions": queries.SOLUTION_STORE}
+    if not all(stores.values()):
+        sys.exit("EMBEDDING_STORE_DIR is not set; nothing to rebuild.")
+    for table, store in stores.items():
+        count = store.rebuild(queries.list_entity_embeddings(table))
+        print(f"  ✓ {table}: {count} embedding(s) -> {store.path}")
+
+
+if __name__ == "__main__":
+    main()
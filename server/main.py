@@ -1,23 +1,29 @@
-"""FastAPI server exposing CRUD + process-message endpoints for the hate2action frontend."""
+"""FastAPI server exposing CRUD + process-message endpoints for the hate2action frontend.
+
+Read-only message and statistics endpoints are async and use `db.async_queries`
+on the server's event loop; the rest are sync handlers on `db.queries`.
+
+List endpoints are paginated by keyset: each returns one page (a JSON array of
+at most `limit` rows) and, when more rows follow, an `X-Next-Cursor` header to
+pass back as `cursor`. `fields` (comma-separated) selects columns; filters
+are `name_prefix`, `created_after` / `created_before` and per-endpoint extras.
+"""
+import asyncio
 import json
 import logging
 import os
+from contextlib import asynccontextmanager
+from datetime import datetime
 from pathlib import Path
 from threading import Lock
 
-from fastapi import FastAPI, HTTPException, Header, Response, status
+from fastapi import Depends, FastAPI, HTTPException, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
-from db import queries
-from pipelines.problem_solution import (
-    PROBLEM_SOLUTION_LINK_THRESHOLD,
-    _embedding_text,
-    _link_problems_to_solutions,
-    _link_solution_to_orgs_and_projects,
-    _normalize_entities,
-)
+from db import async_queries, queries
+from pipelines.recommendation import recommend
 from server.schemas import (
     OrganizationIn,
     OrganizationOut,
@@ -53,7 +59,14 @@ def _save_test_cases(cases: list[dict]) -> None:
         json.dump(cases, f, ensure_ascii=False, indent=2)
     tmp.replace(TEST_CASES_PATH)
 
-app = FastAPI(title="hate2action API")
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    yield
+    await async_queries.close_pool()
+
+
+app = FastAPI(title="hate2action API", lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -61,6 +74,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -71,6 +85,35 @@ def _check_api_key(x_api_key: str | None) -> None:
         raise HTTPException(status_code=401, detail="Invalid API key")
 
 
+def _list_params(
+    limit: int = Query(default=queries.LIST_DEFAULT_LIMIT, ge=1, le=queries.LIST_MAX_LIMIT),
+    cursor: str | None = None,
+    fields: str | None = Query(default=None, description="Comma-separated columns to return"),
+    name_prefix: str | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> dict:
+    return {
+        "limit": limit,
+        "cursor": cursor,
+        "fields": [f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+        "name_prefix": name_prefix,
+        "created_after": created_after,
+        "created_before": created_before,
+    }
+
+
+def _page(response: Response, page: tuple[list[dict], str | None]) -> list[dict]:
+    rows, next_cursor = page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+def _bad_list_request(e: ValueError) -> HTTPException:
+    return HTTPException(status_code=400, detail=str(e))
+
+
 def _reembed_organization(org: dict) -> None:
     try:
         text = f"{org['name']}: {org.get('description') or ''}"
@@ -88,10 +131,17 @@ def _reembed_project(project: dict) -> None:
 
 
 # ── Organizations ────────────────────────────────────────────────────────
-@app.get("/organizations", response_model=list[OrganizationOut])
-def get_organizations(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+@app.get("/organizations")
+def get_organizations(
+    response: Response,
+    params: dict = Depends(_list_params),
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
     _check_api_key(x_api_key)
-    return queries.list_organizations()
+    try:
+        return _page(response, queries.list_organizations(**params))
+    except ValueError as e:
+        raise _bad_list_request(e)
 
 
 @app.get("/organizations/{organization_id}")
@@ -130,10 +180,18 @@ def remove_organization(organization_id: int, x_api_key: str | None = Header(def
 
 
 # ── Projects ─────────────────────────────────────────────────────────────
-@app.get("/projects", response_model=list[ProjectOut])
-def get_projects(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+@app.get("/projects")
+def get_projects(
+    response: Response,
+    params: dict = Depends(_list_params),
+    organization_id: int | None = None,
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
     _check_api_key(x_api_key)
-    return queries.list_projects()
+    try:
+        return _page(response, queries.list_projects(**params, organization_id=organization_id))
+    except ValueError as e:
+        raise _bad_list_request(e)
 
 
 @app.get("/projects/{project_id}", response_model=ProjectOut)
@@ -172,10 +230,18 @@ def remove_project(project_id: int, x_api_key: str | None = Header(default=None,
 
 
 # ── Problems ─────────────────────────────────────────────────────────────
-@app.get("/problems", response_model=list[ProblemOut])
-def get_problems(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+@app.get("/problems")
+def get_problems(
+    response: Response,
+    params: dict = Depends(_list_params),
+    is_processed: bool | None = None,
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
     _check_api_key(x_api_key)
-    return queries.list_problems()
+    try:
+        return _page(response, queries.list_problems(**params, is_processed=is_processed))
+    except ValueError as e:
+        raise _bad_list_request(e)
 
 
 @app.get("/problems/{problem_id}", response_model=ProblemOut)
@@ -211,10 +277,17 @@ def remove_problem(problem_id: int, x_api_key: str | None = Header(default=None,
 
 
 # ── Solutions ────────────────────────────────────────────────────────────
-@app.get("/solutions", response_model=list[SolutionOut])
-def get_solutions(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+@app.get("/solutions")
+def get_solutions(
+    response: Response,
+    params: dict = Depends(_list_params),
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
     _check_api_key(x_api_key)
-    return queries.list_solutions()
+    try:
+        return _page(response, queries.list_solutions(**params))
+    except ValueError as e:
+        raise _bad_list_request(e)
 
 
 @app.get("/solutions/{solution_id}", response_model=SolutionOut)
@@ -269,16 +342,52 @@ def _shape_message(row: dict) -> dict:
     }
 
 
+# Shaped message field -> DB columns it is built from.
+_MESSAGE_FIELD_COLUMNS = {
+    "message_id": ["message_id"],
+    "chat_id": ["chat_id"],
+    "user_id": ["user_id"],
+    "user_username": ["user_username", "user_first_name", "user_id"],
+    "chat_title": ["chat_type"],
+    "text": ["message_text"],
+    "date": ["date"],
+    "pipeline_used": ["pipeline_used"],
+    "response": ["reply_text"],
+}
+
+
 @app.get("/messages")
-def get_messages(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+async def get_messages(
+    response: Response,
+    params: dict = Depends(_list_params),
+    pipeline: str | None = None,
+    chat_id: int | None = None,
+    user_id: int | None = None,
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
+    """One page of messages, newest first; `created_after` / `created_before` filter on `date`."""
     _check_api_key(x_api_key)
-    return [_shape_message(r) for r in queries.list_messages()]
+    fields = params.pop("fields")
+    if params.pop("name_prefix"):
+        raise HTTPException(status_code=400, detail="name_prefix is not supported for messages")
+    unknown = [f for f in fields or [] if f not in _MESSAGE_FIELD_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+    columns = ["message_id", *(c for f in fields for c in _MESSAGE_FIELD_COLUMNS[f])] if fields else None
+    try:
+        rows = _page(response, await async_queries.list_messages(
+            **params, fields=columns, pipeline=pipeline, chat_id=chat_id, user_id=user_id
+        ))
+    except ValueError as e:
+        raise _bad_list_request(e)
+    shaped = [_shape_message(r) for r in rows]
+    return [{f: m[f] for f in fields} for m in shaped] if fields else shaped
 
 
 @app.get("/messages/{message_id}")
-def get_message(message_id: int, x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+async def get_message(message_id: int, x_api_key: str | None = Header(default=None, alias="X-API-Key")):
     _check_api_key(x_api_key)
-    row = queries.get_message(message_id)
+    row = await async_queries.get_message(message_id)
     if not row:
         raise HTTPException(status_code=404, detail="Message not found")
     return _shape_message(row)
@@ -296,55 +405,57 @@ def process_message(payload: ProcessMessageIn, x_api_key: str | None = Header(de
     lang = llm.detect_language(text)
 
     try:
-        extracted = llm.extract_problems_and_solutions(text)
-        problems_data = _normalize_entities(extracted.get("problems"))
-        solutions_data = _normalize_entities(extracted.get("solutions"))
-
-        problem_rows: list[dict] = []
-        for problem in problems_data:
-            embedding = llm.get_embedding(_embedding_text(problem))
-            problem_id = queries.upsert_problem(problem["name"], problem["context"], problem["content"], embedding)
-            problem_rows.append({
-                "problem_id": problem_id, "embedding": embedding, "name": problem["name"],
-            })
-
-        solution_rows: list[dict] = []
-        for solution in solutions_data:
-            embedding = llm.get_embedding(_embedding_text(solution))
-            solution_id = queries.upsert_solution(solution["name"], solution["context"], solution["content"], embedding)
-            solution_rows.append({
-                "solution_id": solution_id, "embedding": embedding, "name": solution["name"],
-            })
-            try:
-                _link_solution_to_orgs_and_projects(solution_id, embedding)
-            except Exception as e:
-                logger.warning("link solution failed: %s", e)
-
-        _link_problems_to_solutions(problem_rows, solution_rows)
-
-        problem_ids = [r["problem_id"] for r in problem_rows]
-        orgs = queries.find_orgs_via_solutions(problem_ids)
-        projects = queries.find_projects_via_solutions(problem_ids)
-        if not orgs and not projects:
-            fallback_text = " ".join(_embedding_text(p) for p in problems_data) or text
-            fallback_embedding = llm.get_embedding(fallback_text)
-            orgs = queries.find_orgs_by_embedding(fallback_embedding, top_n=3)
-            projects = queries.find_projects_by_embedding(fallback_embedding, top_n=3)
-
-        reply = llm.generate_reply(text, style, orgs, projects, [], lang=lang)
+        # Sync handler, so this runs on a worker thread with no event loop.
+        result = asyncio.run(recommend(text, dry_run=payload.dry_run))
+        reply = llm.generate_reply(text, style, result.orgs, result.projects, [], lang=lang)
 
         return {
             "text": reply,
-            "problems": [{"problem_id": r["problem_id"], "name": r["name"]} for r in problem_rows],
-            "solutions": [{"solution_id": r["solution_id"], "name": r["name"]} for r in solution_rows],
-            "projects": [{"project_id": p["project_id"], "name": p["name"]} for p in projects],
-            "organizations": [{"organization_id": o["organization_id"], "name": o["name"]} for o in orgs],
+            "problems": [{"problem_id": r["problem_id"], "name": r["name"]} for r in result.problems],
+            "solutions": [{"solution_id": r["solution_id"], "name": r["name"]} for r in result.solutions],
+            "projects": [{"project_id": p["project_id"], "name": p["name"]} for p in result.projects],
+            "organizations": [{"organization_id": o["organization_id"], "name": o["name"]} for o in result.orgs],
+            "dry_run": result.dry_run,
         }
     except Exception as e:
         logger.error("process-message failed: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ── Dashboard totals ─────────────────────────────────────────────────────
+@app.get("/stats/counts")
+async def get_counts(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
+    """Row totals of the admin lists, for the dashboard (no rows are listed)."""
+    _check_api_key(x_api_key)
+    return await async_queries.list_counts()
+
+
+# ── Latency stats ────────────────────────────────────────────────────────
+@app.get("/stats/latency")
+async def get_latency_stats(
+    hours: float = Query(default=24, gt=0, le=24 * 90),
+    pipeline: str | None = None,
+    x_api_key: str | None = Header(default=None, alias="X-API-Key"),
+):
+    """Stage latency percentiles (ms) from `message_stage_timings`, overall and per pipeline."""
+    _check_api_key(x_api_key)
+    stages: list[dict] = []
+    pipelines: dict[str, list[dict]] = {}
+    for row in await async_queries.stage_latency_stats(hours=hours, pipeline=pipeline):
+        entry = {
+            "stage": row["stage"],
+            "samples": row["samples"],
+            "p50": round(row["p50"], 1),
+            "p95": round(row["p95"], 1),
+            "p99": round(row["p99"], 1),
+        }
+        if row["all_pipelines"]:
+            stages.append(entry)
+        else:
+            pipelines.setdefault(row["pipeline_used"] or "unknown", []).append(entry)
+    return {"hours": hours, "pipeline": pipeline, "stages": stages, "pipelines": pipelines}
+
+
 # ── Test cases (bot reply lab) ───────────────────────────────────────────
 @app.get("/test-cases")
 def get_test_cases(x_api_key: str | None = Header(default=None, alias="X-API-Key")):
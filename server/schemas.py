@@ -70,6 +70,8 @@ class SolutionOut(BaseModel):
 class ProcessMessageIn(BaseModel):
     message: str
     response_style: str = "normal"
+    # Compute recommendations without writing problems/solutions/links.
+    dry_run: bool = False
 
 
 class TestCaseUpdate(BaseModel):
@@ -7,8 +7,10 @@ These tests guard the behaviour that keeps prod and test bots independent:
 - identical tokens across peer env vars are rejected (would cause TG 409)
 - webhook path defaults to telegram/webhook/<bot_env> and is overrideable
 - create_bot(config) yields independent Application instances for different configs
+- rapid-fire messages are coalesced per chat/user, follow-ups supersede replies
 """
 
+import asyncio
 import os
 import sys
 import unittest
@@ -19,6 +21,11 @@ sys.path.insert(0, PROJECT_ROOT)
 
 # Match tests/test_pipelines.py: stub heavy side-effecty deps before importing
 # bot.main so the test doesn't need a DB or OpenAI key.
+import db.catalog_index  # noqa: E402,F401  (pure numpy modules, loaded for real)
+import db.embedding_store  # noqa: E402,F401
+import utils.ranking  # noqa: E402,F401
+import utils.vectors  # noqa: E402,F401
+
 mock_queries = MagicMock()
 mock_llm = MagicMock()
 sys.modules.setdefault("db.queries", mock_queries)
@@ -26,6 +33,7 @@ sys.modules.setdefault("db", MagicMock(queries=mock_queries))
 sys.modules.setdefault("utils.llm", mock_llm)
 sys.modules.setdefault("utils", MagicMock(llm=mock_llm))
 
+from bot.coalescer import MessageCoalescer  # noqa: E402
 from bot.config import (  # noqa: E402
     BotConfig,
     ConfigError,
@@ -155,6 +163,15 @@ class TestLoadBotConfig(unittest.TestCase):
             config = load_bot_config()
         self.assertEqual(config.webhook_path, "custom/path")
 
+    def test_coalesce_window_is_parsed_and_validated(self):
+        with _EnvPatch(self._base_env()):
+            self.assertEqual(load_bot_config().coalesce_window_seconds, 0.0)
+        with _EnvPatch(self._base_env(BOT_COALESCE_WINDOW_SECONDS="2.5")):
+            self.assertEqual(load_bot_config().coalesce_window_seconds, 2.5)
+        with _EnvPatch(self._base_env(BOT_COALESCE_WINDOW_SECONDS="-1")):
+            with self.assertRaises(ConfigError):
+                load_bot_config()
+
     def test_prod_and_test_configs_are_independent(self):
         prod_env = self._base_env(
             BOT_ENV="prod",
@@ -207,5 +224,44 @@ class TestCreateBotFactory(unittest.TestCase):
         self.assertEqual(test.bot.token, VALID_TOKEN_B)
 
 
+class TestMessageCoalescer(unittest.IsolatedAsyncioTestCase):
+    async def test_messages_within_window_run_once(self):
+        coalescer = MessageCoalescer(window_seconds=0.05)
+        calls = []
+
+        async def handler(tag, text):
+            calls.append((tag, text))
+
+        coalescer.submit((1, 2), "first", lambda text, cancelled: handler("a", text))
+        coalescer.submit((1, 2), "second", lambda text, cancelled: handler("b", text))
+        coalescer.submit((1, 3), "other user", lambda text, cancelled: handler("c", text))
+        await asyncio.sleep(0.15)
+        self.assertEqual(sorted(calls), [("b", "first\nsecond"), ("c", "other user")])
+        self.assertEqual(coalescer.pending(), 0)
+
+    async def test_follow_up_supersedes_running_handler(self):
+        coalescer = MessageCoalescer(window_seconds=0.01)
+        started, replies, events = asyncio.Event(), [], []
+
+        async def slow(text, cancelled):
+            events.append(cancelled)
+            started.set()
+            await asyncio.sleep(1)
+            replies.append(text)
+
+        async def fast(text, cancelled):
+            events.append(cancelled)
+            replies.append(text)
+
+        coalescer.submit("k", "part one", slow)
+        await started.wait()
+        coalescer.submit("k", "part two", fast)
+        await asyncio.sleep(0.1)
+        self.assertEqual(replies, ["part one\npart two"])
+        self.assertEqual(coalescer.snapshot()["superseded"], 1)
+        # The superseded run's worker thread sees its event set; the new run's is clear.
+        self.assertEqual([e.is_set() for e in events], [True, False])
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
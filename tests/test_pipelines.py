@@ -9,13 +9,23 @@ Tests cover the evaluation factors from the spec:
 5. About Me pipeline
 """
 
+import asyncio
 import os
 import sys
+import threading
 import unittest
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import ANY, patch, MagicMock, AsyncMock
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, PROJECT_ROOT)
+import numpy as np
+import tempfile
+from db.catalog_index import CatalogIndex  # pure numpy modules, loaded before mocking
+from db.embedding_store import EmbeddingStore
+from db.message_writer import MessageWriter
+from db.prepared import StatementRegistry
+from db.session_cache import MISS, SessionCache
+from utils import ranking, vectors
 mock_queries = MagicMock()
 mock_llm = MagicMock()
 sys.modules["db.queries"] = mock_queries
@@ -32,7 +42,14 @@ from pipelines import (
     STYLES,
     ABOUT_TEXT,
     START_TEXT,
+    match_org_category,
 )
+from pipelines.deadline import Deadline
+from pipelines.org_categories import invalidate_category_centroids
+from pipelines.graph_linker import GraphLinker
+from pipelines.overload import OVERLOAD, OverloadGovernor
+from pipelines.pipeline_factory import PipelineContext, ShowOrgsPipeline, StagedPipeline
+from pipelines.stage_graph import Stage, StageError, StageGraph
 
 
 class TestStartPipeline(unittest.TestCase):
@@ -98,22 +115,20 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         mock_queries.reset_mock()
         mock_llm.reset_mock()
 
-        mock_queries.get_or_create_user.return_value = {"user_id": 42, "response_style": "normal"}
-        mock_queries.get_or_create_chat.return_value = {"chat_id": 999, "type": "private"}
-        mock_queries.get_user_style.return_value = "normal"
-        mock_queries.get_chat_style.return_value = "normal"
+        mock_queries.load_session.return_value = {
+            "user_style": "normal", "chat_style": "normal", "last_message_context": None,
+        }
         mock_queries.get_chat_history.return_value = []
-        mock_queries.get_last_message_context.return_value = None
-        mock_queries.upsert_problem.return_value = 1
-        mock_queries.upsert_solution.return_value = 1
-        mock_queries.find_orgs_via_solutions.return_value = [
-            {"name": "Greenpeace", "description": "Environmental NGO", "website": "https://greenpeace.org"}
-        ]
-        mock_queries.find_projects_via_solutions.return_value = [
-            {"name": "Climate Response", "org_name": "Greenpeace", "description": "Climate action", "org_website": "https://greenpeace.org"}
-        ]
+        mock_queries.upsert_problems.side_effect = lambda rows, timeout=None: [1] * len(rows)
+        mock_queries.upsert_solutions.side_effect = lambda rows, timeout=None: [1] * len(rows)
+        mock_queries.find_recommendations.return_value = (
+            [{"name": "Greenpeace", "description": "Environmental NGO", "website": "https://greenpeace.org",
+              "source": "graph"}],
+            [{"name": "Climate Response", "org_name": "Greenpeace", "description": "Climate action",
+              "org_website": "https://greenpeace.org", "source": "graph"}],
+        )
         mock_queries.save_message.return_value = None
-        mock_queries.link_problem_solution.return_value = None
+        mock_queries.link_problems_solutions.return_value = None
 
         mock_llm.extract_problems_and_solutions.return_value = {
             "problems": [{"name": "Climate change", "context": "global warming", "content": "rising temps"}],
@@ -124,12 +139,12 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         mock_llm.generate_reply.return_value = "I understand your frustration! Check out [Greenpeace](https://greenpeace.org)."
         mock_llm.rewrite_reply_with_style.return_value = "rewritten"
 
-    async def test_user_is_created(self):
+    async def test_session_is_loaded_in_one_call(self):
         await pipeline_process_message(
             user_id=42, chat_id=999, chat_type="private",
             message_text="I hate how nobody cares about climate change!",
         )
-        mock_queries.get_or_create_user.assert_called_with(42)
+        mock_queries.load_session.assert_called_with(42, 999, "private", timeout=ANY)
 
     async def test_message_is_saved(self):
         await pipeline_process_message(
@@ -141,7 +156,7 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         self.assertIn("Corruption is everywhere!", call_kwargs.args)
 
     async def test_correct_style_applied(self):
-        mock_queries.get_user_style.return_value = "sarcastic"
+        mock_queries.load_session.return_value["user_style"] = "sarcastic"
         await pipeline_process_message(
             user_id=42, chat_id=999, chat_type="private",
             message_text="Politicians are all corrupt!",
@@ -163,7 +178,7 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
             message_text="Climate change is destroying our planet!",
         )
         mock_llm.extract_problems_and_solutions.assert_called_once()
-        mock_queries.upsert_problem.assert_called()
+        mock_queries.upsert_problems.assert_called()
 
     async def test_pipeline_marked_in_save(self):
         await pipeline_process_message(
@@ -173,6 +188,46 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         call_kwargs = mock_queries.save_message.call_args.kwargs
         self.assertEqual(call_kwargs.get("pipeline_used"), "problem_solution")
 
+    async def test_superseded_message_stops_before_generation_and_save(self):
+        cancelled = threading.Event()
+
+        def route(*args, **kwargs):
+            cancelled.set()  # a follow-up arrives while routing runs
+            return "process_message"
+
+        mock_llm.detect_pipeline.side_effect = route
+        try:
+            result = await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Test message", cancel_event=cancelled,
+            )
+        finally:
+            mock_llm.detect_pipeline.side_effect = None
+        self.assertEqual(result, "")
+        mock_llm.generate_reply.assert_not_called()
+        mock_queries.save_message.assert_not_called()
+        mock_queries.save_stage_timings.assert_not_called()
+
+    async def test_stage_timings_saved_for_message_id(self):
+        mock_queries.save_message.return_value = 7
+        await pipeline_process_message(
+            user_id=42, chat_id=999, chat_type="private",
+            message_text="Test message",
+        )
+        args = mock_queries.save_stage_timings.call_args.args
+        self.assertEqual(args[:2], (7, "problem_solution"))
+        self.assertTrue({"session", "routing", "extraction", "generation", "save"} <= set(args[3]))
+
+        mock_queries.save_stage_timings.side_effect = RuntimeError("db down")
+        try:
+            result = await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Test message",
+            )
+        finally:
+            mock_queries.save_stage_timings.side_effect = None
+        self.assertEqual(result, mock_llm.generate_reply.return_value)
+
     async def test_show_orgs_false_positive_is_routed_to_process_message(self):
         mock_llm.detect_pipeline.return_value = "process_message"
 
@@ -187,7 +242,7 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(call_kwargs.get("pipeline_used"), "problem_solution")
 
     async def test_previous_message_context_is_passed_to_detector(self):
-        mock_queries.get_last_message_context.return_value = {
+        mock_queries.load_session.return_value["last_message_context"] = {
             "pipeline_used": "show_orgs",
             "message_text": "/orgs",
             "reply_text": "Яку тему або категорію організацій шукаєш?",
@@ -206,12 +261,14 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
             previous_message="/orgs",
             previous_reply="Яку тему або категорію організацій шукаєш?",
             previous_pipeline="show_orgs",
+            timeout=ANY,
         )
+        self.assertGreater(mock_llm.detect_pipeline.call_args.kwargs["timeout"], 0)
         call_kwargs = mock_queries.save_message.call_args.kwargs
         self.assertEqual(call_kwargs.get("pipeline_used"), "show_orgs")
 
     async def test_llm_can_choose_process_message_even_after_org_prompt(self):
-        mock_queries.get_last_message_context.return_value = {
+        mock_queries.load_session.return_value["last_message_context"] = {
             "pipeline_used": "show_orgs",
             "message_text": "/orgs",
             "reply_text": "Яку тему або категорію організацій шукаєш?",
@@ -229,26 +286,613 @@ class TestProcessMessagePipeline(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(call_kwargs.get("pipeline_used"), "problem_solution")
 
 
+    async def test_exhausted_budget_skips_optional_stages(self):
+        mock_queries.load_session.return_value["user_style"] = "sarcastic"
+        with patch("pipelines.message_orchestrator.MESSAGE_BUDGET_SECONDS", 0.0):
+            result = await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Politicians are all corrupt!",
+            )
+        mock_llm.extract_problems_and_solutions.assert_not_called()
+        mock_llm.rewrite_reply_with_style.assert_not_called()
+        self.assertEqual(mock_queries.find_recommendations.call_args.args[0], [])
+        mock_queries.save_message.assert_called_once()
+        self.assertIn("Greenpeace", result)
+
+    async def test_failed_entity_is_dropped_without_failing_reply(self):
+        mock_llm.extract_problems_and_solutions.return_value = {
+            "problems": [
+                {"name": "Broken", "context": "", "content": ""},
+                {"name": "Climate change", "context": "global warming", "content": "rising temps"},
+            ],
+            "solutions": [{"name": "Donate to NGO", "context": "financial support", "content": "give money"}],
+        }
+
+        def embed(text, timeout=None):
+            if text.startswith("Broken"):
+                raise RuntimeError("embedding provider error")
+            return [0.1] * 1536
+
+        mock_llm.get_embedding.side_effect = embed
+        try:
+            result = await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Climate change is ignored!",
+            )
+        finally:
+            mock_llm.get_embedding.side_effect = None
+        self.assertEqual(len(mock_queries.upsert_problems.call_args.args[0]), 1)
+        self.assertEqual(len(mock_queries.upsert_solutions.call_args.args[0]), 1)
+        self.assertEqual([(p, s) for p, s, _ in mock_queries.link_problems_solutions.call_args.args[0]], [(1, 1)])
+        self.assertIn("Greenpeace", result)
+
+    async def test_background_linking_replies_from_direct_retrieval(self):
+        mock_queries.find_recommendations.return_value = (
+            [{"organization_id": 7, "name": "Greenpeace", "similarity": 0.8, "source": "vector", "query": 0}], []
+        )
+        with patch("pipelines.recommendation.GRAPH_LINKING_MODE", "background"), \
+                patch("pipelines.recommendation.GRAPH_LINKER") as linker:
+            result = await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Climate change is ignored!",
+            )
+        solutions, pairs = linker.enqueue.call_args.args
+        self.assertEqual([solution_id for solution_id, _ in solutions], [1])
+        self.assertEqual(solutions[0][1].dtype, np.float32)
+        self.assertEqual([(p, s) for p, s, _ in pairs], [(1, 1)])
+        mock_queries.link_problems_solutions.assert_not_called()
+        problem_ids, embeddings = mock_queries.find_recommendations.call_args.args
+        self.assertEqual((problem_ids, len(embeddings)), ([], 2))
+        self.assertEqual(mock_llm.get_embedding.call_count, 2)
+        self.assertIn("Greenpeace", result)
+
+    async def test_empty_graph_retrieval_falls_back_without_new_embedding(self):
+        from pipelines.recommendation import recommend
+
+        mock_queries.find_recommendations.return_value = ([
+            {"organization_id": 1, "name": "A", "similarity": 0.5, "source": "vector", "query": 0},
+            {"organization_id": 2, "name": "B", "similarity": 0.4, "source": "vector", "query": 0},
+            {"organization_id": 2, "name": "B", "similarity": 0.7, "source": "vector", "query": 1},
+        ], [])
+        result = await recommend("Climate change is ignored!")
+        self.assertEqual(mock_queries.find_recommendations.call_args.args[0], [1])
+        self.assertEqual(mock_llm.get_embedding.call_count, 2)
+        self.assertEqual([org["organization_id"] for org in result.orgs], [2, 1])
+        self.assertAlmostEqual(result.orgs[0]["similarity"], 0.7)
+        self.assertEqual(result.projects, [])
+
+    async def test_dry_run_links_in_memory_without_writes(self):
+        from pipelines.recommendation import recommend
+
+        mock_queries.find_orgs_by_embedding.return_value = [
+            {"organization_id": 7, "name": "Greenpeace", "similarity": 0.8},
+            {"organization_id": 8, "name": "Weak match", "similarity": 0.1},
+        ]
+        mock_queries.find_projects_by_embedding.return_value = []
+        result = await recommend("Climate change is ignored!", dry_run=True)
+        mock_queries.upsert_problems.assert_not_called()
+        mock_queries.upsert_solutions.assert_not_called()
+        mock_queries.link_problems_solutions.assert_not_called()
+        mock_queries.db_cursor.assert_not_called()
+        mock_queries.find_orgs_via_solutions.assert_not_called()
+        mock_queries.get_chat_history.assert_not_called()
+        self.assertTrue(result.dry_run)
+        self.assertEqual([row["problem_id"] for row in result.problems], [None])
+        self.assertEqual([org["organization_id"] for org in result.orgs], [7])
+        self.assertAlmostEqual(result.orgs[0]["combined_score"], 0.8, places=5)
+        self.assertEqual(mock_llm.get_embedding.call_count, 2)
+
+    async def test_speculative_extraction_is_reused_on_hit(self):
+        from pipelines.speculation import SPECULATION_STATS
+
+        hits = SPECULATION_STATS.hits
+        with patch("pipelines.message_orchestrator.SPECULATIVE_EXTRACTION", True):
+            await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Climate change is ignored!",
+            )
+        mock_llm.extract_problems_and_solutions.assert_called_once()
+        mock_queries.get_chat_history.assert_called_once()
+        mock_queries.upsert_problems.assert_called_once()
+        self.assertEqual(SPECULATION_STATS.hits, hits + 1)
+
+    async def test_speculative_extraction_is_discarded_on_miss(self):
+        from pipelines.speculation import SPECULATION_STATS
+
+        mock_llm.detect_pipeline.return_value = "about_me"
+        before = SPECULATION_STATS.snapshot()
+        with patch("pipelines.message_orchestrator.SPECULATIVE_EXTRACTION", True):
+            await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Who are you?",
+            )
+        for _ in range(100):  # waste is counted when the running call finishes
+            if SPECULATION_STATS.wasted_calls > before["wasted_calls"]:
+                break
+            await asyncio.sleep(0.01)
+        after = SPECULATION_STATS.snapshot()
+        mock_queries.upsert_problems.assert_not_called()
+        self.assertEqual(after["misses"], before["misses"] + 1)
+        if mock_llm.extract_problems_and_solutions.called:
+            self.assertEqual(after["wasted_calls"], before["wasted_calls"] + 1)
+            self.assertGreater(after["wasted_tokens_estimate"], before["wasted_tokens_estimate"])
+
+    async def test_degraded_mode_uses_cheap_path(self):
+        mock_queries.load_session.return_value["user_style"] = "sarcastic"
+        OVERLOAD.force("degraded")
+        try:
+            await pipeline_process_message(
+                user_id=42, chat_id=999, chat_type="private",
+                message_text="Politicians are all corrupt and nobody cares!",
+            )
+        finally:
+            OVERLOAD.force("auto")
+        mock_llm.detect_pipeline.assert_not_called()
+        mock_llm.rewrite_reply_with_style.assert_not_called()
+        mock_queries.find_orgs_by_embedding.assert_not_called()
+        mock_queries.link_problems_solutions.assert_called()
+        call_kwargs = mock_queries.save_message.call_args.kwargs
+        self.assertEqual(call_kwargs.get("pipeline_used"), "problem_solution")
+
+
+class TestVectors(unittest.TestCase):
+    def test_pgvector_round_trip_is_float32(self):
+        vector = vectors.parse_pgvector(vectors.to_pgvector([0.1, -2.5, 3e-8]))
+        self.assertEqual(vector.dtype, np.float32)
+        np.testing.assert_array_equal(vector, np.array([0.1, -2.5, 3e-8], dtype=np.float32))
+        self.assertIsNone(vectors.parse_pgvector(None))
+
+    def test_pgvector_binary_matches_wire_format(self):
+        data = vectors.to_pgvector_binary([1.0, -2.5])
+        self.assertEqual(data, b"\x00\x02\x00\x00" + np.array([1.0, -2.5], dtype=">f4").tobytes())
+        vector = vectors.parse_pgvector_binary(memoryview(data))
+        self.assertEqual(vector.dtype, np.float32)
+        np.testing.assert_array_equal(vector, [1.0, -2.5])
+
+    def test_problem_solution_pairs_are_thresholded_as_a_matrix(self):
+        from pipelines.recommendation import _problem_solution_pairs
+
+        problems = [{"problem_id": 1, "embedding": [1.0, 0.0]}, {"problem_id": 2, "embedding": [0.0, 0.0]}]
+        solutions = [
+            {"solution_id": 10, "embedding": [1.0, 0.1]},
+            {"solution_id": 11, "embedding": [-1.0, 0.0]},
+        ]
+        pairs = _problem_solution_pairs(problems, solutions)
+        self.assertEqual([(p, s) for p, s, _ in pairs], [(1, 10)])
+        self.assertAlmostEqual(pairs[0][2], 0.995, places=3)
+
+
+class TestCatalogIndex(unittest.TestCase):
+    ORGS = [
+        {"organization_id": 1, "name": "North", "description": None, "website": None, "embedding": [1.0, 0.0]},
+        {"organization_id": 2, "name": "East", "description": None, "website": None, "embedding": [0.0, 1.0]},
+        {"organization_id": 3, "name": "NorthEast", "description": None, "website": None, "embedding": [1.0, 1.0]},
+    ]
+
+    def setUp(self):
+        self.now = 0.0
+        self.fingerprint = "v1"
+        self.load = MagicMock(side_effect=lambda timeout: (self.ORGS, []))
+        self.index = CatalogIndex(
+            self.load, lambda timeout: self.fingerprint, check_interval=30.0, clock=lambda: self.now
+        )
+
+    def test_search_matches_sql_semantics(self):
+        rows = self.index.search_orgs([1.0, 0.1], top_n=2, min_similarity=0.0)
+        self.assertEqual([r["organization_id"] for r in rows], [1, 3])
+        self.assertAlmostEqual(rows[0]["similarity"], 0.995, places=3)
+        self.assertNotIn("embedding", rows[0])
+        rows = self.index.search_orgs([1.0, 0.1], top_n=3, min_similarity=0.5)
+        self.assertEqual([r["organization_id"] for r in rows], [1, 3])
+        self.assertEqual(self.index.search_projects([1.0, 0.0]), [])
+
+    def test_search_many_ranks_each_query_separately(self):
+        ranked = self.index.search_orgs_many([[1.0, 0.1], [0.1, 1.0]], top_n=2)
+        self.assertEqual([[r["organization_id"] for r in rows] for rows in ranked], [[1, 3], [2, 3]])
+        fused = ranking.reciprocal_rank_fusion(ranked, "organization_id", top_n=1)
+        self.assertEqual([r["organization_id"] for r in fused], [3])
+
+    def test_reloads_on_invalidate_or_fingerprint_change(self):
+        self.index.search_orgs([1.0, 0.0])
+        self.index.search_orgs([1.0, 0.0])
+        self.assertEqual(self.load.call_count, 1)
+        self.index.invalidate()
+        self.index.search_orgs([1.0, 0.0])
+        self.assertEqual(self.load.call_count, 2)
+        self.fingerprint = "v2"
+        self.index.search_orgs([1.0, 0.0])
+        self.assertEqual(self.load.call_count, 2)
+        self.now += 30.0
+        self.index.search_orgs([1.0, 0.0])
+        self.assertEqual(self.load.call_count, 3)
+
+    def test_failed_first_load_falls_back_to_sql(self):
+        self.load.side_effect = RuntimeError("db down")
+        self.assertIsNone(self.index.search_orgs([1.0, 0.0]))
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "problems.store")
+        self.store = EmbeddingStore(self.path, dim=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_then_nearest_sees_new_rows(self):
+        self.assertIsNone(self.store.nearest([1.0, 0.0, 0.0]))
+        self.store.append(10, [1.0, 0.0, 0.0])
+        self.store.append(11, [0.0, 2.0, 0.0])
+        item_id, score = self.store.nearest([0.0, 1.0, 0.1])
+        self.assertEqual(item_id, 11)
+        self.assertAlmostEqual(score, 0.995, places=3)
+        reader = EmbeddingStore(self.path, dim=3)
+        self.assertEqual(len(reader), 2)
+
+    def test_forget_and_rebuild(self):
+        self.store.append(10, [1.0, 0.0, 0.0])
+        self.store.forget(10)
+        self.assertAlmostEqual(self.store.nearest([1.0, 0.0, 0.0])[1], 0.0)
+        self.assertEqual(self.store.rebuild([(20, [0.0, 0.0, 1.0])]), 1)
+        self.assertEqual(self.store.nearest([0.0, 0.0, 1.0])[0], 20)
+        self.assertEqual(len(self.store), 1)
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = SessionCache(max_entries=2, ttl=60.0, history_size=3, clock=lambda: self.now)
+        self.cache.set_listening(True)
+
+    def test_write_through_history_ring_and_bounds(self):
+        self.cache.put_history(1, 42, [{"message_text": "a"}, {"message_text": "b"}], self.cache.token())
+        self.cache.append_message(1, 42, {"message_text": "c"})
+        self.cache.append_message(1, 42, {"message_text": "d"})
+        self.assertEqual([r["message_text"] for r in self.cache.history(1, 42)], ["b", "c", "d"])
+        self.assertEqual([r["message_text"] for r in self.cache.history(1, 42, 1)], ["d"])
+        self.assertIs(self.cache.history(1, 42, 4), MISS)
+        for user_id in (1, 2, 3):
+            self.cache.put_user_style(user_id, "funny")
+        self.assertIs(self.cache.user_style(1), MISS)  # evicted: two keys per map
+        self.assertEqual(self.cache.user_style(3), "funny")
+        self.now = 61.0
+        self.assertIs(self.cache.user_style(3), MISS)
+        snapshot = self.cache.snapshot()
+        self.assertEqual(snapshot["history"]["hits"], 2)
+        self.assertEqual(snapshot["user"]["evictions"], 1)
+        self.assertEqual(snapshot["user"]["hit_rate"], round(1 / 3, 3))
+
+    def test_invalidation_drops_entries_and_racing_fills(self):
+        token = self.cache.token()
+        self.cache.invalidate("chat:7")
+        self.cache.put_chat_style(7, "stale", token)
+        self.assertIs(self.cache.chat_style(7), MISS)
+        self.cache.put_chat_style(7, "sarcastic", self.cache.token())
+        self.assertEqual(self.cache.chat_style(7), "sarcastic")
+        self.cache.put_history(7, 1, [], self.cache.token())
+        self.cache.invalidate("history:*")
+        self.assertIs(self.cache.history(7, 1), MISS)
+        self.cache.set_listening(False)
+        self.cache.write_user_style(1, "funny")
+        self.assertIs(self.cache.user_style(1), MISS)
+        self.assertEqual(self.cache.snapshot()["invalidations"], 2)
+
+
+class TestMessageWriter(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.fail = False
+        self.next_id = 100
+
+        def write_batch(messages, timings):
+            if self.fail:
+                raise self.fail if isinstance(self.fail, Exception) else RuntimeError("db down")
+            self.batches.append((messages, timings))
+
+        def reserve_ids(count):
+            ids = list(range(self.next_id, self.next_id + count))
+            self.next_id += count
+            return ids
+
+        self.writer = MessageWriter(write_batch, reserve_ids, batch_size=10, flush_interval=60.0, id_block=2)
+        self.addCleanup(self.writer.stop, 1.0)
+
+    def _message(self, chat_id=1, user_id=42):
+        message_id = self.writer.next_id()
+        self.writer.enqueue_message({"message_id": message_id, "chat_id": chat_id, "user_id": user_id})
+        return message_id
+
+    def test_pending_rows_until_written_and_retried_after_failure(self):
+        self.fail = True
+        first = self._message()
+        self._message(chat_id=2)
+        self.writer.enqueue_timings({"message_id": first})
+        self.assertFalse(self.writer.flush())
+        self.assertEqual([r["message_id"] for r in self.writer.pending_messages(1, 42)], [first])
+        self.fail = False
+        self.assertTrue(self.writer.flush())
+        messages, timings = self.batches[-1]
+        self.assertEqual([m["message_id"] for m in messages], [100, 101])
+        self.assertEqual(timings, [{"message_id": first}])
+        self.assertEqual(self.writer.pending_messages(1, 42), [])
+        snapshot = self.writer.snapshot()
+        self.assertEqual((snapshot["failures"], snapshot["written_messages"]), (1, 2))
+
+    def test_batch_without_partition_is_dropped_not_retried(self):
+        no_partition = RuntimeError('no partition of relation "messages_history" found for row')
+        no_partition.pgcode = "23514"
+        self.fail = no_partition
+        self._message()
+        self.assertTrue(self.writer.flush())
+        self.fail = False
+        second = self._message()
+        self.assertTrue(self.writer.flush())
+        self.assertEqual([m["message_id"] for m in self.batches[-1][0]], [second])
+        snapshot = self.writer.snapshot()
+        self.assertEqual((snapshot["lost"], snapshot["queue_depth"], snapshot["written_messages"]), (1, 0, 1))
+
+    def test_stop_flushes_queue(self):
+        ids = [self._message() for _ in range(2)]
+        self.writer.stop(1.0)
+        self.assertEqual([m["message_id"] for b in self.batches for m in b[0]], ids)
+        self.assertEqual(self.writer.snapshot()["queue_depth"], 0)
+
+
+class TestStatementRegistry(unittest.TestCase):
+    class _Cursor:
+        """Records statements; the connection's `server` dict stands in for the session."""
+
+        def __init__(self, connection):
+            self.connection = connection
+            self.executed = []
+            self._row = None
+
+        def execute(self, sql, params=None):
+            self.executed.append((sql, params))
+            server = self.connection.server
+            if sql.startswith("PREPARE"):
+                name = sql.split()[1]
+                if name in server:
+                    error = RuntimeError(f'prepared statement "{name}" already exists')
+                    error.pgcode = "42P05"
+                    raise error
+                server[name] = ["bigint[]", "bigint"]
+            elif "pg_prepared_statements" in sql:
+                self._row = {"types": server[params[0]]} if params[0] in server else None
+
+        def fetchone(self):
+            return self._row
+
+    class _Connection:
+        def __init__(self):
+            self.server = {}
+
+    def test_numbers_placeholders(self):
+        registry = StatementRegistry()
+        named = registry.register("named", "SELECT %(a)s, %(b)s, %(a)s, 'x%%'")
+        self.assertEqual(named.text, "SELECT $1, $2, $1, 'x%'")
+        self.assertEqual(named.values({"b": 2, "a": 1}), [1, 2])
+        positional = registry.register("positional", "SELECT * FROM t WHERE id = ANY(%s::bigint[]) LIMIT %s")
+        self.assertEqual(positional.text, "SELECT * FROM t WHERE id = ANY($1::bigint[]) LIMIT $2")
+        with self.assertRaises(ValueError):
+            positional.values((1,))
+        with self.assertRaises(ValueError):
+            registry.register("positional", "SELECT 1")
+
+    def test_prepares_once_per_connection(self):
+        registry = StatementRegistry()
+        statement = registry.register("via", "SELECT * FROM t WHERE id = ANY(%s::bigint[]) LIMIT %s")
+        conn = self._Connection()
+        cur = self._Cursor(conn)
+        registry.execute(cur, statement, ([1, 2, 3], 5))
+        registry.execute(cur, statement, ([4], 5))
+        self.assertEqual(cur.executed[1], ("PREPARE h2a_via AS SELECT * FROM t WHERE id = ANY($1::bigint[]) LIMIT $2", None))
+        executes = [sql for sql, _ in cur.executed if sql.startswith("EXECUTE")]
+        self.assertEqual(executes, ["EXECUTE h2a_via (%s::bigint[], %s::bigint)"] * 2)
+        self.assertEqual(cur.executed[-1][1], [[4], 5])
+        other = self._Cursor(self._Connection())
+        registry.execute(other, statement, ([1], 5))
+        self.assertTrue(other.executed[1][0].startswith("PREPARE h2a_via"))
+        self.assertEqual(registry.snapshot()["prepares"], 2)
+        registry.enabled = False
+        registry.execute(cur, statement, ([1], 5))
+        self.assertEqual(cur.executed[-1], (statement.sql, ([1], 5)))
+
+    def test_statement_already_in_session_is_executed_not_prepared_again(self):
+        sql = "SELECT * FROM t WHERE id = ANY(%s::bigint[]) LIMIT %s"
+        conn = self._Connection()
+        first = StatementRegistry()
+        first.execute(self._Cursor(conn), first.register("via", sql), ([1], 5))
+        registry = StatementRegistry()
+        statement = registry.register("via", sql)
+        cur = self._Cursor(conn)
+        registry.execute(cur, statement, ([2], 5))
+        self.assertFalse(any(sql.startswith("PREPARE") for sql, _ in cur.executed))
+        self.assertEqual(cur.executed[-1], ("EXECUTE h2a_via (%s::bigint[], %s::bigint)", [[2], 5]))
+        self.assertEqual(registry.snapshot()["prepares"], 0)
+
+
+class TestGraphLinker(unittest.TestCase):
+    def test_batches_and_deduplicates_links(self):
+        link_solution, link_pairs = MagicMock(), MagicMock()
+        linker = GraphLinker(link_solution, link_pairs, batch_size=10, flush_interval=60.0)
+        linker.enqueue([(7, [0.1])], [(1, 7, 0.5)])
+        linker.enqueue([(7, [0.1]), (8, [0.2])], [(1, 7, 0.6), (2, 8, 0.4)])
+        linker.stop()
+        self.assertEqual([c.args[0] for c in link_solution.call_args_list], [7, 8])
+        link_pairs.assert_called_once_with([(1, 7, 0.6), (2, 8, 0.4)])
+        snapshot = linker.snapshot()
+        self.assertEqual(snapshot["queue_depth"], 0)
+        self.assertEqual(snapshot["deduplicated"], 2)
+        self.assertEqual(snapshot["linked_pairs"], 2)
+
+    def test_failures_are_counted(self):
+        linker = GraphLinker(MagicMock(side_effect=RuntimeError("db down")), MagicMock())
+        linker.enqueue([(7, [0.1])], [])
+        linker.stop()
+        snapshot = linker.snapshot()
+        self.assertEqual(snapshot["failures"], 1)
+        self.assertIn("db down", snapshot["last_error"])
+
+
+class TestOverloadGovernor(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.governor = OverloadGovernor(
+            enter_in_flight=3, exit_in_flight=1,
+            enter_pending_updates=10, exit_pending_updates=2,
+            min_degraded_seconds=5.0, clock=lambda: self.now,
+        )
+
+    def test_hysteresis_between_enter_and_exit(self):
+        self.governor.report_pending_updates(10)
+        self.assertTrue(self.governor.degraded)
+        self.governor.report_pending_updates(5)
+        self.assertTrue(self.governor.degraded)
+        self.governor.report_pending_updates(0)
+        self.assertTrue(self.governor.degraded)
+        self.now += 5.0
+        self.governor.report_pending_updates(0)
+        self.assertFalse(self.governor.degraded)
+        self.assertEqual(self.governor.snapshot()["transitions"], 2)
+
+    def test_in_flight_messages_trigger_degraded_mode(self):
+        with self.governor.track_message() as first:
+            with self.governor.track_message():
+                with self.governor.track_message() as third:
+                    pass
+        self.assertFalse(first)
+        self.assertTrue(third)
+        self.assertEqual(self.governor.snapshot()["in_flight"], 0)
+
+    def test_forced_mode_overrides_signals(self):
+        self.governor.force("degraded")
+        self.assertTrue(self.governor.degraded)
+        self.governor.force("normal")
+        self.governor.report_pending_updates(100)
+        self.assertFalse(self.governor.degraded)
+        with self.assertRaises(ValueError):
+            self.governor.force("panic")
+
+
+class TestStageGraph(unittest.IsolatedAsyncioTestCase):
+    async def test_independent_stages_run_concurrently(self):
+        started = asyncio.Event()
+
+        async def left(_ctx):
+            started.set()
+            return 1
+
+        async def right(_ctx):
+            await asyncio.wait_for(started.wait(), 1.0)
+            return 2
+
+        graph = StageGraph([
+            Stage("left", left),
+            Stage("right", right),
+            Stage("total", lambda _ctx, left, right: left + right, depends_on=("left", "right")),
+        ])
+        deadline = Deadline(5.0)
+        results = await graph.run(None, deadline)
+        self.assertEqual(results["total"], 3)
+        self.assertEqual(set(deadline.timings), {"left", "right", "total"})
+
+    async def test_retries_then_optional_failure_yields_none(self):
+        flaky = MagicMock(side_effect=[RuntimeError("blip"), "ok"])
+        graph = StageGraph([
+            Stage("flaky", lambda _ctx: flaky(), retries=1),
+            Stage("broken", lambda _ctx: 1 / 0, optional=True),
+            Stage("after", lambda _ctx, flaky, broken: (flaky, broken), depends_on=("flaky", "broken")),
+        ])
+        results = await graph.run(None)
+        self.assertEqual(results["after"], ("ok", None))
+
+    async def test_required_failure_and_timeout_raise(self):
+        async def slow(_ctx):
+            await asyncio.sleep(1.0)
+
+        with self.assertRaises(StageError) as caught:
+            await StageGraph([Stage("slow", slow, timeout=0.01)]).run(None)
+        self.assertEqual(caught.exception.stage, "slow")
+        with self.assertRaises(ValueError):
+            StageGraph([Stage("a", len, depends_on=("b",)), Stage("b", len, depends_on=("a",))])
+
+    async def test_staged_pipeline_replies_with_reply_stage(self):
+        class Echo(StagedPipeline):
+            name = "echo"
+            reply_stage = "shout"
+
+            def stages(self, ctx):
+                return [
+                    Stage("text", lambda c: c.message_text),
+                    Stage("shout", lambda _c, text: text.upper(), depends_on=("text",)),
+                ]
+
+        ctx = PipelineContext(1, 100, "private", "hi", deadline=Deadline(5.0))
+        result = await Echo().run(ctx)
+        self.assertEqual((result.reply, result.pipeline_used, result.apply_style_filter), ("HI", "echo", True))
+        self.assertEqual(set(ctx.deadline.timings), {"text", "shout"})
+        Echo.stages = lambda self, ctx: [Stage("shout", lambda _c: 1 / 0)]
+        with self.assertRaises(StageError):
+            await Echo().run(ctx)  # no fallback_reply: the failure propagates
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.deadline = Deadline(10.0, clock=lambda: self.now)
+
+    def test_timeout_tracks_remaining_budget(self):
+        self.assertEqual(self.deadline.timeout(), 10.0)
+        self.assertEqual(self.deadline.timeout(cap=3.0), 3.0)
+        self.now += 9.9
+        self.assertGreaterEqual(self.deadline.timeout(), 0.5)
+        self.assertFalse(self.deadline.can_afford(1.0))
+
+    def test_timed_call_takes_its_timeout_when_it_starts(self):
+        call = self.deadline.timed(lambda text, timeout: (text, timeout), "hi")
+        self.now += 4.0
+        self.assertEqual(call(), ("hi", 6.0))
+
+    def test_stage_overrun_is_recorded(self):
+        with self.deadline.stage("extraction", allowance=2.0):
+            self.now += 3.0
+        with self.deadline.stage("generation"):
+            self.now += 1.0
+        self.assertEqual(self.deadline.timings, {"extraction": 3.0, "generation": 1.0})
+        self.assertEqual(self.deadline.overruns, {"extraction": 1.0})
+
+    def test_unbounded_deadline_never_limits(self):
+        deadline = Deadline()
+        self.assertIsNone(deadline.timeout())
+        self.assertEqual(deadline.timeout(cap=5.0), 5.0)
+        self.assertTrue(deadline.can_afford(1e9))
+
+
 class TestShowOrgsPipeline(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         mock_queries.reset_mock()
         mock_llm.reset_mock()
-        mock_queries.get_or_create_user.return_value = {"user_id": 1}
-        mock_queries.get_or_create_chat.return_value = {"chat_id": 100}
-        mock_queries.get_user_style.return_value = "normal"
-        mock_queries.get_chat_style.return_value = None
-        mock_queries.find_orgs_by_embedding.return_value = [
-            {"name": "Amnesty", "description": "Human rights", "website": "https://amnesty.org", "similarity": 0.85}
-        ]
-        mock_queries.find_projects_by_embedding.return_value = []
+        mock_queries.load_session.return_value = {
+            "user_style": "normal", "chat_style": None, "last_message_context": None,
+        }
+        mock_queries.find_recommendations.return_value = ([
+            {"organization_id": 1, "name": "Amnesty", "description": "Human rights",
+             "website": "https://amnesty.org", "similarity": 0.85, "source": "vector", "query": 0}
+        ], [])
+        mock_queries.find_orgs_by_text.return_value = []
+        mock_queries.find_projects_by_text.return_value = []
         mock_queries.save_message.return_value = None
         mock_llm.enrich_query.return_value = "human rights violations torture detention"
         mock_llm.get_embedding.return_value = [0.1] * 1536
         mock_llm.generate_org_reply.return_value = "Check out [Amnesty International](https://amnesty.org)!"
+        mock_queries.list_org_category_centroids.return_value = []
+        invalidate_category_centroids()
 
     async def test_query_is_enriched(self):
-        await pipeline_show_orgs(1, 100, "private", "human rights")
-        mock_llm.enrich_query.assert_called_with("human rights")
+        await pipeline_show_orgs(1, 100, "private", "people jailed for human rights work")
+        mock_llm.enrich_query.assert_called_with("people jailed for human rights work", timeout=None)
 
     async def test_orgs_returned(self):
         result = await pipeline_show_orgs(1, 100, "private", "corruption")
@@ -259,6 +903,74 @@ class TestShowOrgsPipeline(unittest.IsolatedAsyncioTestCase):
         await pipeline_show_orgs(1, 100, "private", "poverty")
         mock_queries.save_message.assert_not_called()
 
+    async def test_known_category_uses_centroid_without_llm(self):
+        # list_org_category_centroids returns parsed float32 vectors.
+        centroid = np.full(1536, 0.2, dtype=np.float32)
+        mock_queries.list_org_category_centroids.return_value = [
+            {"slug": "animals", "centroid": centroid, "member_count": 4},
+            {"slug": "health", "centroid": None, "member_count": 0},
+        ]
+        await pipeline_show_orgs(1, 100, "private", "Права тварин")
+        mock_llm.enrich_query.assert_not_called()
+        mock_llm.get_embedding.assert_not_called()
+        problem_ids, vectors = mock_queries.find_recommendations.call_args.args
+        self.assertEqual(problem_ids, [])
+        self.assertEqual(vectors[0].dtype, np.float32)
+        np.testing.assert_array_equal(vectors[0], centroid)
+
+    async def test_short_query_without_centroid_skips_enrichment(self):
+        await pipeline_show_orgs(1, 100, "private", "освіта")
+        mock_llm.enrich_query.assert_not_called()
+        mock_llm.get_embedding.assert_called_with("освіта", timeout=None)
+        mock_queries.find_orgs_by_text.assert_called_with("освіта", top_n=5, timeout=None)
+
+    async def test_lexical_and_vector_results_are_fused(self):
+        mock_queries.find_orgs_by_text.return_value = [
+            {"organization_id": 2, "name": "Osvita Fund", "description": None, "website": None, "lexical_score": 0.4},
+            {"organization_id": 1, "name": "Amnesty", "description": None, "website": None, "lexical_score": 0.1},
+        ]
+        mock_queries.find_projects_by_text.side_effect = RuntimeError("column search_uk does not exist")
+        try:
+            result = await pipeline_show_orgs(1, 100, "private", "освіта", degraded=True)
+        finally:
+            mock_queries.find_projects_by_text.side_effect = None
+        self.assertLess(result.index("Amnesty"), result.index("Osvita Fund"))
+
+    async def test_factory_pipeline_runs_the_stage_graph(self):
+        ctx = PipelineContext(1, 100, "private", "human rights", lang="en", degraded=True)
+        result = await ShowOrgsPipeline().run(ctx)
+        self.assertEqual(result.pipeline_used, "show_orgs")
+        self.assertIn("Amnesty", result.reply)
+        self.assertIn("generation", ctx.deadline.timings)
+        mock_queries.find_recommendations.side_effect = RuntimeError("db down")
+        try:
+            result = await ShowOrgsPipeline().run(ctx)
+        finally:
+            mock_queries.find_recommendations.side_effect = None
+        self.assertEqual(result.reply, "⚠️ Could not find organizations right now. Please try again.")
+
+    async def test_degraded_mode_renders_template_reply(self):
+        result = await pipeline_show_orgs(1, 100, "private", "human rights", degraded=True)
+        mock_llm.enrich_query.assert_not_called()
+        mock_llm.generate_org_reply.assert_not_called()
+        mock_llm.get_embedding.assert_called_with("human rights", timeout=None)
+        self.assertIn("Amnesty", result)
+        self.assertIn("https://amnesty.org", result)
+
+
+class TestOrgCategoryMatching(unittest.TestCase):
+    def test_labels_aliases_and_typos_match(self):
+        self.assertEqual(match_org_category("🐾 Права тварин").slug, "animals")
+        self.assertEqual(match_org_category("Animal rights").slug, "animals")
+        self.assertEqual(match_org_category("корупцiя").slug, "corruption")
+        self.assertEqual(match_org_category("здоров’я").slug, "health")
+
+    def test_unrelated_or_long_text_does_not_match(self):
+        self.assertIsNone(match_org_category("погода"))
+        self.assertIsNone(
+            match_org_category("мене бісить що в школі немає освіта нормальної взагалі")
+        )
+
 
 class TestStyleResolution(unittest.IsolatedAsyncioTestCase):
     """Test that style priority is: user > chat > default."""
@@ -266,17 +978,14 @@ class TestStyleResolution(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         mock_queries.reset_mock()
         mock_llm.reset_mock()
-        mock_queries.get_or_create_user.return_value = {"user_id": 1}
-        mock_queries.get_or_create_chat.return_value = {"chat_id": 100}
-        mock_queries.upsert_problem.return_value = 1
-        mock_queries.upsert_solution.return_value = 1
-        mock_queries.find_orgs_via_solutions.return_value = []
-        mock_queries.find_projects_via_solutions.return_value = []
-        mock_queries.find_orgs_by_embedding.return_value = []
-        mock_queries.find_projects_by_embedding.return_value = []
+        mock_queries.load_session.return_value = {
+            "user_style": "normal", "chat_style": "normal", "last_message_context": None,
+        }
+        mock_queries.upsert_problems.side_effect = lambda rows, timeout=None: [1] * len(rows)
+        mock_queries.upsert_solutions.side_effect = lambda rows, timeout=None: [1] * len(rows)
+        mock_queries.find_recommendations.return_value = ([], [])
         mock_queries.save_message.return_value = None
-        mock_queries.get_last_message_context.return_value = None
-        mock_queries.link_problem_solution.return_value = None
+        mock_queries.link_problems_solutions.return_value = None
         mock_queries.get_chat_history.return_value = []
         mock_llm.extract_problems_and_solutions.return_value = {
             "problems": [], "solutions": []
@@ -287,22 +996,22 @@ class TestStyleResolution(unittest.IsolatedAsyncioTestCase):
         mock_llm.rewrite_reply_with_style.return_value = "styled reply"
 
     async def test_user_style_takes_priority(self):
-        mock_queries.get_user_style.return_value = "funny"
-        mock_queries.get_chat_style.return_value = "rude"
+        mock_queries.load_session.return_value["user_style"] = "funny"
+        mock_queries.load_session.return_value["chat_style"] = "rude"
         await pipeline_process_message(1, 100, "private", "I hate taxes")
         call_args = mock_llm.rewrite_reply_with_style.call_args
         self.assertEqual(call_args.args[1], "funny")
 
     async def test_chat_style_fallback(self):
-        mock_queries.get_user_style.return_value = "normal"
-        mock_queries.get_chat_style.return_value = "sarcastic"
+        mock_queries.load_session.return_value["user_style"] = "normal"
+        mock_queries.load_session.return_value["chat_style"] = "sarcastic"
         await pipeline_process_message(1, 100, "private", "traffic is terrible")
         call_args = mock_llm.rewrite_reply_with_style.call_args
         self.assertEqual(call_args.args[1], "sarcastic")
 
     async def test_default_normal_style(self):
-        mock_queries.get_user_style.return_value = "normal"
-        mock_queries.get_chat_style.return_value = None
+        mock_queries.load_session.return_value["user_style"] = "normal"
+        mock_queries.load_session.return_value["chat_style"] = None
         await pipeline_process_message(1, 100, "private", "healthcare is broken")
         mock_llm.rewrite_reply_with_style.assert_not_called()
 
@@ -0,0 +1,318 @@
+"""Tests for the SQL-building and row-shaping parts of db.queries.
+
+No database is needed: `db_cursor` is replaced by a fake cursor that records
+statements and returns canned rows, and prepared statements are turned off so
+each call is one plain `execute`.
+
+tests/test_pipelines.py and tests/test_bot_config.py replace `db.queries`
+(and `utils.llm`) with mocks in `sys.modules`. The real modules are imported
+here with those entries set aside; afterwards every project module this
+import loaded is dropped again and the entries are put back, so the other
+test files see the same `sys.modules` whichever runs first.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+_PROJECT_PACKAGES = ("bot", "db", "pipelines", "server", "utils")
+_STUBBED = ("db", "db.queries", "db.async_queries", "utils", "utils.llm", "server", "server.main")
+_saved = {name: sys.modules.pop(name) for name in _STUBBED if name in sys.modules}
+_loaded_before = set(sys.modules)
+try:
+    from db import queries  # noqa: E402
+    from db.embedding_store import EmbeddingStore  # noqa: E402
+    # server.main needs db.async_queries (psycopg 3) only inside its handlers.
+    sys.modules["db.async_queries"] = MagicMock()
+    from fastapi import Response  # noqa: E402
+    from server import main as server_main  # noqa: E402
+finally:
+    for _name in set(sys.modules) - _loaded_before:
+        if _name.split(".")[0] in _PROJECT_PACKAGES:
+            del sys.modules[_name]
+    sys.modules.update(_saved)
+
+
+class _Cursor:
+    """Returns `results[i]` (a list of rows) for the i-th statement executed."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self.rows = list(self.results.pop(0)) if self.results else []
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+@contextmanager
+def _fake_db(cur: _Cursor):
+    @contextmanager
+    def db_cursor(timeout=None):
+        yield cur
+
+    with patch.object(queries, "db_cursor", db_cursor), patch.object(queries.STATEMENTS, "enabled", False):
+        yield cur
+
+
+class TestListPagination(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        when = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+        cursor = queries._encode_cursor([when, 42])
+        self.assertNotIn("=", cursor)
+        self.assertEqual(queries._decode_cursor(cursor, 2), [when.isoformat(), 42])
+
+    def test_invalid_or_tampered_cursor_is_rejected(self):
+        valid = queries._encode_cursor(["Acme", 7])
+        for cursor in ("not base64!", valid[:-3], queries._encode_cursor({"a": 1}), queries._encode_cursor([1])):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                queries._decode_cursor(cursor, 2)
+
+    def test_page_sql_keyset_fields_and_limit(self):
+        spec = queries._PROBLEM_LIST
+        cursor = queries._encode_cursor(["2026-03-01T00:00:00+00:00", 9])
+        page = queries._list_page_sql(spec, ["is_processed = %s"], [True], limit=10_000, cursor=cursor, fields=["name"])
+        self.assertEqual(page.fields, ["name"])
+        self.assertEqual(page.limit, queries.LIST_MAX_LIMIT)
+        self.assertIn("SELECT name AS name, created_at AS created_at, problem_id AS problem_id FROM problems", page.sql)
+        self.assertIn(
+            "WHERE is_processed = %s AND (created_at, problem_id) < (%s::timestamptz, %s::bigint)", page.sql
+        )
+        self.assertTrue(page.sql.endswith("ORDER BY created_at DESC, problem_id DESC LIMIT %s"))
+        self.assertEqual(page.params, [True, "2026-03-01T00:00:00+00:00", 9, queries.LIST_MAX_LIMIT + 1])
+
+        ascending = queries._list_page_sql(queries._ORGANIZATION_LIST, [], [], cursor=queries._encode_cursor(["a", 1]))
+        self.assertIn("(name, organization_id) > (%s::text, %s::bigint)", ascending.sql)
+        self.assertEqual(ascending.limit, queries.LIST_DEFAULT_LIMIT)
+
+    def test_unknown_field_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, "Unknown field"):
+            queries._list_page_sql(queries._PROBLEM_LIST, [], [], fields=["name", "embedding"])
+
+    def test_page_rows_trim_and_next_cursor(self):
+        page = queries._list_page_sql(queries._ORGANIZATION_LIST, [], [], limit=2, fields=["name"])
+        rows = [{"name": n, "organization_id": i} for i, n in enumerate(["a", "b", "c"], start=1)]
+        items, next_cursor = queries._list_page_rows(queries._ORGANIZATION_LIST, page, rows)
+        self.assertEqual(items, [{"name": "a"}, {"name": "b"}])
+        self.assertEqual(queries._decode_cursor(next_cursor, 2), ["b", 2])
+        self.assertEqual(queries._list_page_rows(queries._ORGANIZATION_LIST, page, rows[:2])[1], None)
+
+    def test_filters(self):
+        after = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        before = datetime(2026, 2, 1, tzinfo=timezone.utc)
+        where, params = queries._common_filters("name", "created_at", "50%_Off\\", after, before)
+        self.assertEqual(where, ["lower(name) LIKE %s", "created_at >= %s", "created_at < %s"])
+        self.assertEqual(params, ["50\\%\\_off\\\\%", after, before])
+        where, params = queries._message_list_filters(created_after=after, pipeline="show_orgs", user_id=5)
+        self.assertEqual(where, ["m.date >= %s", "m.pipeline_used = %s", "m.user_id = %s"])
+        self.assertEqual(params, [after, "show_orgs", 5])
+
+    def test_list_problems_returns_page_and_cursor(self):
+        created = datetime(2026, 3, 1, tzinfo=timezone.utc)
+        cur = _Cursor([{"problem_id": i, "name": f"p{i}", "created_at": created} for i in (3, 2)])
+        with _fake_db(cur):
+            rows, next_cursor = queries.list_problems(limit=1, fields=["problem_id"], is_processed=False)
+        self.assertEqual(rows, [{"problem_id": 3}])
+        self.assertEqual(queries._decode_cursor(next_cursor, 2), [created.isoformat(), 3])
+        sql, params = cur.executed[0]
+        self.assertIn("WHERE is_processed = %s", sql)
+        self.assertEqual(params, [False, 2])
+
+
+def _entity(name: str, embedding: list[float]) -> dict:
+    return {"name": name, "context": f"{name} context", "content": f"{name} content", "embedding": embedding}
+
+
+class TestEmbeddingStoreProbe(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = EmbeddingStore(os.path.join(tmp.name, "problems.store"), dim=3)
+        checks = patch.dict(queries._store_checks, clear=True)
+        checks.start()
+        self.addCleanup(checks.stop)
+
+    def _upsert(self, cur: _Cursor, entities: list[dict]) -> list[int]:
+        with _fake_db(cur):
+            return queries._upsert_entities("problems", "problem_id", self.store, entities, None)
+
+    def test_unbuilt_store_leaves_the_probe_to_sql(self):
+        cur = _Cursor([{"ord": 1, "id": 7, "inserted": False}])
+        self.assertEqual(self._upsert(cur, [_entity("a", [1.0, 0.0, 0.0])]), [7])
+        self.assertEqual(len(cur.executed), 1)  # no count: an empty store is never trusted
+        sql, params = cur.executed[0]
+        self.assertIn("INSERT INTO problems", sql)
+        self.assertEqual(params[4], [True])
+        self.assertEqual(len(self.store), 0)  # reused rows are not appended
+
+    def test_lagging_store_leaves_the_probe_to_sql(self):
+        self.store.append(1, [1.0, 0.0, 0.0])
+        cur = _Cursor([{"rows": 5}], [{"ord": 1, "id": 8, "inserted": True}])
+        self.assertEqual(self._upsert(cur, [_entity("b", [0.0, 1.0, 0.0])]), [8])
+        self.assertIn("count(*)", cur.executed[0][0])
+        self.assertEqual(cur.executed[1][1][4], [True])
+        self.assertEqual(self.store.nearest([0.0, 1.0, 0.0])[0], 8)
+
+    def test_failed_append_marks_store_unusable(self):
+        self.store.append(1, [1.0, 0.0, 0.0])
+        cur = _Cursor([{"rows": 1}], [{"ord": 1, "id": 2, "inserted": True}])
+        with patch.object(self.store, "append", side_effect=OSError("disk full")):
+            self._upsert(cur, [_entity("c", [0.0, 1.0, 0.0])])
+        self.assertFalse(queries._store_usable(self.store, "problems"))
+
+
+class TestEntityWrites(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = EmbeddingStore(os.path.join(tmp.name, "problems.store"), dim=3)
+        self.store.append(1, [1.0, 0.0, 0.0])
+        for patcher in (
+            patch.dict(queries._store_checks, clear=True),
+            patch.object(queries, "PROBLEM_STORE", self.store),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upsert_merges_store_and_sql_ids_in_input_order(self):
+        entities = [
+            _entity("new", [0.0, 1.0, 0.0]),
+            _entity("known", [1.0, 0.01, 0.0]),
+            _entity("reused", [0.0, 0.0, 1.0]),
+        ]
+        cur = _Cursor([{"rows": 1}], [{"ord": 1, "id": 9, "inserted": True}, {"ord": 2, "id": 3, "inserted": False}])
+        with _fake_db(cur):
+            self.assertEqual(queries.upsert_problems(entities), [9, 1, 3])
+        names, _, _, vectors, probes, threshold = cur.executed[1][1]
+        self.assertEqual(names, ["new", "reused"])  # "known" was resolved by the store
+        self.assertEqual(len(vectors), 2)
+        self.assertEqual(probes, [False, False])  # the store already answered "no match"
+        self.assertEqual(threshold, queries.DUPLICATE_SIMILARITY)
+        self.assertEqual(self.store.nearest([0.0, 1.0, 0.0])[0], 9)  # inserted rows are appended
+        self.assertEqual(self.store.nearest([0.0, 0.0, 1.0])[0], 1)  # reused ones are not
+        with _fake_db(_Cursor()) as empty:
+            self.assertEqual(queries.upsert_problems([]), [])
+        self.assertEqual(empty.executed, [])
+
+    def test_link_pairs_keep_highest_score(self):
+        cur = _Cursor()
+        with _fake_db(cur):
+            queries.link_problems_solutions([(1, 7, 0.4), (2, 7, 0.5), (1, 7, 0.9)])
+            queries.link_problems_solutions([])
+        self.assertEqual(len(cur.executed), 1)
+        self.assertEqual(cur.executed[0][1], ([1, 2], [7, 7], [0.9, 0.5]))
+
+
+class TestMessageSaves(unittest.TestCase):
+    def setUp(self):
+        self.cache = MagicMock()
+        self.writer = MagicMock()
+        self.writer.next_id.return_value = 42
+        for patcher in (
+            patch.object(queries, "SESSION_CACHE", self.cache),
+            patch.object(queries, "MESSAGE_WRITER", self.writer),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_write_behind_queues_the_row_and_caches_it(self):
+        cur = _Cursor()
+        with _fake_db(cur), patch.object(queries, "MESSAGE_WRITE_BEHIND", True):
+            self.assertEqual(queries.save_message(10, 1, "hi", "hello", pipeline_used="chat"), 42)
+            queries.save_stage_timings(42, "chat", 0.5, {"routing": 0.1})
+        self.assertEqual(cur.executed, [])
+        row = self.writer.enqueue_message.call_args.args[0]
+        self.assertEqual((row["message_id"], row["chat_id"], row["message_text"]), (42, 10, "hi"))
+        self.assertEqual(self.writer.enqueue_timings.call_args.args[0]["total_ms"], 500)
+        self.cache.append_message.assert_called_once_with(
+            10, 1, {"message_id": 42, "message_text": "hi", "reply_text": "hello", "pipeline_used": "chat"}
+        )
+
+    def test_direct_insert_caches_the_row(self):
+        with _fake_db(_Cursor([{"message_id": 7}], [{"message_id": 8}])), patch.object(queries, "MESSAGE_WRITE_BEHIND", False):
+            self.assertEqual(queries.save_message(10, 1, "hi", "hello"), 7)
+            self.assertEqual(queries.save_message(10, None, "hi", "hello"), 8)
+        self.writer.enqueue_message.assert_not_called()
+        self.assertEqual(self.cache.append_message.call_args.args[2]["message_id"], 7)
+        self.cache.append_message.assert_called_once()  # no user, no conversation ring
+
+
+class TestFindRecommendations(unittest.TestCase):
+    def _row(self, source, kind, item_id, score, ord=None):
+        return {"source": source, "ord": ord, "kind": kind, "item_id": item_id, "name": f"n{item_id}",
+                "description": "d", "website": "w", "org_name": "o", "org_website": "ow", "score": score}
+
+    def test_graph_and_vector_rows_are_shaped_by_source(self):
+        cur = _Cursor([
+            self._row("graph", "organization", 1, 0.8),
+            self._row("graph", "project", 2, 0.6),
+            self._row("vector", "organization", 3, 0.7, ord=2),
+        ])
+        with _fake_db(cur), patch.object(queries, "CATALOG_INDEX_ENABLED", False):
+            orgs, projects = queries.find_recommendations([5], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], top_n=4)
+        self.assertEqual(orgs[0], {"organization_id": 1, "name": "n1", "description": "d", "website": "w",
+                                   "combined_score": 0.8, "source": "graph"})
+        self.assertEqual(orgs[1]["similarity"], 0.7)
+        self.assertEqual((orgs[1]["source"], orgs[1]["query"]), ("vector", 1))
+        self.assertEqual(projects, [{"project_id": 2, "name": "n2", "description": "d", "org_name": "o",
+                                     "org_website": "ow", "combined_score": 0.6, "source": "graph"}])
+        params = cur.executed[0][1]
+        self.assertEqual((params["problem_ids"], params["top_n"], len(params["vectors"])), ([5], 4, 2))
+
+    def test_empty_graph_falls_back_to_the_catalog_index(self):
+        snapshot = MagicMock()
+        snapshot.orgs.search_many.return_value = [[{"organization_id": 3, "similarity": 0.9}], []]
+        snapshot.projects.search_many.return_value = [[], [{"project_id": 4, "similarity": 0.5}]]
+        index = MagicMock()
+        index.get.return_value = snapshot
+        cur = _Cursor([])
+        with _fake_db(cur), patch.object(queries, "CATALOG_INDEX_ENABLED", True), \
+                patch.object(queries, "CATALOG_INDEX", index):
+            orgs, projects = queries.find_recommendations([5], [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        self.assertEqual(cur.executed[0][1]["vectors"], [])  # the statement carries only the graph path
+        self.assertEqual(orgs, [{"organization_id": 3, "similarity": 0.9, "source": "vector", "query": 0}])
+        self.assertEqual(projects, [{"project_id": 4, "similarity": 0.5, "source": "vector", "query": 1}])
+
+        with _fake_db(_Cursor()) as unused, patch.object(queries, "CATALOG_INDEX_ENABLED", True), \
+                patch.object(queries, "CATALOG_INDEX", index):
+            queries.find_recommendations([], [[1.0, 0.0, 0.0]])
+        self.assertEqual(unused.executed, [])  # no problems and an index: no SQL at all
+
+
+class TestListEndpointParams(unittest.TestCase):
+    def test_list_params_split_fields(self):
+        params = server_main._list_params(
+            limit=5, cursor="abc", fields=" name, ,problem_id ", name_prefix="Ac",
+            created_after=None, created_before=None,
+        )
+        self.assertEqual(params["fields"], ["name", "problem_id"])
+        self.assertEqual((params["limit"], params["cursor"], params["name_prefix"]), (5, "abc", "Ac"))
+        self.assertIsNone(server_main._list_params(
+            limit=5, cursor=None, fields=None, name_prefix=None, created_after=None, created_before=None
+        )["fields"])
+
+    def test_next_cursor_header(self):
+        response = Response()
+        self.assertEqual(server_main._page(response, ([{"id": 1}], "next")), [{"id": 1}])
+        self.assertEqual(response.headers["X-Next-Cursor"], "next")
+        last = Response()
+        server_main._page(last, ([], None))
+        self.assertNotIn("X-Next-Cursor", last.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,8 +15,11 @@ Design notes:
 import os
 import json
 from openai import OpenAI
-from openai import OpenAIError
+from openai import NOT_GIVEN, OpenAIError
 from dotenv import load_dotenv
+
+from utils.vectors import Embedding, as_embedding
+
 load_dotenv()
 load_dotenv(".env.local", override=True)
 
@@ -36,6 +39,11 @@ CHAT_MODEL = "gpt-5.4-nano"
 def _is_gemini_model(model: str) -> bool:
     return isinstance(model, str) and model.lower().startswith("gemini")
 
+
+def _timeout_arg(timeout: float | None):
+    """OpenAI treats an explicit None as "no timeout"; omit it instead."""
+    return NOT_GIVEN if timeout is None else timeout
+
 LANGUAGE_POLICY = {
     "uk": (
         "Відповідай виключно українською мовою. "
@@ -266,6 +274,7 @@ def _gemini_chat(
     *,
     max_output_tokens: int,
     json_mode: bool = False,
+    timeout: float | None = None,
 ) -> str:
     """Translate OpenAI-style messages to a Gemini call and return assistant text.
 
@@ -287,6 +296,8 @@ def _gemini_chat(
         config_kwargs["system_instruction"] = "\n\n".join(system_parts)
     if json_mode:
         config_kwargs["response_mime_type"] = "application/json"
+    if timeout is not None:
+        config_kwargs["http_options"] = google_genai_types.HttpOptions(timeout=int(timeout * 1000))
     config = google_genai_types.GenerateContentConfig(**config_kwargs)
     response = _get_gemini_client().models.generate_content(
         model=CHAT_MODEL,
@@ -296,10 +307,12 @@ def _gemini_chat(
     return (response.text or "").strip()
 
 
-def get_embedding(text: str) -> list[float]:
-    """Return a 1536-dim embedding for the given text."""
-    response = _get_client().embeddings.create(model=EMBEDDING_MODEL, input=text[:8000])
-    return response.data[0].embedding
+def get_embedding(text: str, timeout: float | None = None) -> Embedding:
+    """Return a 1536-dim float32 embedding for the given text."""
+    response = _get_client().embeddings.create(
+        model=EMBEDDING_MODEL, input=text[:8000], timeout=_timeout_arg(timeout)
+    )
+    return as_embedding(response.data[0].embedding)
 
 
 def detect_pipeline(
@@ -307,9 +320,10 @@ def detect_pipeline(
     previous_message: str | None = None,
     previous_reply: str | None = None,
     previous_pipeline: str | None = None,
+    timeout: float | None = None,
 ) -> str:
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_detect_pipeline(message, previous_message, previous_reply, previous_pipeline)
+        return _gemini_detect_pipeline(message, previous_message, previous_reply, previous_pipeline, timeout)
     previous_pipeline_name = (
         "problem_solution"
         if previous_pipeline == "process_message"
@@ -361,6 +375,7 @@ Reply with only the pipeline name, no explanations."""
         model=CHAT_MODEL,
         messages=[{"role": "user", "content": prompt}],
         max_completion_tokens=20,
+        timeout=_timeout_arg(timeout),
     )
     result = response.choices[0].message.content.strip().lower()
     if result == "process_message":
@@ -369,10 +384,10 @@ Reply with only the pipeline name, no explanations."""
     return result if result in valid else "problem_solution"
 
 
-def extract_problems_and_solutions(message: str) -> dict:
+def extract_problems_and_solutions(message: str, timeout: float | None = None) -> dict:
     """Extract problems and solutions from a user complaint using LLM."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_extract_problems_and_solutions(message)
+        return _gemini_extract_problems_and_solutions(message, timeout)
     prompt = f"""Analyze this message and extract:
 1. The core problems/issues the user is complaining about (1-3 specific problems)
 2. General solution concepts that could address those problems (1-3 solutions)
@@ -393,6 +408,7 @@ Respond in valid JSON with this exact structure:
         messages=[{"role": "user", "content": prompt}],
         max_completion_tokens=1500,
         response_format={"type": "json_object"},
+        timeout=_timeout_arg(timeout),
     )
     content = response.choices[0].message.content or ""
     try:
@@ -408,10 +424,11 @@ def generate_reply(
     projects: list[dict],
     history: list[dict] = None,
     lang: str = "uk",
+    timeout: float | None = None,
 ) -> str:
     """Generate a styled reply with org/project recommendations."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_generate_reply(user_message, style, orgs, projects, history, lang)
+        return _gemini_generate_reply(user_message, style, orgs, projects, history, lang, timeout)
     style_instruction = _style_instruction(style, lang)
     unknown_org = "невідома організація" if lang == "uk" else "unknown organization"
     org_list = "\n".join(
@@ -474,14 +491,22 @@ Generate a short, on-topic response in the active style. Skip orgs that don't ma
             {"role": "user", "content": user_prompt},
         ],
         max_completion_tokens=400,
+        timeout=_timeout_arg(timeout),
     )
     return response.choices[0].message.content.strip()
 
 
-def generate_org_reply(query: str, orgs: list[dict], projects: list[dict], style: str, lang: str = "uk") -> str:
+def generate_org_reply(
+    query: str,
+    orgs: list[dict],
+    projects: list[dict],
+    style: str,
+    lang: str = "uk",
+    timeout: float | None = None,
+) -> str:
     """Generate a reply specifically for the Show Organizations pipeline."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_generate_org_reply(query, orgs, projects, style, lang)
+        return _gemini_generate_org_reply(query, orgs, projects, style, lang, timeout)
     style_instruction = _style_instruction(style, lang)
     na = "Н/Д" if lang == "uk" else "N/A"
     org_list = "\n".join(
@@ -523,14 +548,15 @@ Use Markdown links: [Name](url). Write concisely and practically."""
             {"role": "user", "content": user_prompt},
         ],
         max_completion_tokens=400,
+        timeout=_timeout_arg(timeout),
     )
     return response.choices[0].message.content.strip()
 
 
-def detect_style_from_message(message: str) -> str | None:
+def detect_style_from_message(message: str, timeout: float | None = None) -> str | None:
     """Try to detect which style the user is requesting."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_detect_style_from_message(message)
+        return _gemini_detect_style_from_message(message, timeout)
     prompt = f"""Визнач, який стиль відповіді просить користувач.
 Поверни ТІЛЬКИ одне слово: polite, funny, sarcastic, normal, rude, або unknown.
 
@@ -556,6 +582,7 @@ def detect_style_from_message(message: str) -> str | None:
         model=CHAT_MODEL,
         messages=[{"role": "user", "content": prompt}],
         max_completion_tokens=10,
+        timeout=_timeout_arg(timeout),
     )
     result = response.choices[0].message.content.strip().lower()
     return (
@@ -563,10 +590,10 @@ def detect_style_from_message(message: str) -> str | None:
     )
 
 
-def enrich_query(query: str) -> str:
+def enrich_query(query: str, timeout: float | None = None) -> str:
     """Expand a short query with keywords for better semantic search (max 800 chars)."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_enrich_query(query)
+        return _gemini_enrich_query(query, timeout)
     prompt = f"""Expand this query with relevant keywords and context for semantic search. Max 800 characters.
 Query: "{query}"
 Return only the enriched text."""
@@ -574,14 +601,21 @@ Return only the enriched text."""
         model=CHAT_MODEL,
         messages=[{"role": "user", "content": prompt}],
         max_completion_tokens=150,
+        timeout=_timeout_arg(timeout),
     )
     return response.choices[0].message.content.strip()[:800]
 
 
-def rewrite_reply_with_style(text: str, style: str, lang: str = "uk", original_message: str | None = None) -> str:
+def rewrite_reply_with_style(
+    text: str,
+    style: str,
+    lang: str = "uk",
+    original_message: str | None = None,
+    timeout: float | None = None,
+) -> str:
     """Apply style as a post-generation filter while preserving content."""
     if _is_gemini_model(CHAT_MODEL):
-        return _gemini_rewrite_reply_with_style(text, style, lang, original_message)
+        return _gemini_rewrite_reply_with_style(text, style, lang, original_message, timeout)
     style_instruction = _style_instruction(style, lang)
     style_specific_en = ""
     style_specific_uk = ""
@@ -701,6 +735,7 @@ def rewrite_reply_with_style(text: str, style: str, lang: str = "uk", original_m
             {"role": "user", "content": user_prompt},
         ],
         max_completion_tokens=500,
+        timeout=_timeout_arg(timeout),
     )
     return response.choices[0].message.content.strip()
 
@@ -718,6 +753,7 @@ def _gemini_detect_pipeline(
     previous_message: str | None = None,
     previous_reply: str | None = None,
     previous_pipeline: str | None = None,
+    timeout: float | None = None,
 ) -> str:
     previous_pipeline_name = (
         "problem_solution"
@@ -769,6 +805,7 @@ Reply with only the pipeline name, no explanations."""
     result = _gemini_chat(
         [{"role": "user", "content": prompt}],
         max_output_tokens=20,
+        timeout=timeout,
     ).strip().lower()
     if result == "process_message":
         result = "problem_solution"
@@ -776,7 +813,7 @@ Reply with only the pipeline name, no explanations."""
     return result if result in valid else "problem_solution"
 
 
-def _gemini_extract_problems_and_solutions(message: str) -> dict:
+def _gemini_extract_problems_and_solutions(message: str, timeout: float | None = None) -> dict:
     prompt = f"""Analyze this message and extract:
 1. The core problems/issues the user is complaining about (1-3 specific problems)
 2. General solution concepts that could address those problems (1-3 solutions)
@@ -796,6 +833,7 @@ Respond in valid JSON with this exact structure:
         [{"role": "user", "content": prompt}],
         max_output_tokens=1500,
         json_mode=True,
+        timeout=timeout,
     )
     try:
         return json.loads(content)
@@ -810,6 +848,7 @@ def _gemini_generate_reply(
     projects: list[dict],
     history: list[dict] = None,
     lang: str = "uk",
+    timeout: float | None = None,
 ) -> str:
     style_instruction = _style_instruction(style, lang)
     unknown_org = "невідома організація" if lang == "uk" else "unknown organization"
@@ -872,10 +911,18 @@ Generate a short, on-topic response in the active style. Skip orgs that don't ma
             {"role": "user", "content": user_prompt},
         ],
         max_output_tokens=400,
+        timeout=timeout,
     )
 
 
-def _gemini_generate_org_reply(query: str, orgs: list[dict], projects: list[dict], style: str, lang: str = "uk") -> str:
+def _gemini_generate_org_reply(
+    query: str,
+    orgs: list[dict],
+    projects: list[dict],
+    style: str,
+    lang: str = "uk",
+    timeout: float | None = None,
+) -> str:
     style_instruction = _style_instruction(style, lang)
     na = "Н/Д" if lang == "uk" else "N/A"
     org_list = "\n".join(
@@ -916,10 +963,11 @@ Use Markdown links: [Name](url). Write concisely and practically."""
             {"role": "user", "content": user_prompt},
         ],
         max_output_tokens=400,
+        timeout=timeout,
     )
 
 
-def _gemini_detect_style_from_message(message: str) -> str | None:
+def _gemini_detect_style_from_message(message: str, timeout: float | None = None) -> str | None:
     prompt = f"""Визнач, який стиль відповіді просить користувач.
 Поверни ТІЛЬКИ одне слово: polite, funny, sarcastic, normal, rude, або unknown.
 
@@ -944,22 +992,30 @@ def _gemini_detect_style_from_message(message: str) -> str | None:
     result = _gemini_chat(
         [{"role": "user", "content": prompt}],
         max_output_tokens=10,
+        timeout=timeout,
     ).strip().lower()
     return result if result in set(STYLE_PROFILES["uk"].keys()) else None
 
 
-def _gemini_enrich_query(query: str) -> str:
+def _gemini_enrich_query(query: str, timeout: float | None = None) -> str:
     prompt = f"""Expand this query with relevant keywords and context for semantic search. Max 800 characters.
 Query: "{query}"
 Return only the enriched text."""
     text = _gemini_chat(
         [{"role": "user", "content": prompt}],
         max_output_tokens=150,
+        timeout=timeout,
     )
     return text[:800]
 
 
-def _gemini_rewrite_reply_with_style(text: str, style: str, lang: str = "uk", original_message: str | None = None) -> str:
+def _gemini_rewrite_reply_with_style(
+    text: str,
+    style: str,
+    lang: str = "uk",
+    original_message: str | None = None,
+    timeout: float | None = None,
+) -> str:
     style_instruction = _style_instruction(style, lang)
     style_specific_en = ""
     style_specific_uk = ""
@@ -1078,4 +1134,5 @@ def _gemini_rewrite_reply_with_style(text: str, style: str, lang: str = "uk", or
             {"role": "user", "content": user_prompt},
         ],
         max_output_tokens=500,
+        timeout=timeout,
     )
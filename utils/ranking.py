@@ -0,0 +1,43 @@
+"""
+Rank fusion helpers.
+
+Purpose:
+- Merge several ranked result lists (one per query vector, or lexical + vector
+  search) into one ranking without comparing their raw scores, which live on
+  different scales.
+
+Reciprocal rank fusion (RRF):
+- Each list contributes `1 / (k + rank)` (rank starting at 1) to every row it
+  contains; rows are ordered by the summed score. `k = 60` is the usual
+  constant and damps the advantage of a single first place.
+- Rows are identified by `key` (e.g. `organization_id`); the first occurrence
+  is kept, with `fused_score` added and the best `similarity` seen (if any).
+"""
+from typing import Iterable
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Iterable[list[dict] | None],
+    key: str,
+    top_n: int | None = None,
+    k: int = RRF_K,
+) -> list[dict]:
+    scores: dict = {}
+    rows: dict = {}
+    for ranked in ranked_lists:
+        for rank, row in enumerate(ranked or [], start=1):
+            item_id = row[key]
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+            best = rows.get(item_id)
+            if best is None:
+                rows[item_id] = dict(row)
+            elif row.get("similarity") is not None and (
+                best.get("similarity") is None or row["similarity"] > best["similarity"]
+            ):
+                best["similarity"] = row["similarity"]
+    ranked_ids = sorted(scores, key=lambda item_id: scores[item_id], reverse=True)
+    if top_n is not None:
+        ranked_ids = ranked_ids[:top_n]
+    return [{**rows[item_id], "fused_score": scores[item_id]} for item_id in ranked_ids]
@@ -0,0 +1,74 @@
+"""
+Embedding vector helpers.
+
+Purpose:
+- One compact representation for embeddings everywhere: a 1-D `numpy.float32`
+  array (6 KB for 1536 dims, versus ~50 KB for a list of boxed Python floats).
+- Convert to/from pgvector's text format (psycopg2, which only sends text
+  parameters) and binary format (psycopg 3 adapters in `db.async_queries`)
+  at the DB boundary.
+- Vectorized cosine similarity for many-to-many comparisons.
+
+Every helper accepts plain sequences too, so callers holding lists (tests,
+JSON payloads) do not need to convert first.
+"""
+import struct
+from typing import Iterable, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+EMBEDDING_DIM = 1536
+
+Embedding = npt.NDArray[np.float32]
+
+
+def as_embedding(values: Sequence[float] | np.ndarray) -> Embedding:
+    """Return `values` as a float32 vector (no copy if it already is one)."""
+    return np.asarray(values, dtype=np.float32)
+
+
+def stack_embeddings(embeddings: Iterable[Sequence[float] | np.ndarray]) -> npt.NDArray[np.float32]:
+    """Stack vectors into an (n, dim) float32 matrix."""
+    return np.vstack([as_embedding(e) for e in embeddings])
+
+
+def mean_embedding(embeddings: Iterable[Sequence[float] | np.ndarray]) -> Embedding:
+    return stack_embeddings(embeddings).mean(axis=0, dtype=np.float32)
+
+
+def normalize_rows(matrix: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    """L2-normalize each row; all-zero rows stay zero (similarity 0 to anything)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def cosine_matrix(left: npt.NDArray[np.float32], right: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    """Pairwise cosine similarity: (n, dim) x (m, dim) -> (n, m)."""
+    return normalize_rows(left) @ normalize_rows(right).T
+
+
+def to_pgvector(embedding: Sequence[float] | np.ndarray) -> str:
+    """Format a vector as pgvector text input (`[0.1,0.2,...]`)."""
+    return "[" + ",".join(np.char.mod("%.9g", as_embedding(embedding))) + "]"
+
+
+def parse_pgvector(value: str | None) -> Embedding | None:
+    """Parse pgvector's text output (`[0.1,0.2,...]`)."""
+    if not value:
+        return None
+    body = value.strip("[]")
+    if not body:
+        return None
+    return np.array(body.split(","), dtype=np.float32)
+
+
+def to_pgvector_binary(embedding: Sequence[float] | np.ndarray) -> bytes:
+    """Encode a vector in pgvector's binary format: int16 dim, int16 unused, big-endian float4s."""
+    vector = as_embedding(embedding)
+    return struct.pack(">HH", vector.shape[0], 0) + vector.astype(">f4").tobytes()
+
+
+def parse_pgvector_binary(data: bytes | memoryview) -> Embedding:
+    dim, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)